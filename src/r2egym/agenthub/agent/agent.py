@@ -1,6 +1,7 @@
 import os
 import re
-import copy
+import asyncio
+import contextlib
 import yaml
 import json
 import time
@@ -13,7 +14,11 @@ import litellm
 from openai import OpenAI
 
 from r2egym.agenthub.action import Action
+from r2egym.agenthub.agent.history import MessageLog, build_condenser
 from r2egym.agenthub.utils.log import get_logger
+from r2egym.agenthub.utils.llm_load import get_llm_load
+from r2egym.agenthub.utils.llm_gateway import PRIORITY_HEADER, TOKENS_HEADER
+from r2egym.agenthub.utils.tracing import get_tracer, trace_span
 from r2egym.agenthub.environment.env import RepoEnv
 from r2egym.agenthub.runtime.docker import DockerRuntime
 from r2egym.agenthub.trajectory import TrajectoryStep, Trajectory
@@ -74,6 +79,15 @@ class Agent:
             if ("openai/" in self.llm_name) or ("hosted_vllm" in self.llm_name)
             else None
         )
+        # shared LLM gateway (r2egym.agenthub.utils.llm_gateway) handling rate limits for all episodes
+        self.llm_gateway_url = os.environ.get("LLM_GATEWAY_URL")
+        # (role, content, token count) per history message, see `_count_tokens`
+        self.message_token_counts = []
+        self.prompt_tokens = 0  # token count of the last (possibly condensed) prompt
+        # optional context condensation for long episodes, e.g. {"type": "observations", "max_tokens": 32000}
+        self.condenser = build_condenser(self.other_args.get("condenser"))
+        # execute all tool calls of a response (read-only ones concurrently) instead of the first
+        self.parallel_tool_calls = self.other_args.get("parallel_tool_calls", False)
         self.system_prompt_template = args.system_prompt
         self.instance_prompt_template = args.instance_prompt
         self.command_files = args.command_files
@@ -139,23 +153,45 @@ class Agent:
     def reset(self):
         """Reset the agent's trajectory."""
         self.trajectory_steps = []
-        self.history = []
+        self.history = MessageLog()
+        self.message_token_counts = []
+        self.prompt_tokens = 0
+        if self.condenser is not None:
+            self.condenser.reset()
+
+    def _count_message_tokens(self, message: Dict[str, Any]) -> int:
+        return litellm.token_counter(model=self.llm_name, messages=[message])
 
     def _count_tokens(self, messages: List[Dict[str, str]]) -> int:
         """
         Counts the tokens for a list of messages using the litellm library.
         Adjust as needed depending on the model and library.
+
+        Each message is tokenized once: the count of the message at position i is cached with
+        its role and content object (the history is append-only, and a changed message, e.g.
+        the last one after the steps-remaining note, gets a new content string). The total is
+        the sum of the per-message counts, a slight upper bound of counting the whole list.
         """
-        token_count = litellm.token_counter(model=self.llm_name, messages=messages)
+        counts = self.message_token_counts
+        token_count = 0
+        for i, message in enumerate(messages):
+            content = message.get("content")
+            if i < len(counts) and counts[i][0] == message["role"] and counts[i][1] is content:
+                token_count += counts[i][2]
+                continue
+            message_tokens = self._count_message_tokens(message)
+            del counts[i:]
+            counts.append((message["role"], content, message_tokens))
+            token_count += message_tokens
         self.logger.info(f"Total tokens in conversation: {token_count}")
         return token_count
 
-    def model_query(
-        self, messages: List[Dict[str, str]], temperature: float = 0,) -> Dict[str, Any]:
-        """Query the LLM with the messages and measure execution time."""
-        response = None
-        retries = 0
+    def _prepare_query(
+        self, messages: List[Dict[str, str]]
+    ) -> Tuple[Optional[List[Dict[str, Any]]], List[Dict[str, str]], int]:
+        """Select the tools, add prompt caching markers and check the context size before querying the LLM."""
         tools = None
+        cache_breakpoints = 0
 
         if self.use_fn_calling:
             if self.scaffold == "r2egym":
@@ -168,55 +204,132 @@ class Agent:
                 # litellm might need dev install with vertex: https://github.com/BerriAI/litellm/issues/6898
                 # add prompt caching for anthropic
                 tools[-1]["function"]["cache_control"] = {"type": "ephemeral"}
-                breakpoints_remaining = 3  # remaining 1 for system/tool (above)
-                for message in reversed(messages):
-                    if message["role"] in ("user", "tool"):
-                        if breakpoints_remaining > 0:
-                            message["cache_control"] = {"type": "ephemeral"}
-                            breakpoints_remaining -= 1
-                        else:
-                            break
+                cache_breakpoints = 3  # remaining 1 for system/tool (above)
 
-        # Start timer
-        start_time = time.time()
         # check if using locally hosted models
         using_local = "openai/" in self.llm_name or "hosted" in self.llm_name
         if using_local:
             litellm.api_key = None
 
-        messages_ = copy.deepcopy(messages)
-        total_tokens = self._count_tokens(messages_)
+        total_tokens = self._count_tokens(messages)
+        if self.condenser is not None:
+            token_counts = [count for _, _, count in self.message_token_counts[: len(messages)]]
+            messages, total_tokens = self.condenser.condense(
+                messages, token_counts, self._count_message_tokens
+            )
+            self.logger.info(f"Tokens in condensed conversation: {total_tokens}")
+        self.prompt_tokens = total_tokens
+        # annotated view: the message bodies are shared, not copied
+        messages_ = MessageLog.cache_control_view(messages, cache_breakpoints)
         if total_tokens > MAX_CONTEXT_TOKENS:
             logger.warning(f"Total tokens: {total_tokens} > {MAX_CONTEXT_TOKENS}")
             raise ValueError(f"Total tokens: {total_tokens} > {MAX_CONTEXT_TOKENS}")
-        
+        return tools, messages_, total_tokens
+
+    def _completion_kwargs(self, tools, temperature: float) -> Dict[str, Any]:
+        kwargs = {
+            "tool_choice": "none",
+            "function_call": None,
+        }
+        if tools:
+            kwargs = {}
+        if "o3" not in self.llm_name and "o4" not in self.llm_name:
+            kwargs["temperature"] = temperature
+        return kwargs
+
+    def _completion_route(self, total_tokens: int, priority: float) -> Dict[str, Any]:
+        """Model / endpoint kwargs: the provider directly, or the shared LLM gateway if configured."""
+        if not self.llm_gateway_url:
+            return {"model": self.llm_name, "api_base": self.llm_base_url}
+        return {
+            # the gateway speaks the openai protocol; it receives the full llm_name as model
+            "model": f"openai/{self.llm_name}",
+            "api_base": self.llm_gateway_url,
+            "api_key": "gateway",
+            "extra_headers": {
+                PRIORITY_HEADER: str(priority),
+                TOKENS_HEADER: str(total_tokens),
+            },
+        }
+
+    def model_query(
+        self, messages: List[Dict[str, str]], temperature: float = 0, priority: float = 0,
+    ) -> Dict[str, Any]:
+        """Query the LLM with the messages and measure execution time."""
+        response = None
+        retries = 0
+
+        # Start timer
+        start_time = time.time()
+        tools, messages_, total_tokens = self._prepare_query(messages)
+        # shared (cross-process) LLM load, read by the episode scheduler
+        llm_load = get_llm_load()
+        route = self._completion_route(total_tokens, priority)
+
         # query the model with retries
         while retries < self.max_retries:
             try:
-                kwargs = {
-                    "tool_choice": "none",
-                    "function_call": None,
-                }
-                if tools:
-                    kwargs = {}
-                if "o3" not in self.llm_name and "o4" not in self.llm_name:
-                    kwargs["temperature"] = temperature
-                response = litellm.completion(
-                    model=self.llm_name,
-                    tools=tools,
-                    messages=messages_,
-                    timeout=self.llm_timeout,
-                    api_base=self.llm_base_url,
-                    # max_tokens=3000,
-                    **kwargs,
-                )
+                with llm_load.request(total_tokens) if llm_load else contextlib.nullcontext():
+                    response = litellm.completion(
+                        tools=tools,
+                        messages=messages_,
+                        timeout=self.llm_timeout,
+                        **route,
+                        # max_tokens=3000,
+                        **self._completion_kwargs(tools, temperature),
+                    )
                 self.logger.warning(f"Querying LLM complete")
                 break
             except Exception as e:
                 self.logger.error(f"LLM query failed @ {retries}: {e}")
                 retries += 1
                 if "RateLimitError" in str(e):
-                    time.sleep(60)
+                    if llm_load:
+                        llm_load.rate_limited()
+                    if not self.llm_gateway_url:  # the gateway already backed off
+                        time.sleep(60)
+                if retries >= self.max_retries:
+                    raise e
+
+        # End timer, calculate total execution time, and include in response
+        exec_time = time.time() - start_time
+        return response, exec_time
+
+    async def amodel_query(
+        self, messages: List[Dict[str, str]], temperature: float = 0, priority: float = 0,
+    ) -> Dict[str, Any]:
+        """Async version of `model_query` using `litellm.acompletion` (does not block the event loop)."""
+        response = None
+        retries = 0
+
+        # Start timer
+        start_time = time.time()
+        tools, messages_, total_tokens = self._prepare_query(messages)
+        # shared (cross-process) LLM load, read by the episode scheduler
+        llm_load = get_llm_load()
+        route = self._completion_route(total_tokens, priority)
+
+        # query the model with retries
+        while retries < self.max_retries:
+            try:
+                with llm_load.request(total_tokens) if llm_load else contextlib.nullcontext():
+                    response = await litellm.acompletion(
+                        tools=tools,
+                        messages=messages_,
+                        timeout=self.llm_timeout,
+                        **route,
+                        **self._completion_kwargs(tools, temperature),
+                    )
+                self.logger.warning(f"Querying LLM complete")
+                break
+            except Exception as e:
+                self.logger.error(f"LLM query failed @ {retries}: {e}")
+                retries += 1
+                if "RateLimitError" in str(e):
+                    if llm_load:
+                        llm_load.rate_limited()
+                    if not self.llm_gateway_url:  # the gateway already backed off
+                        await asyncio.sleep(60)
                 if retries >= self.max_retries:
                     raise e
 
@@ -301,6 +414,22 @@ class Agent:
 
         return thought, action
 
+    def parse_tool_calls(self, response) -> List[Action]:
+        """All tool calls of the response as actions, up to (and including) the first finish / submit."""
+        actions = []
+        for tool_call in response.choices[0].message.tool_calls or []:
+            try:
+                action = Action(
+                    function_name=tool_call.function.name,
+                    parameters=json.loads(tool_call.function.arguments),
+                )
+            except Exception:
+                action = Action(function_name="", parameters={})
+            actions.append(action)
+            if action.function_name in ("finish", "submit"):
+                break
+        return actions
+
     def run(
         self,
         env: "RepoEnv",  # env: RepoEnv
@@ -320,6 +449,143 @@ class Agent:
         metadata: Optional[Dict[str, Any]] = {},
         scaffold: str = "r2egym",
     ):
+        """Run the agent on the environment and return the trajectory."""
+        with trace_span("agent.run"):
+            trajectory = self._drive_run_loop(
+                self._run_loop(
+                    env,
+                    use_fn_calling=use_fn_calling,
+                    max_steps=max_steps,
+                    max_steps_absolute=max_steps_absolute,
+                    max_token_limit=max_token_limit,
+                    max_exec_time=max_exec_time,
+                    max_total_time=max_total_time,
+                    max_llm_time=max_llm_time,
+                    temperature=temperature,
+                    metadata=metadata,
+                    scaffold=scaffold,
+                ),
+                env,
+            )
+        return self._attach_spans(trajectory)
+
+    async def arun(
+        self,
+        env: "RepoEnv",  # env: RepoEnv
+        use_fn_calling: bool = True,
+        # step limits TODO: maybe add these limits in the agent args
+        max_steps: int = 10,
+        max_steps_absolute: int = 50,
+        # token limits
+        max_token_limit: int = 65536,  # 64k tokens
+        # time limits
+        max_exec_time: int = 90,  # 5 mins per env execution
+        max_total_time: int = 50000,  # 20 minutes overall agent run limit
+        max_llm_time: int = 7200,  # 2 mins per LLM timeout (note this is per query exlcuding retries | not enforcing hard limit since llm might hit rate limits etc)
+        # temperature
+        temperature=0,
+        # additional metadata e.g. for hints / additional inputs etc
+        metadata: Optional[Dict[str, Any]] = {},
+        scaffold: str = "r2egym",
+    ):
+        """
+        Async version of `run`: awaits `litellm.acompletion` and (for an `AsyncRepoEnv`) the async env API,
+        so that a single event loop can drive many episodes concurrently.
+        """
+        with trace_span("agent.run"):
+            trajectory = await self._adrive_run_loop(
+                self._run_loop(
+                    env,
+                    use_fn_calling=use_fn_calling,
+                    max_steps=max_steps,
+                    max_steps_absolute=max_steps_absolute,
+                    max_token_limit=max_token_limit,
+                    max_exec_time=max_exec_time,
+                    max_total_time=max_total_time,
+                    max_llm_time=max_llm_time,
+                    temperature=temperature,
+                    metadata=metadata,
+                    scaffold=scaffold,
+                ),
+                env,
+            )
+        return self._attach_spans(trajectory)
+
+    @staticmethod
+    def _attach_spans(trajectory: Trajectory) -> Trajectory:
+        """Store the spans recorded so far by the current episode tracer on the trajectory."""
+        tracer = get_tracer()
+        if tracer is not None:
+            trajectory.spans = tracer.to_dicts()
+        return trajectory
+
+    def _drive_run_loop(self, loop_gen, env):
+        """Drive the `_run_loop` generator synchronously, serving its LLM and env requests."""
+        result, error = None, None
+        while True:
+            try:
+                request = loop_gen.throw(error) if error is not None else loop_gen.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result, error = None, None
+            try:
+                if request[0] == "llm":
+                    with trace_span("agent.llm_query"):
+                        result = self.model_query(*request[1:])
+                else:
+                    _, method, args, kwargs = request
+                    result = getattr(env, method)(*args, **kwargs)
+            except Exception as e:
+                error = e
+
+    async def _adrive_run_loop(self, loop_gen, env):
+        """Drive the `_run_loop` generator on the event loop; blocking env calls run in a worker thread."""
+        result, error = None, None
+        while True:
+            try:
+                request = loop_gen.throw(error) if error is not None else loop_gen.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result, error = None, None
+            try:
+                if request[0] == "llm":
+                    with trace_span("agent.llm_query"):
+                        result = await self.amodel_query(*request[1:])
+                else:
+                    _, method, args, kwargs = request
+                    method = getattr(env, method)
+                    if asyncio.iscoroutinefunction(method):
+                        result = await method(*args, **kwargs)
+                    else:
+                        result = await asyncio.to_thread(method, *args, **kwargs)
+            except Exception as e:
+                error = e
+
+    def _run_loop(
+        self,
+        env: "RepoEnv",  # env: RepoEnv
+        use_fn_calling: bool = True,
+        # step limits TODO: maybe add these limits in the agent args
+        max_steps: int = 10,
+        max_steps_absolute: int = 50,
+        # token limits
+        max_token_limit: int = 65536,  # 64k tokens
+        # time limits
+        max_exec_time: int = 90,  # 5 mins per env execution
+        max_total_time: int = 50000,  # 20 minutes overall agent run limit
+        max_llm_time: int = 7200,  # 2 mins per LLM timeout (note this is per query exlcuding retries | not enforcing hard limit since llm might hit rate limits etc)
+        # temperature
+        temperature=0,
+        # additional metadata e.g. for hints / additional inputs etc
+        metadata: Optional[Dict[str, Any]] = {},
+        scaffold: str = "r2egym",
+    ):
+        """
+        Agent loop shared by `run` and `arun`. It is a generator that yields requests instead of
+        performing blocking calls itself: ("llm", messages, temperature) for LLM queries and
+        ("env", method, args, kwargs) for environment calls. The driver sends back the result
+        (or throws the raised exception) and the final trajectory is returned via StopIteration.
+        """
         assert scaffold in ["r2egym", "openhands", "sweagent"], "Scaffold must be either r2egym or openhands or sweagent"
         self.scaffold = scaffold
         # get the start time
@@ -341,8 +607,8 @@ class Agent:
         self.logger.info(f"Running agent {self.name} in environment {env}.")
 
         # Reset the environment and the agent
-        env.reset()
-        env.add_commands(self.command_files)
+        yield ("env", "reset", (), {})
+        yield ("env", "add_commands", (self.command_files,), {})
         self.reset()
 
         # Prepare problem_statement and structure from the environment
@@ -374,10 +640,12 @@ class Agent:
         self.logger.info(f"User Prompt with demo: {user_prompt}")
 
         # initialize the history
-        self.history = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
+        self.history = MessageLog(
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ]
+        )
 
         # initialize the parameters
         obs = None
@@ -396,21 +664,21 @@ class Agent:
                 stepcount_message = f"Steps Remaining: {steps_remaining}"
             else:
                 stepcount_message = "You have reached the maximum number of steps. Please submit your answer NOW."
-            self.history[-1][
-                "content"
-            ] += f"\n{stepcount_message}"  # postpend stepcount message
+            self.history.amend_last(f"\n{stepcount_message}")  # postpend stepcount message
             self.logger.info(stepcount_message)
 
             # Query the LLM
-            messages = copy.deepcopy(self.history)
+            messages = self.history.snapshot()
             try:
-                response, llm_exec_time = self.model_query(messages, temperature)
+                # episodes close to their step limit are served first by the LLM gateway
+                response, llm_exec_time = yield ("llm", messages, temperature, step_count / max(max_steps, 1))
             except Exception as e:
                 self.logger.error(f"Error querying LLM: {e}")
                 self.logger.error(f"Error querying LLM: {traceback.format_exc()}")
                 done = True
                 exit_reason = "llm_query_error"
                 break
+            context_tokens = self.prompt_tokens
 
             # Log total tokens in the response
             if hasattr(response, "usage"):
@@ -428,7 +696,7 @@ class Agent:
                 completion_tokens = -1
                 prompt_tokens = -1
                 total_tokens = -1
-                total_tokens =  self._count_tokens(messages)
+                total_tokens = context_tokens
                 self.logger.warning(
                     "No token usage information available in the response."
                 )
@@ -442,17 +710,39 @@ class Agent:
                 thought, action = self.custom_parser(response)
             else:
                 thought, action = self.parse_response(assistant_message)
+            actions = [action]
+            if self.use_fn_calling and self.parallel_tool_calls:
+                actions = self.parse_tool_calls(response) or actions
 
-            action_str = action.to_xml_string()
+            action_str = "\n".join(step_action.to_xml_string() for step_action in actions)
             self.logger.info(f"THOUGHT:\n{thought}\n")
-            self.logger.info(f"ACTION:\n{action.to_bashcmd()}\n")
+            for step_action in actions:
+                self.logger.info(f"ACTION:\n{step_action.to_bashcmd()}\n")
 
-            # Send the action to the environment
+            # Send the action(s) to the environment
             try:
-                obs, reward, done, info = env.step(action, timeout=max_exec_time)
+                if len(actions) == 1:
+                    obs, reward, done, info = yield (
+                        "env", "step", (actions[0],), {"timeout": max_exec_time}
+                    )
+                    observations = [str(obs)]
+                else:
+                    # read-only calls run concurrently, the others in order
+                    step_results = yield (
+                        "env", "step_many", (actions,), {"timeout": max_exec_time}
+                    )
+                    observations = [str(step_obs) for step_obs, _, _, _ in step_results]
+                    obs = "\n\n".join(observations)
+                    reward = step_results[-1][1]
+                    done = any(step_done for _, _, step_done, _ in step_results)
+                    info = {
+                        "total_time": step_results[0][3]["batch_time"],
+                        "num_tool_calls": len(actions),
+                    }
                 # env.runtime.commit_after_step(step_count)
             except Exception as e:
                 obs = str(e)
+                observations = [obs] * len(actions)
                 self.logger.error(f"Error during environment step: {obs}")
 
             env_exec_time = info["total_time"]
@@ -464,23 +754,23 @@ class Agent:
                 assistant_response = response.choices[0].message.dict()
                 if assistant_response.get("tool_calls", None):
                     assistant_response["tool_calls"] = assistant_response["tool_calls"][
-                        :1
-                    ]  # only keep the first tool call
+                        : len(actions)
+                    ]  # only keep the executed tool call(s)
                 self.history.append(assistant_response)
-                # add tool response / user response to history
+                # add tool response(s) / user response to history
                 try:
-                    function_name = (
-                        response.choices[0].message.tool_calls[0].function.name
-                    )
-                    function_id = response.choices[0].message.tool_calls[0].id
-                    self.history.append(
-                        {
-                            "role": "tool",
-                            "content": str(obs),
-                            "name": function_name,
-                            "tool_call_id": function_id,
-                        }
-                    )
+                    tool_calls = response.choices[0].message.tool_calls[: len(actions)]
+                    if not tool_calls:
+                        raise ValueError("no tool calls in the response")
+                    for tool_call, tool_obs in zip(tool_calls, observations):
+                        self.history.append(
+                            {
+                                "role": "tool",
+                                "content": tool_obs,
+                                "name": tool_call.function.name,
+                                "tool_call_id": tool_call.id,
+                            }
+                        )
                     self.logger.warning("logging fn response as a tool call")
                     self.logger.warning(
                         f"number of fn calls: {len(response.choices[0].message.tool_calls)}"
@@ -543,7 +833,7 @@ class Agent:
                 # key parts
                 step_idx=step_count - 1,
                 thought=thought,
-                action=action.to_xml_string(),
+                action=action_str,
                 observation=str(obs),
                 done=done,
                 info=info,  # also store the info to be safe
@@ -551,6 +841,7 @@ class Agent:
                 token_usage_prompt=prompt_tokens,
                 token_usage_completion=completion_tokens,
                 token_usage_total=total_tokens,
+                token_count_context=context_tokens,
                 # metadata (current step stats)
                 llm_exec_time=llm_exec_time,
                 env_exec_time=env_exec_time,
@@ -566,7 +857,9 @@ class Agent:
         # env.runtime.soft_git_reset()
 
         # compute output patch cummulatively from the start using git diff from the initial commit
-        output_patch = env.runtime.get_patch()
+        output_patch = yield ("env", "get_patch", (), {})
+        speculation_stats = yield ("env", "get_speculation_stats", (), {})
+        self._count_tokens(self.history)  # also count the messages of the last step
 
         # Create a Trajectory object
         self.trajectory = Trajectory(
@@ -585,6 +878,8 @@ class Agent:
             max_total_time=max_total_time,
             exit_reason=exit_reason,  # reason for exiting. must be one of the [agent, max_step_limit, agent_max_step_limit, abs_step_limit, token_limit, traj_time_limit, llm_query_error]
             output_patch=output_patch,
+            message_token_counts=[count for _, _, count in self.message_token_counts],
+            speculation_stats=speculation_stats,
         )
 
         self.logger.info(f"Agent completed in {time.time() - start_time} seconds.")
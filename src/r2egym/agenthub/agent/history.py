@@ -0,0 +1,204 @@
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+Message = Dict[str, Any]
+
+
+##############################################################################
+# append-only message log
+##############################################################################
+class MessageLog(Sequence):
+    """
+    Append-only conversation history of the agent.
+
+    Messages are never modified in place once they are in the log (`amend_last` replaces the
+    last message with a new dict), so the message dicts and their (large) content strings can
+    be shared by reference with the LLM query, the token count cache and trajectories instead
+    of deep-copying the whole history on every step. Prompt-caching annotations are applied on
+    a view (`cache_control_view`) that only copies the few annotated message dicts.
+    """
+
+    def __init__(self, messages: Iterable[Message] = ()):
+        self._messages: List[Message] = [dict(message) for message in messages]
+
+    def append(self, message: Message):
+        # shallow copy: later changes to the caller's dict do not leak into the log
+        self._messages.append(dict(message))
+
+    def amend_last(self, suffix: str):
+        """Append `suffix` to the content of the last message (replacing the message dict)."""
+        last = self._messages[-1]
+        self._messages[-1] = {**last, "content": last["content"] + suffix}
+
+    def __getitem__(self, idx):
+        return self._messages[idx]
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def snapshot(self) -> List[Message]:
+        """The current messages as a list (shares the message dicts, O(#messages) pointers)."""
+        return list(self._messages)
+
+    @staticmethod
+    def cache_control_view(messages: Sequence[Message], num_breakpoints: int) -> List[Message]:
+        """
+        `messages` with an ephemeral `cache_control` marker on the last `num_breakpoints`
+        user / tool messages. Only the annotated messages are copied (shallowly); all other
+        entries are the original dicts, which must be treated as read-only.
+        """
+        view = list(messages)
+        for idx in range(len(view) - 1, -1, -1):
+            if num_breakpoints <= 0:
+                break
+            if view[idx]["role"] in ("user", "tool"):
+                view[idx] = {**view[idx], "cache_control": {"type": "ephemeral"}}
+                num_breakpoints -= 1
+        return view
+
+
+##############################################################################
+# history condensers
+##############################################################################
+class HistoryCondenser:
+    """
+    Decides what the LLM sees of a long history, bounding the prompt to about `max_tokens`.
+
+    `condense` gets the full history with its (cached) per-message token counts and returns
+    the messages to send with their token count; the MessageLog itself is never changed, so the
+    trajectory keeps the full history. Once the prompt exceeds `max_tokens`, old observations
+    (oldest first, never the system / task messages or the last `keep_last_steps` steps) are
+    replaced by `condense_message` until the prompt is below `target_ratio * max_tokens`.
+    Replacements are remembered for the episode, so the condensed prefix only changes in
+    batches and prompt caching keeps working in between.
+    """
+
+    def __init__(self, max_tokens: int, keep_last_steps: int = 4, target_ratio: float = 0.75):
+        self.max_tokens = max_tokens
+        self.keep_last_steps = keep_last_steps
+        self.target_ratio = target_ratio
+        self.reset()
+
+    def reset(self):
+        self._condensed: Dict[int, Tuple[Message, int]] = {}  # idx -> (replacement, tokens)
+
+    def condense_message(self, message: Message) -> Optional[Message]:
+        """Condensed replacement of an old observation (None: keep it as is)."""
+        raise NotImplementedError
+
+    def _candidates(self, messages: Sequence[Message]) -> List[int]:
+        """Indices of condensable observations, oldest first."""
+        end = len(messages) - 1  # the last message is always kept
+        if self.keep_last_steps > 0:
+            assistant_idxs = [idx for idx, message in enumerate(messages) if message["role"] == "assistant"]
+            if len(assistant_idxs) >= self.keep_last_steps:
+                end = min(end, assistant_idxs[-self.keep_last_steps])
+            else:
+                end = 0
+        # skip the system prompt and the task (first user message)
+        return [idx for idx in range(2, end) if messages[idx]["role"] in ("user", "tool")]
+
+    def condense(
+        self,
+        messages: Sequence[Message],
+        token_counts: Sequence[int],
+        count_tokens: Callable[[Message], int],
+    ) -> Tuple[List[Message], int]:
+        view = list(messages)
+        total_tokens = sum(token_counts)
+        for idx, (replacement, num_tokens) in self._condensed.items():
+            view[idx] = replacement
+            total_tokens += num_tokens - token_counts[idx]
+        if total_tokens <= self.max_tokens:
+            return view, total_tokens
+
+        target_tokens = int(self.max_tokens * self.target_ratio)
+        for idx in self._candidates(messages):
+            if total_tokens <= target_tokens:
+                break
+            if idx in self._condensed:
+                continue
+            replacement = self.condense_message(messages[idx])
+            if replacement is None:
+                continue
+            num_tokens = count_tokens(replacement)
+            self._condensed[idx] = (replacement, num_tokens)
+            view[idx] = replacement
+            total_tokens += num_tokens - token_counts[idx]
+        return view, total_tokens
+
+
+class ObservationElisionCondenser(HistoryCondenser):
+    """Elide the content of old observations entirely."""
+
+    def condense_message(self, message: Message) -> Optional[Message]:
+        content = message.get("content")
+        if not isinstance(content, str) or len(content) < 200:
+            return None
+        return {
+            **message,
+            "content": f"<Observation elided for saving context: {len(content)} characters omitted>",
+        }
+
+
+FILE_VIEW_RE = re.compile(
+    r"(?:Here's the result of running `cat -n` on (?:the file: )?|Here is a condensed view for file: )"
+    r"(?P<path>[^\n;:]+)"
+)
+NUMBERED_LINE_RE = re.compile(r"^\s*(\d+)[ \t](.*)$")  # `view` output uses a space, snippets a tab
+OUTLINE_RE = re.compile(r"^\s*(?:async\s+def|def|class)\s")
+
+
+class FileViewSummaryCondenser(HistoryCondenser):
+    """
+    Replace old file views (`file_editor view` / `cat -n` outputs) by a short summary: the
+    path, the viewed line range and an outline of the class / function definitions in it.
+    Other observations are kept.
+    """
+
+    def __init__(self, *args, max_outline_lines: int = 20, **kwargs):
+        self.max_outline_lines = max_outline_lines
+        super().__init__(*args, **kwargs)
+
+    def condense_message(self, message: Message) -> Optional[Message]:
+        content = message.get("content")
+        if not isinstance(content, str):
+            return None
+        match = FILE_VIEW_RE.search(content)
+        if match is None:
+            return None
+        numbered = [m for m in map(NUMBERED_LINE_RE.match, content.splitlines()) if m]
+        if not numbered:
+            return None
+        outline = [f"{m.group(1):>6}\t{m.group(2)}" for m in numbered if OUTLINE_RE.match(m.group(2))]
+        if len(outline) > self.max_outline_lines:
+            outline = outline[: self.max_outline_lines] + ["   ..."]
+        summary = (
+            f"<File view condensed for saving context: {match.group('path').strip()}, "
+            f"lines {numbered[0].group(1)}-{numbered[-1].group(1)}. "
+            f"View the file again if you need its content.>"
+        )
+        if outline:
+            summary += "\nOutline:\n" + "\n".join(outline)
+        return {**message, "content": summary}
+
+
+CONDENSERS = {
+    "observations": ObservationElisionCondenser,
+    "file_views": FileViewSummaryCondenser,
+}
+
+
+def build_condenser(config: Optional[Dict[str, Any]]) -> Optional[HistoryCondenser]:
+    """
+    Condenser from a config such as {"type": "observations", "max_tokens": 32000,
+    "keep_last_steps": 4} (None / empty: no condensation). With max_tokens 0 only the last
+    `keep_last_steps` steps keep their observations.
+    """
+    if not config:
+        return None
+    config = dict(config)
+    return CONDENSERS[config.pop("type", "observations")](**config)
@@ -0,0 +1,61 @@
+from typing import Dict, List, Tuple, Any
+
+from r2egym.agenthub.action import Action
+from r2egym.agenthub.observation import Observation
+from r2egym.agenthub.environment.env import EnvArgs, RepoEnv
+from r2egym.agenthub.runtime.async_docker import run_blocking
+
+
+class AsyncRepoEnv:
+    """
+    asyncio API over RepoEnv: reset / add_commands / step / step_many / compute_reward / get_patch / close
+    are coroutines whose docker / kubernetes calls run on the shared bounded executor
+    (see `runtime.async_docker`), so a single event loop can drive hundreds of episodes.
+    All other attributes (args, runtime, commands, ...) are read from the wrapped env.
+
+    Usage:
+        env = await AsyncRepoEnv.create(EnvArgs(ds=ds), backend="docker")
+        trajectory = await agent.arun(env, max_steps=40)
+        await env.close()
+    """
+
+    def __init__(self, env: RepoEnv, executor=None):
+        self.env = env
+        self.executor = executor
+
+    @classmethod
+    async def create(cls, args: EnvArgs, executor=None, **kwargs) -> "AsyncRepoEnv":
+        """Create a RepoEnv (container start + setup) without blocking the event loop."""
+        env = await run_blocking(RepoEnv, args, executor=executor, **kwargs)
+        return cls(env, executor=executor)
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+    async def _call(self, fn, *args, **kwargs):
+        return await run_blocking(fn, *args, executor=self.executor, **kwargs)
+
+    async def reset(self) -> Dict[str, Any]:
+        return await self._call(self.env.reset)
+
+    async def add_commands(self, cmd_files: list[str]):
+        return await self._call(self.env.add_commands, cmd_files)
+
+    async def step(
+        self, action: Action, timeout: int = None,
+    ) -> Tuple[Observation, int, bool, Dict[str, Any]]:
+        return await self._call(self.env.step, action, timeout=timeout)
+
+    async def step_many(
+        self, actions: List[Action], timeout: int = None,
+    ) -> List[Tuple[Observation, int, bool, Dict[str, Any]]]:
+        return await self._call(self.env.step_many, actions, timeout=timeout)
+
+    async def compute_reward(self, timeout: int = None) -> float:
+        return await self._call(self.env.compute_reward, timeout=timeout)
+
+    async def get_patch(self) -> str:
+        return await self._call(self.env.get_patch)
+
+    async def close(self):
+        return await self._call(self.env.close)
@@ -1,20 +1,43 @@
 # repo_env.py
 import os
+import copy
+import shlex
 import time
+import contextvars
+import concurrent.futures
 from dataclasses import dataclass, field
-from typing import Dict, Tuple, Any, Optional
+from typing import Dict, List, Tuple, Any, Optional
 
 import gym
 import logging
 
 from r2egym.agenthub.action import Action
 from r2egym.agenthub.utils.log import get_logger
+from r2egym.agenthub.utils.tracing import trace_span, traced
 from r2egym.agenthub.observation import Observation
 from r2egym.agenthub.runtime.docker import DockerRuntime
+from r2egym.agenthub.runtime.pool import ContainerPool
+from r2egym.agenthub.runtime.reward_cache import RewardCache
+from r2egym.agenthub.environment.speculation import SpeculativePrefetcher
 from r2egym.agenthub.agent.commands import ParseCommandBash
 
 cmd_parser = ParseCommandBash()
 
+# resident tool server (see tools/daemon): Python tools are moved to TOOL_DAEMON_TOOLS_DIR and
+# their CLI names in /usr/local/bin become the client shim
+TOOL_DAEMON_SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tools", "daemon")
+TOOL_DAEMON_TOOLS_DIR = "/usr/local/lib/r2egym_tools"
+TOOL_DAEMON_PATH = "/usr/local/bin/r2egym_tool_daemon"
+
+# tool calls that do not change the container state (safe to run concurrently):
+# function name -> `command` parameter values (None: any). Editor views neither read nor
+# write the editor's edit history (/var/tmp/editor_state.json), which is saved atomically.
+READ_ONLY_ACTIONS = {
+    "file_editor": {"view"},
+    "str_replace_editor": {"view"},
+    "search": None,
+}
+
 
 @dataclass(frozen=True)
 class EnvArgs:
@@ -32,7 +55,16 @@ class RepoEnv(gym.Env):
                  backend: str = "docker",
                  verbose: bool = True,
                  step_timeout: int = 90,
-                 reward_timeout: int = 300):
+                 reward_timeout: int = 300,
+                 pool: Optional[ContainerPool] = None,
+                 use_exec_session: bool = False,
+                 tool_files: Optional[list[str]] = None,
+                 pod_name: Optional[str] = None,
+                 reward_cache: Optional[RewardCache] = None,
+                 max_output_len: Optional[int] = None,
+                 speculate: bool = False,
+                 tool_daemon: bool = False,
+                 search_index: bool = False):
         # Get the logger
         if logger is None:
             self.logger = get_logger("RepoEnv")  # Pass the module name for clarity
@@ -44,90 +76,256 @@ class RepoEnv(gym.Env):
             #logging.getLogger().setLevel(logging.CRITICAL)  # Disable root logger
             #logging.disable(logging.CRITICAL)  # Disable all logging
 
-        self.runtime = DockerRuntime(
-            ds=args.ds, command=["/bin/bash", "-l"], logger=self.logger, backend=backend
-        )
-
         self.args = args
+        self.backend = backend
+        self.pool = pool
+        self.use_exec_session = use_exec_session
+        # command files to bake into a cached derived image (`<image>-r2egym-tools:<hash>`)
+        self.tool_files = tool_files
+        # pre-provisioned pod for the first runtime (kubernetes backend, see PodProvisioner)
+        self.pod_name = pod_name
+        self.reward_cache = reward_cache
+        # stream command output, keeping only its head + tail (None: buffer the whole output)
+        self.max_output_len = max_output_len
+        # serve the Python tools from a resident in-container daemon (no interpreter start per call)
+        self.tool_daemon = tool_daemon
+        # build a trigram index for the `search` tool in the background at setup (see tools/search.py)
+        self.search_index = search_index
+        self.cmd_parser = ParseCommandBash()
+        # snapshot image that resets start from instead of setting up a new container (see set_fork_point)
+        self.fork_point = None
+        self.runtime = self._create_runtime()
+
         self.done = False
         self.observation = None
         self.state = None
-        self.cmd_parser = ParseCommandBash()
-        self.backend = backend
         self.step_timeout = step_timeout
         self.reward_timeout = reward_timeout
+        # precompute likely next observations (file views, git diff) while the agent queries the LLM
+        self.speculator = (
+            SpeculativePrefetcher(self.run_action, repo_path=self.runtime.repo_path, logger=self.logger)
+            if speculate
+            else None
+        )
         self.logger.info(
             f"Initialized Env: {self.runtime.repo_name} with image: {self.runtime.docker_image}"
         )
 
+    def _create_runtime(self) -> DockerRuntime:
+        """
+        Create a new runtime, taking a warm (already set-up) container from the pool if one is configured.
+        """
+        runtime_kwargs = {
+            "command": ["/bin/bash", "-l"],
+            "backend": self.backend,
+            "use_exec_session": self.use_exec_session,
+            "reward_cache": self.reward_cache,
+            "max_output_len": self.max_output_len,
+        }
+        if self.tool_files is not None:
+            runtime_kwargs["tool_files"] = self._get_command_files(self.tool_files)[0]
+        if self.pod_name is not None:
+            runtime_kwargs["pod_name"] = self.pod_name
+            self.pod_name = None
+        if self.fork_point is not None:
+            return DockerRuntime(
+                ds=self.args.ds, logger=self.logger, checkpoint_image=self.fork_point, **runtime_kwargs
+            )
+        if self.pool is not None:
+            return self.pool.acquire(self.args.ds, logger=self.logger, **runtime_kwargs)
+        return DockerRuntime(ds=self.args.ds, logger=self.logger, **runtime_kwargs)
+
+    def _close_runtime(self):
+        if self.pool is not None:
+            self.pool.release(self.runtime)
+        else:
+            self.runtime.close()
+
+    @traced("env.reset")
     def reset(self) -> Dict[str, Any]:
         """
         Resets the environment and returns an initial observation.
         """
         self.logger.info(f"Resetting RepoEnv ...")
-        # close the runtime
-        self.runtime.close()
         self.observation = "Environment reset"
         self.state = None
         self.done = False
+        if self.speculator is not None:
+            self.speculator.invalidate()
+        if self.runtime.pristine and self.runtime.container is not None:
+            # nothing has run since setup: the runtime is already in its initial state
+            return self.observation
+        # close the runtime
+        self._close_runtime()
         # also just recreate env again with the same args
-        self.runtime = DockerRuntime(
-            ds=self.args.ds, command=["/bin/bash", "-l"], logger=self.logger, backend=self.backend
-        )
+        self.runtime = self._create_runtime()
         return self.observation  # self.get_observation()
 
-    def add_commands(self, cmd_files: list[str]):
+    @traced("env.set_fork_point")
+    def set_fork_point(self) -> str:
         """
-        Adds command files to the environment by parsing them,
-        copying them to the Docker container, and making them executable or sourced.
+        Snapshot the current container state as the state later resets start from, so
+        repeated rollouts of the task (restarts, multiple samples) skip the container setup.
+        Only supported for the docker backend.
+        """
+        fork_point = self.runtime.snapshot()
+        self._release_fork_point()
+        self.fork_point = fork_point
+        return fork_point
+
+    def _release_fork_point(self):
+        # removed by the runtime once its container (possibly started from it) is gone
+        if self.fork_point is not None:
+            self.runtime.fork_images.append(self.fork_point)
+            self.fork_point = None
+
+    def fork(self) -> "RepoEnv":
+        """Independent copy of this environment in its current (possibly mid-episode) state."""
+        return self.fork_many(1)[0]
+
+    @traced("env.fork")
+    def fork_many(self, num_forks: int) -> List["RepoEnv"]:
+        """
+        `num_forks` independent copies of this environment in its current state, e.g. to branch
+        several rollouts or tree-search nodes from the setup point or from a mid-episode state.
+        The container is committed once and the copies are started concurrently; each copy owns
+        its runtime and must be closed separately. Only supported for the docker backend.
+        """
+        if self.speculator is not None:
+            self.speculator.invalidate()
+        envs = []
+        for runtime in self.runtime.fork(num_forks, logger=self.logger):
+            env = copy.copy(self)
+            env.runtime = runtime
+            env.pool = None  # forks are never handed back to the pool
+            env.pod_name = None
+            env.fork_point = None  # owned (and removed) by this env
+            if self.speculator is not None:
+                env.speculator = SpeculativePrefetcher(
+                    env.run_action, repo_path=runtime.repo_path, logger=self.logger
+                )
+            envs.append(env)
+        return envs
+
+    def _get_command_files(self, cmd_files: list[str]) -> Tuple[Dict[str, tuple], list[str]]:
+        """
+        Maps command files to their container destinations (rewritten for the tool daemon if it
+        is enabled, so the cached tool image and `add_commands` hash the same files).
 
         Args:
             cmd_files: List of paths to command files.
+
+        Returns:
+            files: container path -> (content, mode)
+            source_paths: container paths of the scripts that need to be sourced
         """
-        cmds = []
+        files = {}
+        source_paths = []
         for cmd_file in cmd_files:
-            # Parse commands from file
-            parsed_commands = self.cmd_parser.parse_command_file(cmd_file)
-            cmds.extend(parsed_commands)
-
             # Determine the file extension
             _, ext = os.path.splitext(cmd_file)
 
             # Get the base name of the command file
             cmd_name = os.path.basename(cmd_file)
 
+            with open(cmd_file, "rb") as file:
+                content = file.read()
+
             if ext == ".py" or self._is_shebang_script(cmd_file):
-                # Python script or shebang script: copy, strip .py extension if applicable
+                # Python script or shebang script: copy as executable, strip .py extension if applicable
                 if ext == ".py":
                     container_cmd_name = cmd_name[:-3]  # Remove .py extension
                 else:
                     container_cmd_name = cmd_name
                 container_path = f"/usr/local/bin/{container_cmd_name}"
-                self.runtime.copy_to_container(cmd_file, container_path)
-                self.runtime.run(f"chmod +x {container_path}")
+                files[container_path] = (content, 0o755)
 
             elif ext == ".sh":
-                # Bash script ending with .sh: copy, chmod, and source it
+                # Bash script ending with .sh: copy (keeping host permissions) and source it
                 container_cmd_name = cmd_name
                 container_path = f"/usr/local/bin/{container_cmd_name}"
-                self.runtime.copy_to_container(cmd_file, container_path)
-                # self.runtime.run(f"chmod +x {container_path}")
-                # Source the script inside the container
-                self.runtime.run(f"bash -c 'source {container_path}'")
+                files[container_path] = (content, os.stat(cmd_file).st_mode & 0o777)
+                source_paths.append(container_path)
 
             else:
-                # Bash script without shebang: copy, chmod, and source it
+                # Bash script without shebang: copy as executable and source it
                 container_cmd_name = cmd_name
                 container_path = f"/usr/local/bin/{container_cmd_name}"
-                self.runtime.copy_to_container(cmd_file, container_path)
-                self.runtime.run(f"chmod +x {container_path}")
-                # Source the script inside the container
+                files[container_path] = (content, 0o755)
+                source_paths.append(container_path)
+        if self.tool_daemon:
+            files = self._get_tool_daemon_files(files)
+        return files, source_paths
+
+    @traced("env.add_commands")
+    def add_commands(self, cmd_files: list[str]):
+        """
+        Adds command files to the environment by parsing them,
+        copying them to the Docker container (in a single upload), and making them executable or sourced.
+        If the runtime was started from a cached tool image with the same files, the copy is skipped.
+
+        Args:
+            cmd_files: List of paths to command files.
+        """
+        cmds = []
+        for cmd_file in cmd_files:
+            # Parse commands from file
+            parsed_commands = self.cmd_parser.parse_command_file(cmd_file)
+            cmds.extend(parsed_commands)
+
+        files, source_paths = self._get_command_files(cmd_files)
+        tools_cached = (
+            self.runtime.tools_installed
+            and self.runtime.get_tool_image_name(files) == self.runtime.tool_image
+        )
+        if tools_cached:
+            self.logger.info(f"Tools already installed in image: {self.runtime.tool_image}")
+        else:
+            self.runtime.copy_files_to_container(files)
+            # Source the scripts inside the container
+            for container_path in source_paths:
                 self.runtime.run(f"bash -c 'source {container_path}'")
+            # bake the tools into a derived image for later episodes (before the agent modifies anything)
+            if self.tool_files is not None:
+                self.runtime.save_tool_image(files)
+        if self.tool_daemon:
+            # (re)load the tools just copied; a daemon is never part of a committed image
+            output, error_code = self.runtime.run(
+                f"{TOOL_DAEMON_PATH} {'start' if tools_cached else 'restart'}", timeout=30
+            )
+            if error_code != "0":
+                self.logger.warning(f"Tool daemon not started, tools run as scripts: {output}")
+        if self.search_index and any(cmd.name == "search" for cmd in cmds):
+            # detached, so the episode starts right away (searches read all files until it is done)
+            build_cmd = f"nohup search --build_index --path {self.runtime.repo_path} > /dev/null 2>&1 &"
+            self.runtime.run(f"bash -c {shlex.quote(build_cmd)}", timeout=30)
 
         # Store the parsed commands for reference
         self.commands = cmds
         self.logger.info(f"Added {len(cmds)} commands to the environment.")
 
+    @staticmethod
+    def _get_tool_daemon_files(files: Dict[str, tuple]) -> Dict[str, tuple]:
+        """
+        Rewrites the container files of `add_commands` for the tool daemon: each Python tool
+        script goes to TOOL_DAEMON_TOOLS_DIR (where the daemon imports it) and its CLI path gets
+        the client shim, which forwards calls to the daemon (or runs the script if it is down).
+        """
+        with open(os.path.join(TOOL_DAEMON_SOURCE_DIR, "tool_client.py"), "rb") as f:
+            client = f.read()
+        with open(os.path.join(TOOL_DAEMON_SOURCE_DIR, "tool_daemon.py"), "rb") as f:
+            daemon = f.read()
+        daemon_files = {TOOL_DAEMON_PATH: (daemon, 0o755)}
+        for container_path, (content, mode) in files.items():
+            first_line = content.split(b"\n", 1)[0]
+            if first_line.startswith(b"#!") and b"python" in first_line:
+                tool_name = os.path.basename(container_path)
+                daemon_files[f"{TOOL_DAEMON_TOOLS_DIR}/{tool_name}"] = (content, mode)
+                daemon_files[container_path] = (client, 0o755)
+            else:
+                daemon_files[container_path] = (content, mode)
+        return daemon_files
+
     def _is_shebang_script(self, cmd_file: str) -> bool:
         """
         Checks if the given file starts with a shebang (#!).
@@ -170,6 +368,29 @@ class RepoEnv(gym.Env):
         total_time = end_time - start_time
         return bash_output, error_code, total_time
 
+    def _run_action_speculative(self, action: Action, timeout: int):
+        """`run_action`, served from a speculative result if there is one."""
+        with trace_span("env.action", tool=action.function_name or "") as span_attrs:
+            if self.speculator is None:
+                return self.run_action(action, timeout=timeout)
+            start_time = time.time()
+            result = self.speculator.lookup(action)
+            if result is not None:
+                span_attrs["speculated"] = True
+                bash_output, error_code, _ = result
+                return bash_output, error_code, time.time() - start_time
+            if not self.is_read_only(action):
+                # the action may change the container state the speculative results were computed on
+                self.speculator.invalidate()
+            return self.run_action(action, timeout=timeout)
+
+    def _speculate(self, text: str):
+        if self.speculator is not None and not self.done:
+            self.speculator.speculate(text, [command.name for command in self.commands])
+
+    def get_speculation_stats(self) -> Optional[Dict[str, float]]:
+        return self.speculator.stats.to_dict() if self.speculator is not None else None
+
     def step(
         self, action: Action, timeout: int = None,
     ) -> Tuple[Observation, int, bool, Dict[str, Any]]:
@@ -188,14 +409,76 @@ class RepoEnv(gym.Env):
         """
         if not timeout:
             timeout = self.step_timeout
-        bash_output, error_code, total_time = self.run_action(action, timeout=timeout)
+        bash_output, error_code, total_time = self._run_action_speculative(action, timeout)
         self.observation = Observation(bash_output, error_code, action)
         reward = self.calculate_reward(self.observation)
         if "finish" in action.function_name.lower() or "submit" in action.function_name.lower():
             self.done = True
         info = {"total_time": total_time}
+        self._speculate(str(self.observation))
         return self.observation, reward, self.done, info
 
+    @staticmethod
+    def is_read_only(action: Action) -> bool:
+        if action.function_name not in READ_ONLY_ACTIONS:
+            return False
+        commands = READ_ONLY_ACTIONS[action.function_name]
+        return commands is None or action.parameters.get("command") in commands
+
+    def step_many(
+        self, actions: List[Action], timeout: int = None,
+    ) -> List[Tuple[Observation, int, bool, Dict[str, Any]]]:
+        """
+        Executes several actions (e.g. all tool calls of one LLM response) and returns one
+        (observation, reward, done, info) per action, in order. Consecutive read-only actions
+        (see READ_ONLY_ACTIONS) run concurrently in the container; every other action runs on
+        its own, after the actions before it, so the results match a sequential execution.
+        info["total_time"] is the time of the action itself; info["batch_time"] is the wall
+        time of all actions.
+        """
+        if not timeout:
+            timeout = self.step_timeout
+        start_time = time.time()
+        results = [None] * len(actions)
+        idx = 0
+        while idx < len(actions):
+            end = idx + 1
+            if self.is_read_only(actions[idx]):
+                while end < len(actions) and self.is_read_only(actions[end]):
+                    end += 1
+            if end - idx == 1:
+                results[idx] = self._run_action_speculative(actions[idx], timeout)
+            else:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=end - idx) as executor:
+                    futures = [
+                        # copy the context: spans of the worker threads go to this episode's tracer
+                        executor.submit(
+                            contextvars.copy_context().run, self._run_action_speculative, actions[i], timeout
+                        )
+                        for i in range(idx, end)
+                    ]
+                    for i, future in zip(range(idx, end), futures):
+                        results[i] = future.result()
+            idx = end
+
+        batch_time = time.time() - start_time
+        steps = []
+        for action, (bash_output, error_code, total_time) in zip(actions, results):
+            self.observation = Observation(bash_output, error_code, action)
+            reward = self.calculate_reward(self.observation)
+            if "finish" in action.function_name.lower() or "submit" in action.function_name.lower():
+                self.done = True
+            info = {"total_time": total_time, "batch_time": batch_time}
+            steps.append((self.observation, reward, self.done, info))
+        self._speculate("\n".join(str(step[0]) for step in steps))
+        return steps
+
+    def get_patch(self) -> str:
+        """
+        Returns the current git diff of the repository in the container.
+        """
+        return self.runtime.get_patch()
+
     def get_task_instruction(self) -> str:
         """
         Returns the task instructions for the environment.
@@ -236,7 +519,10 @@ class RepoEnv(gym.Env):
         return self.done  # Customize to set completion condition
 
     def close(self):
-        self.runtime.close()
+        if self.speculator is not None:
+            self.speculator.close()
+        self._release_fork_point()
+        self._close_runtime()
 
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -0,0 +1,160 @@
+import os
+import re
+import threading
+import concurrent.futures
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from r2egym.agenthub.action import Action
+from r2egym.agenthub.utils.log import get_logger
+
+# source-like file paths mentioned in an observation (relative, or under the repo root)
+MENTIONED_PATH_RE = re.compile(
+    r"(?<![\w/.-])((?:/testbed/|\./)?(?:[\w.-]+/)*[\w-]+\.(?:py|pyi|pyx|c|h|cc|cpp|js|ts|rs|go|java|cfg|toml|ini|rst))\b"
+)
+VIEW_TOOLS = ("file_editor", "str_replace_editor")  # r2egym / openhands + sweagent scaffolds
+BASH_TOOL = "execute_bash"
+# agent command -> speculative equivalent (no index refresh, so it never holds .git/index.lock
+# while a concurrent agent command runs git)
+SPECULATED_BASH_COMMANDS = {"git diff": "git --no-optional-locks diff"}
+
+
+@dataclass
+class SpeculationStats:
+    speculated: int = 0  # speculative actions started
+    hits: int = 0  # agent actions served from a speculative result
+    misses: int = 0  # cacheable agent actions (file views, git diff) that were not speculated
+    invalidated: int = 0  # speculative results dropped unused by a state-changing action
+    errors: int = 0
+    time_saved: float = 0.0  # container time of the served results
+
+    def to_dict(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {**asdict(self), "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+##############################################################################
+# speculative observation prefetch
+##############################################################################
+class SpeculativePrefetcher:
+    """
+    Precomputes cheap, likely-needed observations while the agent waits for the LLM: views of
+    the files mentioned in the last observation and a `git diff` snapshot. Each one is the
+    exact action the agent would send (same tool and parameters), run through the env's own
+    `run_action`, so a served result is identical to running the action at that point.
+
+    Results are only valid for the container state they were computed on: `invalidate` (called
+    by the env before any state-changing action, and on reset) drops them all and waits for the
+    running ones, so a speculative action never overlaps the state change. Speculated actions
+    must not change the container state themselves (editor views leave the edit history alone).
+    """
+
+    def __init__(
+        self,
+        run_action: Callable[[Action, int], Tuple[str, int, float]],
+        repo_path: str = "/testbed",
+        max_files: int = 3,
+        timeout: int = 30,
+        max_workers: int = 2,
+        logger=None,
+    ):
+        self.run_action = run_action
+        self.repo_path = repo_path
+        self.max_files = max_files
+        self.timeout = timeout
+        self.logger = get_logger("SpeculativePrefetcher") if logger is None else logger
+        self.stats = SpeculationStats()
+        self._lock = threading.Lock()
+        self._results: Dict[tuple, concurrent.futures.Future] = {}
+        self._used = set()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def key(self, action: Action) -> Optional[tuple]:
+        """Cache key of a speculable action (None: never served from the cache)."""
+        params = action.parameters
+        if action.function_name in VIEW_TOOLS and params.get("command") == "view" and params.get("path"):
+            path = os.path.normpath(os.path.join(self.repo_path, str(params["path"])))
+            others = tuple(sorted((k, str(v)) for k, v in params.items() if k not in ("command", "path")))
+            return (action.function_name, path, others)
+        if action.function_name == BASH_TOOL:
+            # r2egym names the parameter `cmd`, openhands / sweagent `command`
+            cmd = params.get("cmd", params.get("command"))
+            cmd = cmd.strip() if isinstance(cmd, str) else None
+            for agent_cmd, speculative_cmd in SPECULATED_BASH_COMMANDS.items():
+                if cmd in (agent_cmd, speculative_cmd):
+                    return (BASH_TOOL, agent_cmd)
+        return None
+
+    def candidates(self, text: str, command_names: List[str]) -> List[Action]:
+        actions = []
+        view_tool = next((name for name in VIEW_TOOLS if name in command_names), None)
+        if view_tool is not None:
+            paths = []
+            for path in reversed(MENTIONED_PATH_RE.findall(text or "")):  # most recent mentions first
+                if path not in paths:
+                    paths.append(path)
+                if len(paths) == self.max_files:
+                    break
+            for path in paths:
+                path = os.path.normpath(os.path.join(self.repo_path, path))
+                actions.append(Action(function_name=view_tool, parameters={"command": "view", "path": path}))
+        if BASH_TOOL in command_names:
+            param = "cmd" if view_tool == "file_editor" else "command"
+            for speculative_cmd in SPECULATED_BASH_COMMANDS.values():
+                actions.append(Action(function_name=BASH_TOOL, parameters={param: speculative_cmd}))
+        return actions
+
+    def speculate(self, text: str, command_names: List[str]):
+        """Start computing the candidate observations for `text` (returns immediately)."""
+        with self._lock:
+            for action in self.candidates(text, command_names):
+                key = self.key(action)
+                if key is None or key in self._results:
+                    continue
+                self._results[key] = self._executor.submit(self._run, action)
+                self.stats.speculated += 1
+
+    def _run(self, action: Action) -> Optional[Tuple[str, int, float]]:
+        bash_output, error_code, total_time = self.run_action(action, self.timeout)
+        if error_code == -1:  # exception / timeout: never served, the agent's own run may succeed
+            self.stats.errors += 1
+            return None
+        return bash_output, error_code, total_time
+
+    def lookup(self, action: Action) -> Optional[Tuple[str, int, float]]:
+        """Speculative (bash_output, error_code, total_time) for `action`, waiting if still running."""
+        key = self.key(action)
+        if key is None:
+            return None
+        with self._lock:
+            future = self._results.get(key)
+        try:
+            result = future.result() if future is not None else None
+        except concurrent.futures.CancelledError:
+            result = None
+        with self._lock:
+            if result is None or self._results.get(key) is not future:
+                # not speculated, failed, or invalidated while waiting
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self.stats.time_saved += result[2]
+            self._used.add(key)
+        return result
+
+    def invalidate(self):
+        """Drop all results; returns once no speculative action is running anymore."""
+        with self._lock:
+            futures = list(self._results.values())
+            for key, future in self._results.items():
+                future.cancel()  # only stops actions that have not started
+                if key not in self._used:
+                    self.stats.invalidated += 1
+            self._results = {}
+            self._used = set()
+        concurrent.futures.wait(futures)
+
+    def close(self):
+        self.invalidate()
+        self._executor.shutdown(wait=True)
+        self.logger.info(f"Speculation stats: {self.stats.to_dict()}")
@@ -1,6 +1,7 @@
 # editagent_script.py
 
 import openai
+import os
 import re
 import yaml
 from dataclasses import asdict, dataclass
@@ -13,11 +14,17 @@ import threading
 import docker
 
 from r2egym.agenthub.runtime.docker import DockerRuntime
+from r2egym.agenthub.runtime.pool import get_process_pool
+from r2egym.agenthub.runtime.provisioner import PodProvisioner
+from r2egym.agenthub.runtime.prefetch import ImagePrefetcher
+from r2egym.agenthub.runtime.reward_cache import RewardCache
+from r2egym.agenthub.run.scheduler import EpisodeScheduler, ResourceLimits
 from r2egym.agenthub.environment.env import EnvArgs, RepoEnv
 from r2egym.agenthub.agent.agent import AgentArgs, Agent
 
 from r2egym.docker_bash_utils.docker_list_tags import fetch_docker_tags
 from r2egym.agenthub.utils.log import get_logger
+from r2egym.agenthub.utils.tracing import episode_tracer, export_trace, get_tracer, trace_span
 from r2egym.logging import setup_logging, INFO
 from r2egym.agenthub.utils.utils import get_parsed_commit
 
@@ -55,64 +62,21 @@ def get_docker_images(repo_name) -> List[str]:
     return docker_image_list
 
 
-def prepull_docker_image(docker_image: str) -> bool:
-    """
-    Prepulls a single Docker image.
-    
-    Args:
-        docker_image: The Docker image name to pull
-        
-    Returns:
-        True if successful, False otherwise
-    """
-    try:
-        client = docker.from_env()
-        logger.info(f"Pulling Docker image: {docker_image}")
-        client.images.pull(docker_image)
-        logger.info(f"Successfully pulled Docker image: {docker_image}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to pull Docker image {docker_image}: {e}")
-        return False
-
-
 def prepull_docker_images(ds_selected: List[Dict], max_workers: Optional[int] = None) -> None:
     """
     Prepulls all Docker images in parallel before starting the main execution.
-    
+
     Args:
         ds_selected: List of dataset entries containing docker_image keys
         max_workers: Maximum number of threads for parallel pulling
     """
-    # Extract unique Docker images
-    docker_images = list(set([ds_entry["docker_image"] for ds_entry in ds_selected]))
-    logger.info(f"Starting parallel prepull of {len(docker_images)} unique Docker images...")
-    
-    # Use ThreadPoolExecutor for I/O bound operations like Docker pulls
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all pull tasks
-        future_to_image = {
-            executor.submit(prepull_docker_image, docker_image): docker_image
-            for docker_image in docker_images
-        }
-        
-        # Track results
-        successful_pulls = []
-        failed_pulls = []
-        
-        for future in concurrent.futures.as_completed(future_to_image):
-            docker_image = future_to_image[future]
-            try:
-                success = future.result()
-                if success:
-                    successful_pulls.append(docker_image)
-                else:
-                    failed_pulls.append(docker_image)
-            except Exception as e:
-                logger.error(f"Exception during prepull of {docker_image}: {e}")
-                failed_pulls.append(docker_image)
-    
-    logger.info(f"Prepull completed. Success: {len(successful_pulls)}, Failed: {len(failed_pulls)}")
+    prefetcher = ImagePrefetcher(max_workers=max_workers or 8, logger=logger)
+    futures = prefetcher.prefetch([ds_entry["docker_image"] for ds_entry in ds_selected])
+    logger.info(f"Starting parallel prepull of {len(futures)} unique Docker images...")
+    failed_pulls = [image for image, success in prefetcher.iter_ready() if not success]
+    prefetcher.close()
+
+    logger.info(f"Prepull completed. Success: {len(futures) - len(failed_pulls)}, Failed: {len(failed_pulls)}")
     if failed_pulls:
         logger.warning(f"Failed to pull images: {failed_pulls}")
 
@@ -159,6 +123,15 @@ def run_agent_with_restarts(
         temperatures = [temperature] * max_iterations
     logger.warning(f"Using temperatures: {temperatures}")
 
+    # later runs restart from a snapshot of the set-up container instead of setting up a new one
+    if (
+        num_restarts * max_iterations > 1
+        and env.backend == "docker"
+        and env.pool is None
+        and env.runtime.pristine
+    ):
+        env.set_fork_point()
+
     # run the agent in iterative protocol
     trajectories = []
     for iteration in range(max_iterations):
@@ -187,6 +160,7 @@ def run_agent_with_restarts(
     trajectory = min(trajectories, key=lambda x: x.num_steps)
     return trajectory
 
+@episode_tracer
 def runagent(
     ds,
     exp_name: Optional[str] = None,
@@ -201,6 +175,19 @@ def runagent(
     max_iterations: int = 1,
     scaffold: str = "r2egym",
     max_tokens: int = 65536,
+    pool_size: int = 0,
+    use_exec_session: bool = False,
+    cache_tool_image: bool = False,
+    pod_name: Optional[str] = None,
+    reward_cache_path: Optional[str] = None,
+    max_output_len: Optional[int] = None,
+    condenser: Optional[Dict[str, Any]] = None,
+    parallel_tool_calls: bool = False,
+    speculate: bool = False,
+    trace_dir: Optional[str] = None,
+    trace_format: str = "chrome",
+    tool_daemon: bool = False,
+    search_index: bool = False,
 ) -> Optional[str]:
     """
     Runs the editagent agent on a specified Docker image.
@@ -210,6 +197,19 @@ def runagent(
         traj_dir: Directory to save trajectories.
         jsonl_file: Path to the JSONL file to save results. If not provided, generated using traj_dir and exp_name.
         exp_name: Experiment name. Used if jsonl_file is not provided. If not provided, a unique name is generated.
+        pool_size: Number of warm (already set-up) containers per docker image to keep for env resets, in a pool shared by the episodes of this process. 0 disables the pool (docker backend only).
+        use_exec_session: Run container commands through a persistent shell session instead of one exec per command.
+        cache_tool_image: Build (once) and reuse a derived image with the scaffold tools and setup baked in (docker backend only).
+        pod_name: Pre-provisioned pod to run the episode in (kubernetes backend only, see PodProvisioner).
+        reward_cache_path: sqlite file of a reward cache shared by all rollouts (skips re-running tests for an already tested patch). None disables.
+        max_output_len: Stream command output and keep only its first/last max_output_len/2 characters in memory (observations only: test logs, patches and other parsed outputs are spilled to disk and read in full). None disables.
+        condenser: History condenser config, e.g. {"type": "observations", "max_tokens": 32000, "keep_last_steps": 4} (see agent/history.py). None disables.
+        parallel_tool_calls: Execute all tool calls of a response (read-only ones concurrently) instead of only the first (fn calling only).
+        speculate: Precompute likely next observations (views of mentioned files, git diff) while the LLM is queried; hit / miss stats are stored on the trajectory.
+        trace_dir: Directory to write the episode's phase trace to (spans are always stored on the trajectory). None disables.
+        trace_format: Trace file format, "chrome" (chrome://tracing, Perfetto) or "otlp" (OpenTelemetry JSON).
+        tool_daemon: Serve the Python tools from a resident daemon in the container instead of starting an interpreter per tool call.
+        search_index: Build a trigram index of the repo at setup so `search` only reads files that can match (same output).
     """
     logger = setup_logging(
         name=ds["docker_image"].replace("/", "_"),
@@ -229,8 +229,12 @@ def runagent(
     # Initialize environment arguments
     env_args = EnvArgs(ds=ds)
 
-    # Initialize the RepoEnv
-    env = RepoEnv(env_args, logger=logger, backend=backend)
+    # Warm containers for env resets, shared with the other episodes of this process
+    pool = None
+    if pool_size > 0:
+        assert backend == "docker", "Container pool is only supported for docker backend"
+        pool = get_process_pool(pool_size)
+
     # set agent args
     if use_fn_calling:
         assert scaffold != "sweagent", "SWEagent scaffold does not support fn calling"
@@ -242,6 +246,27 @@ def runagent(
             Path(f"./src/r2egym/agenthub/config/{scaffold}/edit_non_fn_calling.yaml")
         )
     agent_args.llm_name = llm_name
+    if condenser:
+        agent_args.other_args = {**(agent_args.other_args or {}), "condenser": condenser}
+    if parallel_tool_calls:
+        agent_args.other_args = {**(agent_args.other_args or {}), "parallel_tool_calls": True}
+
+    # Initialize the RepoEnv
+    with trace_span("runagent.env_init"):
+        env = RepoEnv(
+            env_args,
+            logger=logger,
+            backend=backend,
+            pool=pool,
+            use_exec_session=use_exec_session,
+            tool_files=agent_args.command_files if cache_tool_image else None,
+            pod_name=pod_name,
+            reward_cache=RewardCache(reward_cache_path) if reward_cache_path else None,
+            max_output_len=max_output_len,
+            speculate=speculate,
+            tool_daemon=tool_daemon,
+            search_index=search_index,
+        )
 
     # Initialize the agent
     agent = Agent(name="EditAgent", args=agent_args, logger=logger)
@@ -271,7 +296,8 @@ def runagent(
     reward, test_output = env.runtime._calculate_reward(get_test_output=True, timeout=max_reward_calc_time)
     reward_calc_time = time.time() - reward_calc_time
     # Close the environment and runtime
-    env.close()
+    with trace_span("runagent.env_close"):
+        env.close()
 
     # update the trajectory object
     trajectory.reward = reward
@@ -279,7 +305,12 @@ def runagent(
     trajectory.ds = ds
     trajectory.exp_name = exp_name
     trajectory.reward_calc_time = reward_calc_time # time taken to calculate reward
+    trajectory.spans = get_tracer().to_dicts()
     logger.warning(f"time taken to calculate reward in seconds: {reward_calc_time:.2f}")
+    if trace_dir is not None:
+        trace_path = Path(trace_dir) / exp_name / f"{ds['docker_image'].replace('/', '_')}.{trace_format}.json"
+        export_trace(trajectory.spans, str(trace_path), format=trace_format, name=ds["docker_image"])
+        logger.info(f"Wrote trace: {trace_path}")
 
     logger.info(f"editagent completed for Docker image: {ds['docker_image']}")
     # close env and docker runtime
@@ -309,6 +340,26 @@ def runagent_multiple(
     scaffold: str = "r2egym",
     prepull_images: bool = False,
     max_tokens: int = 65536,
+    pool_size: int = 0,
+    use_exec_session: bool = False,
+    cache_tool_image: bool = False,
+    pod_lookahead: int = 0,
+    prefetch_disk_budget_gb: Optional[float] = None,
+    reward_cache_path: Optional[str] = None,
+    max_output_len: Optional[int] = None,
+    max_containers: Optional[int] = None,
+    min_free_memory_gb: Optional[float] = None,
+    max_daemon_latency: Optional[float] = None,
+    max_llm_requests: Optional[int] = None,
+    max_llm_tokens: Optional[int] = None,
+    priority: int = 0,
+    condenser: Optional[Dict[str, Any]] = None,
+    parallel_tool_calls: bool = False,
+    speculate: bool = False,
+    trace_dir: Optional[str] = None,
+    trace_format: str = "chrome",
+    tool_daemon: bool = False,
+    search_index: bool = False,
 ):
     """
     Runs the editagent agent on the first k Docker images.
@@ -320,7 +371,27 @@ def runagent_multiple(
         start_idx: The starting index in the Docker images list.
         max_steps: Maximum steps for the agent run.
         max_workers: Maximum number of threads to use.
-        prepull_images: Whether to prepull Docker images in parallel before starting execution.
+        prepull_images: Whether to prefetch Docker images in parallel; each episode starts as soon as its image is pulled.
+        pool_size: Number of warm containers kept per docker image for env resets, in one pool per worker process shared by its episodes (0 disables).
+        use_exec_session: Use a persistent shell session per container for command execution.
+        cache_tool_image: Reuse a derived `<image>-r2egym-tools:<hash>` image with tools and setup baked in.
+        pod_lookahead: Number of pods to create ahead of the running workers (kubernetes backend only, 0 disables).
+        prefetch_disk_budget_gb: Local image disk usage above which least-recently-used prefetched task images are evicted (None disables).
+        reward_cache_path: sqlite file of a reward cache shared by all episodes (e.g. best-of-N rollouts of the same task). None disables.
+        max_output_len: Keep only the head and tail (max_output_len characters) of each command output in memory. None disables.
+        max_containers: Admit no new episode while this many containers run on the docker daemon (None disables).
+        min_free_memory_gb: Admit no new episode while the host has less free memory (None disables).
+        max_daemon_latency: Admit no new episode while a docker API round-trip takes longer (seconds, None disables).
+        max_llm_requests: Admit no new episode while this many LLM requests are in flight (None disables).
+        max_llm_tokens: Admit no new episode while this many prompt tokens are in flight (None disables).
+        priority: Priority of this run's episodes in the scheduler queue (higher first).
+        condenser: History condenser config for long episodes (see agent/history.py). None disables.
+        parallel_tool_calls: Execute all tool calls of a response, read-only ones concurrently (fn calling only).
+        speculate: Precompute likely next observations while the LLM is queried (stats on each trajectory).
+        trace_dir: Directory to write per-episode phase traces to (None disables). Summarize the spans of an experiment with `python -m r2egym.agenthub.utils.tracing summarize <jsonl>`.
+        trace_format: Trace file format, "chrome" or "otlp".
+        tool_daemon: Serve the Python tools from a resident in-container daemon (no interpreter start per tool call).
+        search_index: Index each repo at setup for the `search` tool (identical results, fewer files read).
     """
     # Load the dataset
     ds = load_dataset(dataset, split=split)
@@ -390,51 +461,124 @@ def runagent_multiple(
         f"Starting editagent on {len(ds_selected)} Docker images after filtering."
     )
 
-    # Prepull all Docker images in parallel before starting main execution
+    # Prefetch Docker images in parallel; each episode is submitted as soon as its image is pulled
+    prefetcher = None
     if ds_selected and prepull_images:
-        logger.info("Prepulling Docker images before starting main execution...")
-        prepull_docker_images(ds_selected, max_workers=max_workers)
-        logger.info("Docker image prepull completed.")
-
-    # with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks to the executor using keyword arguments
-        future_to_image = {
-            executor.submit(
-                runagent,
-                ds=ds_entry,
-                exp_name=exp_name,
-                max_steps=max_steps,
-                num_restarts=num_restarts,
-                max_steps_absolute=max_steps_absolute,
-                llm_name=llm_name,
-                temperature=temperature,
-                use_fn_calling=use_fn_calling,
-                backend=backend,
-                max_reward_calc_time=max_reward_calc_time,
-                max_iterations=max_iterations,
-                scaffold=scaffold,
-                max_tokens=max_tokens,
-            ): ds_entry[
-                "docker_image"
-            ]  # <-- store the docker_image from ds_entry here
-            for ds_entry in ds_selected
+        logger.info("Prefetching Docker images (episodes start as their image is pulled)...")
+        prefetcher = ImagePrefetcher(
+            max_workers=max_workers or 8,
+            disk_high_water_mark=int(prefetch_disk_budget_gb * 1e9) if prefetch_disk_budget_gb else None,
+            logger=logger,
+        )
+        # order the work queue like the pulls (grouped by repository)
+        image_order = {
+            image: idx
+            for idx, image in enumerate(
+                ImagePrefetcher.order_images([ds_entry["docker_image"] for ds_entry in ds_selected])
+            )
         }
+        ds_selected = sorted(ds_selected, key=lambda ds_entry: image_order[ds_entry["docker_image"]])
+
+    # Create pods ahead of the workers so pod scheduling overlaps with agent execution
+    provisioner = None
+    pod_names = [None] * len(ds_selected)
+    if pod_lookahead > 0 and ds_selected:
+        assert backend == "kubernetes", "Pod pre-provisioning is only supported for kubernetes backend"
+        provisioner = PodProvisioner(
+            num_workers=max_workers or os.cpu_count(),
+            lookahead=pod_lookahead,
+            command=["/bin/bash", "-l"],
+            logger=logger,
+        )
+        pod_names = provisioner.schedule(ds_selected)
+
+    if pool_size > 0:
+        assert backend == "docker", "Container pool is only supported for docker backend"
+
+    # Admit episodes as the host / docker daemon / LLM endpoint have room for them
+    scheduler = EpisodeScheduler(
+        ResourceLimits(
+            max_workers=max_workers or os.cpu_count(),
+            max_containers=max_containers,
+            min_free_memory_gb=min_free_memory_gb,
+            max_daemon_latency=max_daemon_latency,
+            max_llm_requests=max_llm_requests,
+            max_llm_tokens=max_llm_tokens,
+        ),
+        backend=backend,
+        logger=logger,
+    )
 
-        with open(jsonl_file, "a") as f:
-            for future in concurrent.futures.as_completed(future_to_image):
-                docker_image = future_to_image[
-                    future
-                ]  # <-- retrieve that stored docker_image
-                try:
-                    result = future.result()
-                    if result is not None:
-                        with file_lock:
-                            f.write(result + "\n")
-                except Exception as e:
-                    # Use docker_image from above when logging
-                    logger.error(f"Exception for Docker image {docker_image}: {e}")
+    def submit(ds_entry, pod_name):
+        # Queue the episode using keyword arguments; the docker_image is reported back as its tag
+        scheduler.submit(
+            runagent,
+            tag=(ds_entry["docker_image"], pod_name),
+            priority=priority,
+            experiment=exp_name,
+            ds=ds_entry,
+            exp_name=exp_name,
+            max_steps=max_steps,
+            num_restarts=num_restarts,
+            max_steps_absolute=max_steps_absolute,
+            llm_name=llm_name,
+            temperature=temperature,
+            use_fn_calling=use_fn_calling,
+            backend=backend,
+            max_reward_calc_time=max_reward_calc_time,
+            max_iterations=max_iterations,
+            scaffold=scaffold,
+            max_tokens=max_tokens,
+            pool_size=pool_size,
+            use_exec_session=use_exec_session,
+            cache_tool_image=cache_tool_image,
+            pod_name=pod_name,
+            reward_cache_path=reward_cache_path,
+            max_output_len=max_output_len,
+            condenser=condenser,
+            parallel_tool_calls=parallel_tool_calls,
+            speculate=speculate,
+            trace_dir=trace_dir,
+            trace_format=trace_format,
+            tool_daemon=tool_daemon,
+            search_index=search_index,
+        )
 
+    if prefetcher is None:
+        for ds_entry, pod_name in zip(ds_selected, pod_names):
+            submit(ds_entry, pod_name)
+    else:
+        pending = {}
+        for ds_entry, pod_name in zip(ds_selected, pod_names):
+            pending.setdefault(ds_entry["docker_image"], []).append((ds_entry, pod_name))
+        prefetcher.prefetch(list(pending))
+        for docker_image, success in prefetcher.iter_ready():
+            if not success:
+                logger.warning(f"Prefetch failed for {docker_image}, the runtime will pull it")
+            for ds_entry, pod_name in pending.pop(docker_image, []):
+                prefetcher.acquire(docker_image)
+                submit(ds_entry, pod_name)
+
+    with open(jsonl_file, "a") as f:
+        for (docker_image, pod_name), future in scheduler.as_completed():
+            if provisioner is not None:
+                provisioner.release(pod_name)
+            if prefetcher is not None:
+                prefetcher.release(docker_image)
+            try:
+                result = future.result()
+                if result is not None:
+                    with file_lock:
+                        f.write(result + "\n")
+            except Exception as e:
+                # Use docker_image from above when logging
+                logger.error(f"Exception for Docker image {docker_image}: {e}")
+
+    scheduler.close()
+    if provisioner is not None:
+        provisioner.close()
+    if prefetcher is not None:
+        prefetcher.close()
     logger.info(f"editagent completed on {len(ds_selected)} Docker images.")
 
 
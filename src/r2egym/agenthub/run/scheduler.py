@@ -0,0 +1,231 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import docker
+
+from r2egym.agenthub.utils.log import get_logger
+from r2egym.agenthub.utils.llm_load import LLMLoad, set_llm_load
+
+
+##############################################################################
+# admission limits
+##############################################################################
+@dataclass
+class ResourceLimits:
+    """Admission limits of the EpisodeScheduler (None disables a check)."""
+
+    max_workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+    max_containers: Optional[int] = None  # running containers on the docker daemon
+    min_free_memory_gb: Optional[float] = None  # MemAvailable of the host
+    max_daemon_latency: Optional[float] = None  # seconds for a docker API round-trip
+    max_llm_requests: Optional[int] = None  # LLM requests in flight across episodes
+    max_llm_tokens: Optional[int] = None  # prompt tokens in flight across episodes
+    rate_limit_cooldown: float = 60.0  # no new episodes for this long after a rate limit
+
+
+@dataclass(order=True)
+class _QueuedEpisode:
+    sort_key: Tuple[int, int]
+    fn: Callable = field(compare=False)
+    args: tuple = field(compare=False)
+    kwargs: dict = field(compare=False)
+    tag: Any = field(compare=False)
+
+
+##############################################################################
+# episode scheduler
+##############################################################################
+class EpisodeScheduler:
+    """
+    Runs episodes in worker processes, admitting a queued episode only while the host has
+    room for it: fewer than `max_workers` running, and the live signals (running containers,
+    free memory, docker daemon latency, LLM requests / tokens in flight, recent LLM rate
+    limits) are within `limits`. Admission is re-evaluated every `poll_interval` seconds
+    and whenever an episode finishes.
+
+    Queued episodes are ordered by fair share across experiments (the experiment with the
+    fewest running episodes per unit of weight goes first), then by priority (higher first),
+    then FIFO.
+
+    Usage:
+        scheduler = EpisodeScheduler(ResourceLimits(max_workers=16, max_containers=32))
+        scheduler.submit(runagent, ds=ds_entry, tag=ds_entry["docker_image"])
+        for tag, future in scheduler.as_completed():
+            result = future.result()
+        scheduler.close()
+    """
+
+    def __init__(
+        self,
+        limits: Optional[ResourceLimits] = None,
+        backend: str = "docker",
+        poll_interval: float = 2.0,
+        logger=None,
+    ):
+        self.limits = limits or ResourceLimits()
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.logger = get_logger("EpisodeScheduler") if logger is None else logger
+
+        self.llm_load = LLMLoad()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.limits.max_workers,
+            initializer=set_llm_load,
+            initargs=(self.llm_load,),
+        )
+        self._docker_client = None
+        if self.backend == "docker" and (
+            self.limits.max_containers is not None or self.limits.max_daemon_latency is not None
+        ):
+            self._docker_client = docker.from_env(timeout=120)
+
+        self._cond = threading.Condition()
+        self._queues: Dict[str, List[_QueuedEpisode]] = {}
+        self._weights: Dict[str, float] = {}
+        self._running: Dict[str, int] = {}
+        self._num_pending = 0  # queued or running
+        self._done: List[Tuple[Any, concurrent.futures.Future]] = []
+        self._counter = itertools.count()
+        self._closed = False
+        self._blocked_reason = None
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        tag: Any = None,
+        priority: int = 0,
+        experiment: str = "default",
+        weight: float = 1.0,
+        **kwargs,
+    ):
+        """Queue `fn(*args, **kwargs)` as an episode; its result is reported with `tag` by `as_completed`."""
+        with self._cond:
+            self._weights[experiment] = weight
+            heapq.heappush(
+                self._queues.setdefault(experiment, []),
+                _QueuedEpisode((-priority, next(self._counter)), fn, args, kwargs, tag),
+            )
+            self._num_pending += 1
+            self._cond.notify_all()
+
+    def as_completed(self) -> Iterator[Tuple[Any, concurrent.futures.Future]]:
+        """Yield (tag, future) for every submitted episode as it finishes."""
+        while True:
+            with self._cond:
+                while not self._done and self._num_pending > 0:
+                    self._cond.wait()
+                if not self._done:
+                    return
+                tag, future = self._done.pop(0)
+            yield tag, future
+
+    ##########################################################################
+    # admission
+    ##########################################################################
+    @staticmethod
+    def _free_memory_gb() -> Optional[float]:
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) / 1024**2
+        except OSError:
+            pass
+        return None
+
+    def _admission_blocker(self) -> Optional[str]:
+        """Reason why no episode can be admitted right now (None: admit)."""
+        limits = self.limits
+        if sum(self._running.values()) >= limits.max_workers:
+            return "max_workers"
+        if self.llm_load.seconds_since_rate_limit() < limits.rate_limit_cooldown:
+            return "llm rate limit"
+        if limits.max_llm_requests is not None and self.llm_load.requests.value >= limits.max_llm_requests:
+            return "llm requests in flight"
+        if limits.max_llm_tokens is not None and self.llm_load.tokens.value >= limits.max_llm_tokens:
+            return "llm tokens in flight"
+        if limits.min_free_memory_gb is not None:
+            free_memory = self._free_memory_gb()
+            if free_memory is not None and free_memory < limits.min_free_memory_gb:
+                return f"free memory {free_memory:.1f}GB"
+        if self._docker_client is not None:
+            start_time = time.time()
+            try:
+                num_containers = len(self._docker_client.containers.list(filters={"status": "running"}))
+            except Exception as e:
+                return f"docker daemon error: {repr(e)}"
+            latency = time.time() - start_time
+            if limits.max_daemon_latency is not None and latency > limits.max_daemon_latency:
+                return f"docker daemon latency {latency:.2f}s"
+            # containers of just admitted episodes may not be running yet
+            num_containers = max(num_containers, sum(self._running.values()))
+            if limits.max_containers is not None and num_containers >= limits.max_containers:
+                return f"{num_containers} running containers"
+        return None
+
+    def _next_episode(self) -> Optional[Tuple[str, _QueuedEpisode]]:
+        candidates = [experiment for experiment, queue in self._queues.items() if queue]
+        if not candidates:
+            return None
+        experiment = min(
+            candidates,
+            key=lambda exp: (self._running.get(exp, 0) / self._weights[exp], self._queues[exp][0].sort_key),
+        )
+        return experiment, heapq.heappop(self._queues[experiment])
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed and not any(self._queues.values()):
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # evaluated outside the lock: it may query the docker daemon
+            blocker = self._admission_blocker()
+            with self._cond:
+                if blocker is not None:
+                    if blocker != self._blocked_reason:
+                        self.logger.info(f"Episode admission paused: {blocker}")
+                    self._blocked_reason = blocker
+                    self._cond.wait(timeout=self.poll_interval)
+                    continue
+                self._blocked_reason = None
+                next_episode = self._next_episode()
+                if next_episode is None:
+                    continue
+                experiment, episode = next_episode
+                self._running[experiment] = self._running.get(experiment, 0) + 1
+            try:
+                future = self._executor.submit(episode.fn, *episode.args, **episode.kwargs)
+            except Exception as e:
+                # e.g. broken process pool: report the episode as failed
+                future = concurrent.futures.Future()
+                future.set_exception(e)
+            future.add_done_callback(
+                lambda future, experiment=experiment, tag=episode.tag: self._on_done(experiment, tag, future)
+            )
+
+    def _on_done(self, experiment: str, tag: Any, future: concurrent.futures.Future):
+        with self._cond:
+            self._running[experiment] -= 1
+            self._num_pending -= 1
+            self._done.append((tag, future))
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        if self._docker_client is not None:
+            self._docker_client.close()
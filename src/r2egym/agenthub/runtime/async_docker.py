@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import contextvars
+import threading
+import concurrent.futures
+
+from r2egym.agenthub import CMD_TIMEOUT
+from r2egym.agenthub.runtime.docker import DockerRuntime
+
+# upper bound on the number of docker / kubernetes calls in flight across all async episodes
+ASYNC_MAX_WORKERS = 256
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_async_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Shared, bounded executor that runs the blocking docker / kubernetes client calls."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=ASYNC_MAX_WORKERS, thread_name_prefix="r2egym-async"
+            )
+    return _executor
+
+
+async def run_blocking(fn, *args, executor=None, **kwargs):
+    """
+    Run a blocking call on the (shared) executor without blocking the event loop. The call
+    runs in a copy of the caller's context, so context variables (e.g. the episode's tracer)
+    are seen in the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor or get_async_executor(),
+        contextvars.copy_context().run,
+        functools.partial(fn, *args, **kwargs),
+    )
+
+
+##############################################################################
+# async docker runtime
+##############################################################################
+class AsyncDockerRuntime:
+    """
+    asyncio API over DockerRuntime.
+
+    The I/O methods (run, get_patch, apply_patch, copy_files_to_container, _calculate_reward, ...)
+    are coroutines; the blocking docker / kubernetes client calls are run on a shared bounded
+    thread pool so that one event loop can drive many concurrent episodes without a process
+    per episode. All other attributes (ds, docker_image, commit, ...) are read from the
+    wrapped runtime.
+
+    Usage:
+        runtime = await AsyncDockerRuntime.create(ds=ds, command=["/bin/bash", "-l"])
+        output, exit_code = await runtime.run("ls")
+        await runtime.close()
+    """
+
+    def __init__(self, runtime: DockerRuntime, executor=None):
+        self.runtime = runtime
+        self.executor = executor
+
+    @classmethod
+    async def create(cls, *args, executor=None, **kwargs) -> "AsyncDockerRuntime":
+        """Start (and set up) a DockerRuntime without blocking the event loop."""
+        runtime = await run_blocking(DockerRuntime, *args, executor=executor, **kwargs)
+        return cls(runtime, executor=executor)
+
+    def __getattr__(self, name):
+        return getattr(self.runtime, name)
+
+    async def _call(self, fn, *args, **kwargs):
+        return await run_blocking(fn, *args, executor=self.executor, **kwargs)
+
+    async def run(
+        self,
+        code: str,
+        timeout: int = CMD_TIMEOUT,
+        args: str = "",
+        workdir=None,
+        type: str = None,
+        spill_path: str = None,
+    ) -> tuple[str, str]:
+        return await self._call(
+            self.runtime.run,
+            code,
+            timeout=timeout,
+            args=args,
+            workdir=workdir,
+            type=type,
+            spill_path=spill_path,
+        )
+
+    async def copy_files_to_container(self, files: dict):
+        return await self._call(self.runtime.copy_files_to_container, files)
+
+    async def read_file(self, rel_file_path: str) -> str:
+        return await self._call(self.runtime.read_file, rel_file_path)
+
+    async def get_patch(self) -> str:
+        return await self._call(self.runtime.get_patch)
+
+    async def apply_patch(self, patch: str) -> tuple[str, str]:
+        return await self._call(self.runtime.apply_patch, patch)
+
+    async def reverse_patch(self, patch: str) -> tuple[str, str]:
+        return await self._call(self.runtime.reverse_patch, patch)
+
+    async def _calculate_reward(self, get_test_output=False, timeout: int = 300) -> float:
+        return await self._call(
+            self.runtime._calculate_reward, get_test_output=get_test_output, timeout=timeout
+        )
+
+    async def reset(self):
+        return await self._call(self.runtime.reset)
+
+    async def close(self):
+        return await self._call(self.runtime.close)
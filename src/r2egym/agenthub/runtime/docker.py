@@ -3,7 +3,6 @@ import json
 from time import sleep
 import time
 import uuid
-import tempfile
 import docker
 from docker.models.containers import Container
 
@@ -11,6 +10,9 @@ from r2egym.repo_analysis.execution_log_parser import parse_log_fn, decolor_dict
 from r2egym.agenthub.runtime.base import (
     ExecutionEnvironment,
 )
+from r2egym.agenthub.runtime.exec_session import DockerExecSession, KubernetesExecSession
+from r2egym.agenthub.runtime.reward_cache import RewardCache
+from r2egym.agenthub.runtime.output import StreamingOutput, read_spilled_output
 import base64
 import subprocess
 import datetime
@@ -21,9 +23,12 @@ import uuid
 import docker
 import kubernetes
 import tarfile
+import tempfile
 import io
 import os
+import socket
 from r2egym.agenthub.utils.log import get_logger
+from r2egym.agenthub.utils.tracing import trace_span, traced
 import re
 from r2egym.agenthub.utils.utils import match_dockerimage_to_repo
 from r2egym.agenthub import SUPPORTED_REPOS, SKIP_FILES, SKIP_FILES_NEW, CMD_TIMEOUT
@@ -44,6 +49,14 @@ from kubernetes import client, config, watch
 from kubernetes.stream import stream
 
 DEFAULT_NAMESPACE = "default"
+# labels put on every pod we create (used to find and garbage collect leaked pods)
+POD_MANAGED_LABEL = "r2egym/managed"
+# repository of the transient images that forked runtimes are started from
+FORK_REPOSITORY = "r2egym-fork"
+POD_HOST_LABEL = "r2egym/host"
+POD_PID_LABEL = "r2egym/pid"
+SETUP_SCRIPT_PATH = "/var/tmp/r2egym_setup_env.sh"
+SETUP_STEP_MARKER = "__R2E_SETUP_STEP__"
 DOCKER_PATH = "/root/.venv/bin:/root/.local/bin:/root/.cargo/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
 
 from swebench.harness.constants import (
@@ -69,6 +82,12 @@ from swebench.harness.log_parsers import MAP_REPO_TO_PARSER, get_eval_type
 from swebench.harness.grading import get_eval_tests_report, get_resolution_status
 
 
+def get_pod_owner_host() -> str:
+    """Hostname of this process, sanitized for use as a kubernetes label value."""
+    host = re.sub(r"[^A-Za-z0-9_.-]", "-", socket.gethostname())[:63]
+    return host.strip("-_.") or "unknown"
+
+
 ##############################################################################
 # Docker runtime
 ##############################################################################
@@ -89,6 +108,12 @@ class DockerRuntime(ExecutionEnvironment):
         command: str = "/bin/bash",
         logger=None,
         backend="docker",
+        checkpoint_image: str = None,  # post-setup snapshot to start from (skips setup_env)
+        use_exec_session: bool = False,  # run commands through one long-lived shell (exec socket / websocket)
+        tool_files: dict = None,  # tool files baked into a cached derived image (docker backend only)
+        pod_name: str = None,  # pre-provisioned pod to attach to (kubernetes backend only)
+        reward_cache: RewardCache = None,  # shared (image, patch) -> reward cache
+        max_output_len: int = None,  # stream command output, keeping only head + tail in memory (observations)
         **docker_kwargs,
     ):
         # check if ds is provided (required for all dockers moving forward)
@@ -131,6 +156,9 @@ class DockerRuntime(ExecutionEnvironment):
             )
             self.commit = ParsedCommit(**json.loads(self.commit_json))
         self.docker_kwargs = docker_kwargs
+        self.setup_report = []  # per-step status of the last setup_env run
+        self.reward_cache = reward_cache
+        self.max_output_len = max_output_len
         if logger is None:
             if self.backend == "docker":
                 logger_name = "DockerRuntime"
@@ -152,18 +180,40 @@ class DockerRuntime(ExecutionEnvironment):
                 config.load_kube_config()
             self.client = client.CoreV1Api()
 
+        # persistent shell session (created lazily on the first run)
+        self.use_exec_session = use_exec_session
+        self.exec_session = None
+
         # Start the container
         self.container = None
         self.container_name = self._get_container_name(self.docker_image)
         if self.backend == "kubernetes":
             # Generate a random UUID and truncate to 30 characters
-            self.container_name = str(uuid.uuid4())
+            self.container_name = pod_name or str(uuid.uuid4())
+        # derived image with setup_env + tools baked in (used automatically if it exists locally)
+        self.tool_image = None
+        self.tools_installed = False
+        self.fork_images = []  # transient fork images to remove on close (see fork)
+        if tool_files and self.backend == "docker" and not checkpoint_image:
+            self.tool_image = self.get_tool_image_name(tool_files)
+            if self._image_exists(self.tool_image):
+                self.logger.info(f"Using cached tool image: {self.tool_image}")
+                checkpoint_image = self.tool_image
+                self.tools_installed = True
+        self.checkpoint_image = checkpoint_image
         self.start_container(
-            self.docker_image, command, self.container_name, **docker_kwargs
+            checkpoint_image or self.docker_image,
+            command,
+            self.container_name,
+            **docker_kwargs,
         )
 
         # Initialize the environment
-        self.setup_env()
+        if checkpoint_image:
+            # container filesystem is already in its post-setup state
+            self.restore_env_state()
+        else:
+            self.setup_env()
         if self.backend == "kubernetes":
             self.logger.info("Kubernetes environment initialized")
         else:
@@ -180,64 +230,37 @@ class DockerRuntime(ExecutionEnvironment):
                 else "N/A"
             )
             self.logger.info("Pod Name: %s", pod_name)
+        # nothing has been run since setup (RepoEnv.reset can keep such a runtime)
+        self.pristine = True
 
     @staticmethod
     def _get_container_name(image_name: str) -> str:
         """Return name of container"""
         process_id = str(os.getpid())
         current_time = str(datetime.datetime.now())
-        unique_string = current_time + process_id
+        # uuid avoids collisions between containers started concurrently from threads
+        unique_string = current_time + process_id + str(uuid.uuid4())
         hash_object = hashlib.sha256(unique_string.encode())
         image_name_sanitized = image_name.replace("/", "-")
         image_name_sanitized = image_name_sanitized.replace(":", "-")
         return f"{image_name_sanitized}-{hash_object.hexdigest()[:10]}"
 
-    def _start_kubernetes_pod(
-        self, docker_image: str, command: str, pod_name: str, **docker_kwargs
-    ):
-        """
-        Starts or connects to a Kubernetes pod with the specified configuration.
-
-        If a pod with the given name already exists, it attempts to connect to it.
-        Otherwise, it creates a new pod based on the provided image, command,
-        and environment variables, then waits for it to reach the 'Running' state.
-
-        Args:
-            docker_image: The Docker image to use for the pod's container.
-            command: The command to run inside the container.
-            pod_name: The desired name for the Kubernetes pod.
-            **docker_kwargs: Additional keyword arguments. Currently used to extract
-                             'environment' variables for the pod spec.
-
-        Raises:
-            kubernetes.client.ApiException: If there's an error interacting with the
-                                           Kubernetes API (other than 404 Not Found
-                                           when checking existence).
-            RuntimeError: If the pod fails to reach the 'Running' state after creation.
-        """
-        not_found_error = None
-        try:
-            # Check if the pod already exists
-            self.container = self.client.read_namespaced_pod(
-                name=pod_name, namespace=DEFAULT_NAMESPACE, _request_timeout=60,
-            )
-            self.logger.info(f"Found existing Kubernetes pod: {pod_name}")
-            return
-        except client.ApiException as e:
-            not_found_error = e
-
-        if not_found_error.status != 404:
-            self.logger.error(
-                f"Error checking Kubernetes pod '{pod_name}' status: {not_found_error}. Check Kubernetes configuration and permissions."
-            )
-            raise not_found_error
-
-        env_vars = {"PATH": DOCKER_PATH, **docker_kwargs.get("environment", {})}
+    @staticmethod
+    def get_pod_body(docker_image: str, command, pod_name: str, environment: dict = None) -> dict:
+        """Pod spec for a runtime pod (also used by the PodProvisioner to create pods ahead of time)."""
+        env_vars = {"PATH": DOCKER_PATH, **(environment or {})}
         env_spec = [{"name": k, "value": str(v)} for k, v in env_vars.items()]
         pod_body = {
             "apiVersion": "v1",
             "kind": "Pod",
-            "metadata": {"name": pod_name},
+            "metadata": {
+                "name": pod_name,
+                "labels": {
+                    POD_MANAGED_LABEL: "true",
+                    POD_HOST_LABEL: get_pod_owner_host(),
+                    POD_PID_LABEL: str(os.getpid()),
+                },
+            },
             "spec": {
                 "restartPolicy": "Never",
                 "containers": [
@@ -266,36 +289,11 @@ class DockerRuntime(ExecutionEnvironment):
                 ],
             },
         }
+        return pod_body
 
-        # Create the Pod with retry logic & efficiently monitor with K8 Watch
-        max_retries = 5
-        backoff = 5  # seconds
-        pod = None
-        for attempt in range(1, max_retries + 1):
-            try:
-                pod = self.client.create_namespaced_pod(
-                    namespace=DEFAULT_NAMESPACE, body=pod_body, _request_timeout=120,
-                )
-                break  # success
-            except client.ApiException as e:
-                # Retry on API-server throttling or transient errors
-                if e.status in (409, 429, 500, 503):
-                    self.logger.warning(
-                        f"Transient Kubernetes error {e.status} while creating pod "
-                        f"'{pod_name}' (attempt {attempt}/{max_retries}); "
-                        f"retrying in {backoff}s"
-                    )
-                    time.sleep(backoff)
-                    backoff = min(backoff * 2, 60)
-                    continue
-                # Non-retryable error → propagate
-                self.logger.error(f"Failed to create Kubernetes pod '{pod_name}': {e}")
-                raise
-        else:
-            raise RuntimeError(
-                f"Exceeded retry limit ({max_retries}) while creating pod '{pod_name}'."
-            )
-
+    def _wait_for_pod(self, pod):
+        """Wait (watch) until `pod` is Running and attach to it as `self.container`."""
+        pod_name = pod.metadata.name
         try:
             rv = pod.metadata.resource_version
             w = watch.Watch()
@@ -347,6 +345,91 @@ class DockerRuntime(ExecutionEnvironment):
                 self.logger.error(f"Failed to check pod status after watch error: {status_error}")
                 raise RuntimeError(f"Failed to verify pod status: {status_error}")
 
+    def _start_kubernetes_pod(
+        self, docker_image: str, command: str, pod_name: str, **docker_kwargs
+    ):
+        """
+        Starts or connects to a Kubernetes pod with the specified configuration.
+
+        If a pod with the given name already exists, it attempts to connect to it.
+        Otherwise, it creates a new pod based on the provided image, command,
+        and environment variables, then waits for it to reach the 'Running' state.
+
+        Args:
+            docker_image: The Docker image to use for the pod's container.
+            command: The command to run inside the container.
+            pod_name: The desired name for the Kubernetes pod.
+            **docker_kwargs: Additional keyword arguments. Currently used to extract
+                             'environment' variables for the pod spec.
+
+        Raises:
+            kubernetes.client.ApiException: If there's an error interacting with the
+                                           Kubernetes API (other than 404 Not Found
+                                           when checking existence).
+            RuntimeError: If the pod fails to reach the 'Running' state after creation.
+        """
+        not_found_error = None
+        try:
+            # Check if the pod already exists
+            pod = self.client.read_namespaced_pod(
+                name=pod_name, namespace=DEFAULT_NAMESPACE, _request_timeout=60,
+            )
+            self.logger.info(f"Found existing Kubernetes pod: {pod_name}")
+            if pod.status.phase in ["Failed", "Succeeded", "Unknown"]:
+                raise RuntimeError(
+                    f"Kubernetes pod '{pod_name}' is in terminal phase '{pod.status.phase}'."
+                )
+            if pod.status.phase != "Running":
+                # pre-provisioned pod that is still being scheduled / pulled
+                self._wait_for_pod(pod)
+            else:
+                self.container = pod
+            return
+        except client.ApiException as e:
+            not_found_error = e
+
+        if not_found_error.status != 404:
+            self.logger.error(
+                f"Error checking Kubernetes pod '{pod_name}' status: {not_found_error}. Check Kubernetes configuration and permissions."
+            )
+            raise not_found_error
+
+        pod_body = self.get_pod_body(
+            docker_image, command, pod_name, docker_kwargs.get("environment", {})
+        )
+
+        # Create the Pod with retry logic & efficiently monitor with K8 Watch
+        max_retries = 5
+        backoff = 5  # seconds
+        pod = None
+        for attempt in range(1, max_retries + 1):
+            try:
+                pod = self.client.create_namespaced_pod(
+                    namespace=DEFAULT_NAMESPACE, body=pod_body, _request_timeout=120,
+                )
+                break  # success
+            except client.ApiException as e:
+                # Retry on API-server throttling or transient errors
+                if e.status in (409, 429, 500, 503):
+                    self.logger.warning(
+                        f"Transient Kubernetes error {e.status} while creating pod "
+                        f"'{pod_name}' (attempt {attempt}/{max_retries}); "
+                        f"retrying in {backoff}s"
+                    )
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                # Non-retryable error → propagate
+                self.logger.error(f"Failed to create Kubernetes pod '{pod_name}': {e}")
+                raise
+        else:
+            raise RuntimeError(
+                f"Exceeded retry limit ({max_retries}) while creating pod '{pod_name}'."
+            )
+
+        self._wait_for_pod(pod)
+
+    @traced("runtime.start_container")
     def start_container(
         self, docker_image: str, command: str, ctr_name: str, **docker_kwargs
     ):
@@ -361,6 +444,9 @@ class DockerRuntime(ExecutionEnvironment):
                     if self.container.status != "running":
                         self.container.start()
                 else:
+                    if not self._image_exists(docker_image):
+                        with trace_span("runtime.image_pull", image=docker_image):
+                            self.client.images.pull(docker_image)
                     self.container = self.client.containers.run(
                         docker_image,
                         command,
@@ -444,7 +530,11 @@ class DockerRuntime(ExecutionEnvironment):
                 )
                 raise e  # Re-raise unexpected errors
 
+    @traced("runtime.stop_container")
     def stop_container(self):
+        if self.exec_session is not None:
+            self.exec_session.close()
+            self.exec_session = None
         try:
             if self.container:
                 if self.backend == "docker":
@@ -469,72 +559,149 @@ class DockerRuntime(ExecutionEnvironment):
         )
         self.run(reset_command)
 
-    def setup_env_swesmith(self):
-        try:
-            commit_id = self.ds['base_commit']
-            self.run("git fetch")
-            self.run(f"git checkout {commit_id}")
-            # Setup the run_test.sh script for subsequent testing.  
-            test_command, _ = get_test_command(self.ds)
-            eval_script_content = "\n".join(
-                [
-                    "#!/bin/bash",
-                    "set -uxo pipefail",
-                    "source /opt/miniconda3/bin/activate",
-                    f"conda activate testbed",
-                    f"cd testbed/",
-                    f": '>>>>> Start Test Output'",
-                    test_command,
-                    f": '>>>>> End Test Output'",
-                ]
-            ) + "\n"
-            
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.sh') as temp_file:
-                temp_file.write(eval_script_content)
-                temp_file.flush()  # Ensure content is written to disk
-                temp_file_path = temp_file.name
-            
-            # Copy the file to container and clean up
-            self.copy_to_container(temp_file_path, "/run_tests.sh")
-            os.unlink(temp_file_path)  # Clean up the temporary file
-            
-            self.run("chmod +x /run_tests.sh")
+    def run_setup_script(
+        self, steps: list[tuple[str, str]], script_path: str = SETUP_SCRIPT_PATH
+    ) -> list[dict]:
+        """
+        Compile setup steps into a single shell script, copy it into the container once
+        and execute it once.
+
+        Every step runs as `timeout CMD_TIMEOUT <command>` from repo_path (same as `self.run`),
+        and reports its exit code and base64 encoded output on a marker line, so step
+        failures are still reported individually.
+
+        :param steps: list of (step name, shell command)
+        :return: per-step status report: [{"step", "command", "exit_code", "output"}]
+                 (exit_code is None if the step did not run)
+        """
+        lines = ["#!/bin/bash", f"cd {self.repo_path}"]
+        for idx, (_, command) in enumerate(steps):
+            lines.append(f"out=$( (timeout {CMD_TIMEOUT} {command}) 2>&1 )")
+            lines.append("code=$?")
+            lines.append(
+                f'printf "%s %d %d %s\\n" {SETUP_STEP_MARKER} {idx} "$code" '
+                f'"$(printf %s "$out" | base64 | tr -d \'\\n\')"'
+            )
+        lines.append('rm -f "$0"')
+        script_content = "\n".join(lines) + "\n"
+
+        self.copy_files_to_container({script_path: (script_content, 0o755)})
+        # full output: head / tail truncation (max_output_len) could cut the marker lines
+        output, _ = self._run_full_output(
+            f"bash {script_path}", timeout=CMD_TIMEOUT * max(len(steps), 1)
+        )
+
+        # parse the per-step status lines
+        results = {}
+        for line in output.splitlines():
+            if not line.startswith(SETUP_STEP_MARKER):
+                continue
+            parts = line.split(" ", 3)
+            try:
+                step_output = base64.b64decode(parts[3]).decode("utf-8", errors="replace") if len(parts) > 3 else ""
+                results[int(parts[1])] = (int(parts[2]), step_output)
+            except (ValueError, IndexError):  # binascii.Error is a ValueError
+                self.logger.error(f"Malformed setup status line: {line[:200]}")
+
+        report = []
+        for idx, (name, command) in enumerate(steps):
+            exit_code, step_output = results.get(idx, (None, ""))
+            if exit_code is None:
+                self.logger.error(f"Setup step '{name}' did not run: {command}")
+            elif exit_code != 0:
+                self.logger.error(
+                    f"Setup step '{name}' failed: Exit code {exit_code} \nError Message: {step_output}"
+                )
+            report.append(
+                {"step": name, "command": command, "exit_code": exit_code, "output": step_output}
+            )
+        self.setup_report = report
+        return report
 
+    def get_setup_steps_swesmith(self) -> list[tuple[str, str]]:
+        commit_id = self.ds['base_commit']
+        # Setup the run_test.sh script for subsequent testing.
+        test_command, _ = get_test_command(self.ds)
+        eval_script_content = "\n".join(
+            [
+                "#!/bin/bash",
+                "set -uxo pipefail",
+                "source /opt/miniconda3/bin/activate",
+                f"conda activate testbed",
+                f"cd testbed/",
+                f": '>>>>> Start Test Output'",
+                test_command,
+                f": '>>>>> End Test Output'",
+            ]
+        ) + "\n"
+        eval_script_b64 = base64.b64encode(eval_script_content.encode()).decode()
+        return [
+            ("git_fetch", "git fetch"),
+            ("git_checkout", f"git checkout {commit_id}"),
+            ("write_run_tests", f"sh -c 'echo {eval_script_b64} | base64 -d > /run_tests.sh'"),
+            ("chmod_run_tests", "chmod +x /run_tests.sh"),
             # Ensure can call and execute the tools in /usr/local/bin.
-            self.run(f"ln -s /opt/miniconda3/envs/testbed /root/.venv")
-            self.run('echo \'export PATH="/usr/local/bin:$PATH"\' >> ~/.bashrc')
-            self.run("python -m pip install chardet")
-        except Exception as e:
-            self.logger.error(f"Error setting up environment: {repr(e)}")
+            ("link_venv", f"ln -s /opt/miniconda3/envs/testbed /root/.venv"),
+            ("export_path", 'echo \'export PATH="/usr/local/bin:$PATH"\' >> ~/.bashrc'),
+            ("install_chardet", "python -m pip install chardet"),
+        ]
 
-    def setup_env_swebench(self):
-        try:
+    def get_setup_steps_swebench(self) -> list[tuple[str, str]]:
+        return [
             # make the run_tests.sh executable
-            self.run("chmod +x /run_tests.sh")
+            ("chmod_run_tests", "chmod +x /run_tests.sh"),
+            # make symlink of conda env to /root/.venv
+            ("link_venv", f"ln -s /opt/miniconda3/envs/testbed /root/.venv"),
+            # install required packages
+            ("install_chardet", "python -m pip install chardet"),
+        ]
 
-            # # move all skip files (if present) to /root
-            # for skip_file in SKIP_FILES:
-            #     self.run(f"mv {self.repo_path}/{skip_file} {self.alt_path}/{skip_file}")
-            self.alt_path = (
-                "/"  # the run_test is in the "/" directory for swebench dockers
+    def get_setup_steps_r2e(self) -> list[tuple[str, str]]:
+        steps = [
+            # create a symlink from repo_path/.venv to /root/.venv
+            ("link_venv", f"ln -s {self.repo_path}/.venv {self.alt_path}/.venv"),
+            ("link_python", f"ln -s {self.repo_path}/.venv/bin/python {self.alt_path}/.local/bin/python"),
+            ("link_python3", f"ln -s {self.repo_path}/.venv/bin/python {self.alt_path}/.local/bin/python3"),
+            (
+                "link_venv_bins",
+                f"find {self.repo_path}/.venv/bin -type f -executable -exec ln -sf {{}} {self.alt_path}/.local/bin/ \\;",
+            ),
+            # install required packages
+            ("install_chardet", "uv pip install chardet"),
+            ("delete_pyc", "find . -name '*.pyc' -delete"),
+            ("delete_pycache", "find . -name '__pycache__' -exec rm -rf {} +"),
+            # also delete pycache and pyc from /r2e_tests
+            ("delete_tests_pyc", "find /r2e_tests -name '*.pyc' -delete"),
+            ("delete_tests_pycache", "find /r2e_tests -name '__pycache__' -exec rm -rf {} +"),
+        ]
+        # move all skip files (if present) to /root
+        for skip_file in SKIP_FILES_NEW:
+            steps.append(
+                (f"hide_{skip_file}", f"mv {self.repo_path}/{skip_file} {self.alt_path}/{skip_file}")
             )
+        # r2e_tests are in the / directory, move them to /root
+        steps.append(("hide_r2e_tests_root", f"mv /r2e_tests {self.alt_path}/r2e_tests"))
+        # make a softlink for /root/r2e_tests (if present)
+        steps.append(("link_r2e_tests", f"ln -s {self.alt_path}/r2e_tests {self.repo_path}/r2e_tests"))
+        return steps
 
-            # make symlink of conda env to /root/.venv
-            self.run(f"ln -s /opt/miniconda3/envs/testbed /root/.venv")
-
-            # install required packages TODO: check if working
-            # self.run(
-            #     "python -m pip install tree-sitter==0.20.4 tree_sitter_languages==1.10.2"
-            # )
-            self.run("python -m pip install chardet")
-            # sudo apt-get install patchutils
-            # self.run("apt-get update")
-            # self.run("apt-get install -y patchutils")
+    def setup_env_swesmith(self):
+        try:
+            return self.run_setup_script(self.get_setup_steps_swesmith())
+        except Exception as e:
+            self.logger.error(f"Error setting up environment: {repr(e)}")
+
+    def setup_env_swebench(self):
+        # the run_test is in the "/" directory for swebench dockers
+        self.alt_path = "/"
+        try:
+            return self.run_setup_script(self.get_setup_steps_swebench())
         except Exception as e:
             self.logger.error(
                 f"Error setting up environment: {repr(e)} @ {self.docker_image}"
             )
 
+    @traced("runtime.setup_env")
     def setup_env(self):
         if self.swebench_verified:
             return self.setup_env_swebench()
@@ -542,52 +709,150 @@ class DockerRuntime(ExecutionEnvironment):
             return self.setup_env_swesmith()
 
         try:
-            # setup venv
-            # modify the repo path to a common path
-            # self.run(f"cp -r {self.repo_path} /workspace")
-
-            # create a symlink from repo_path/.venv to /root/.venv
-            self.run(f"ln -s {self.repo_path}/.venv {self.alt_path}/.venv")
-
-            self.run(
-                f"ln -s {self.repo_path}/.venv/bin/python {self.alt_path}/.local/bin/python"
-            )
-            self.run(
-                f"ln -s {self.repo_path}/.venv/bin/python {self.alt_path}/.local/bin/python3"
-            )
-            self.run(
-                f"find {self.repo_path}/.venv/bin -type f -executable -exec ln -sf {{}} {self.alt_path}/.local/bin/ \\;"
-            )
-            # print(self.run(f"ls -l {self.alt_path}/.local/bin"))
-
-            # self.run(f"mv {self.repo_path} /workspace")
-            # self.repo_path = "/workspace"
-
-            # install required packages
-            # self.run("uv pip install tree_sitter_languages") # remove since already installed in new dockers
+            return self.run_setup_script(self.get_setup_steps_r2e())
+        except Exception as e:
+            self.logger.error(f"Error setting up environment: {repr(e)}")
 
-            self.run("uv pip install chardet")
+    def get_setup_steps(self) -> list[tuple[str, str]]:
+        if self.swebench_verified:
+            return self.get_setup_steps_swebench()
+        elif self.swesmith:
+            return self.get_setup_steps_swesmith()
+        return self.get_setup_steps_r2e()
 
-            self.run("find . -name '*.pyc' -delete")
+    def get_tool_image_name(self, tool_files: dict) -> str:
+        """
+        Content-addressed name of the derived image for this base image with `tool_files`
+        (container path -> (content, mode)) and the setup_env changes baked in,
+        i.e. `<image>-r2egym-tools:<hash>`. Editing a tool file or a setup step changes the hash.
+        """
+        hasher = hashlib.sha256()
+        for path, (content, mode) in sorted(tool_files.items()):
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            hasher.update(f"{path}:{mode}:{len(content)}:".encode())
+            hasher.update(content)
+        hasher.update(json.dumps(self.get_setup_steps()).encode())
+        repository = re.sub(r"[^a-z0-9._/-]", "-", self.docker_image.lower())
+        return f"{repository}-r2egym-tools:{hasher.hexdigest()[:16]}"
+
+    def _image_exists(self, image: str) -> bool:
+        try:
+            self.client.images.get(image)
+            return True
+        except docker.errors.ImageNotFound:
+            return False
 
-            self.run("find . -name '__pycache__' -exec rm -rf {} +")
+    def save_tool_image(self, tool_files: dict) -> str | None:
+        """
+        Commit the current (freshly set-up, tools installed) container as the derived tool
+        image for `tool_files`, unless it already exists. Must be called before the agent
+        modifies the container. Only supported for the docker backend.
+        """
+        if self.backend != "docker":
+            return None
+        tool_image = self.get_tool_image_name(tool_files)
+        if self._image_exists(tool_image):
+            return tool_image
+        repository, tag = tool_image.rsplit(":", 1)
+        return self.commit_checkpoint(repository, tag)
+
+    def restore_env_state(self):
+        """
+        Restore the host-side runtime state that setup_env would have set,
+        for containers started from a post-setup checkpoint image.
+        """
+        if self.swebench_verified:
+            self.alt_path = "/"
 
-            # also delete pycache and pyc from /r2e_tests
-            self.run("find /r2e_tests -name '*.pyc' -delete")
-            self.run("find /r2e_tests -name '__pycache__' -exec rm -rf {} +")
+    @traced("runtime.commit_checkpoint")
+    def commit_checkpoint(self, repository: str, tag: str) -> str:
+        """
+        Commit the current container state as a checkpoint image.
+        Only supported for the docker backend.
 
-            # move all skip files (if present) to /root
-            for skip_file in SKIP_FILES_NEW:
-                self.run(f"mv {self.repo_path}/{skip_file} {self.alt_path}/{skip_file}")
+        :return: the checkpoint image reference (repository:tag)
+        """
+        assert self.backend == "docker", "Checkpoints are only supported for docker backend"
+        self.container.commit(repository=repository, tag=tag)
+        checkpoint_image = f"{repository}:{tag}"
+        self.logger.info(f"Committed checkpoint image: {checkpoint_image}")
+        return checkpoint_image
 
-            # r2e_tests are in the / directory, move them to /root
-            self.run(f"mv /r2e_tests {self.alt_path}/r2e_tests")
+    def snapshot(self) -> str:
+        """
+        Commit the current container state (setup point or mid-episode) as a transient
+        fork image. Only supported for the docker backend.
+        """
+        return self.commit_checkpoint(FORK_REPOSITORY, uuid.uuid4().hex[:16])
 
-            # make a softlink for /root/r2e_tests (if present)
-            self.run(f"ln -s {self.alt_path}/r2e_tests {self.repo_path}/r2e_tests")
-            # self.run(f"ln -s /r2e_tests {self.repo_path}/r2e_tests")
-        except Exception as e:
-            self.logger.error(f"Error setting up environment: {repr(e)}")
+    def from_snapshot(self, image: str, logger=None, remove_image_on_close: bool = False) -> "DockerRuntime":
+        """
+        New runtime with the same settings as this one, started from `image` (see `snapshot`).
+        Only the container filesystem is carried over: running processes and the state of the
+        exec session (cwd, exported variables) are not.
+        """
+        runtime = DockerRuntime(
+            ds=self.ds,
+            repo_path=self.repo_path,
+            alt_path=self.alt_path,
+            docker_image=self.docker_image,
+            command=self.command,
+            logger=logger,
+            backend=self.backend,
+            checkpoint_image=image,
+            use_exec_session=self.use_exec_session,
+            reward_cache=self.reward_cache,
+            max_output_len=self.max_output_len,
+            **self.docker_kwargs,
+        )
+        # host-side state of the source runtime (setup_env may have changed alt_path)
+        runtime.alt_path = self.alt_path
+        runtime.pristine = self.pristine
+        runtime.tool_image = self.tool_image
+        runtime.tools_installed = self.tools_installed
+        if remove_image_on_close:
+            runtime.fork_images.append(image)
+        return runtime
+
+    def fork(self, num_forks: int = 1, logger=None) -> list["DockerRuntime"]:
+        """
+        `num_forks` independent copies of this runtime in its current state: the container is
+        committed once and the copies are started from that image concurrently. The image is
+        removed when the last copy is closed. Only supported for the docker backend.
+        """
+        image = self.snapshot()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_forks) as executor:
+            futures = [
+                executor.submit(self.from_snapshot, image, logger, True)
+                for _ in range(num_forks)
+            ]
+            forks, errors = [], []
+            for future in futures:
+                try:
+                    forks.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            for runtime in forks:
+                runtime.close()
+            self.remove_image(image)
+            raise errors[0]
+        return forks
+
+    def remove_image(self, image: str) -> bool:
+        """Remove `image` unless a container still uses it (docker backend only)."""
+        if self.backend != "docker":
+            return False
+        try:
+            self.client.images.remove(image)
+            return True
+        except docker.errors.ImageNotFound:
+            return True
+        except docker.errors.APIError as e:
+            # still in use by a sibling fork, the last one to close removes it
+            self.logger.debug(f"Keeping image {image}: {repr(e)}")
+            return False
 
     def get_task_instruction(self) -> str:
         # try getting the content inside of [ISSUE] [/ISSUE] using regex tags for ds['problem_statement'] else return ds['problem_statement']
@@ -597,62 +862,83 @@ class DockerRuntime(ExecutionEnvironment):
         except Exception as e:
             return self.ds["problem_statement"]
 
+    def _exec_kubernetes(
+        self, full_command: list[str], timeout: float, collector: StreamingOutput = None
+    ) -> tuple[str, int]:
+        """
+        Single-shot exec in the pod. Reads are driven by the websocket (each `update` returns as
+        soon as a frame arrives) and bounded by an overall deadline, instead of a fixed poll interval.
+        Raises concurrent.futures.TimeoutError if the command does not finish within `timeout` seconds.
+        If a `collector` is given, output is streamed into it (and the returned output is empty).
+        """
+        resp = stream(
+            self.client.connect_get_namespaced_pod_exec,
+            self.container_name,
+            DEFAULT_NAMESPACE,
+            command=full_command,
+            stderr=True,
+            stdin=False,
+            stdout=True,
+            tty=False,  # Match docker exec_run settings
+            _preload_content=False,  # Important for streaming
+        )
+        deadline = time.time() + timeout
+        # Read until the command exits, keeping stdout/stderr interleaved
+        combined_chunks = []
+        try:
+            while resp.is_open():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise concurrent.futures.TimeoutError()
+                resp.update(timeout=remaining)
+                for peek, read in (
+                    (resp.peek_stdout, resp.read_stdout),
+                    (resp.peek_stderr, resp.read_stderr),
+                ):
+                    if peek():
+                        chunk = read()
+                        if collector is not None:
+                            collector.write(chunk)
+                        else:
+                            combined_chunks.append(chunk)
+        finally:
+            resp.close()
+        return "".join(combined_chunks), resp.returncode
+
     def _run_kubernetes(
         self,
         code: str,
         timeout: int = CMD_TIMEOUT,
         args: str = "",
         workdir: str = "",
+        spill_path: str = None,
     ) -> tuple[str, str]:
         """
         Kubernetes-specific method to execute code or commands in the pod, with a timeout.
         Mirrors the logic of the original Docker `run` method using Kubernetes API.
         """
-        # Command includes 'timeout' and potentially 'cd <workdir> &&' from the main run method
-        command = ""
-        if workdir:
-            # Use '&&' so that failure to change directory aborts the command
-            command += f"cd {workdir} && "
-        command += f"timeout {timeout} {code} {args}"
-        full_command = ["/bin/sh", "-c", command]
+        command = f"timeout {timeout} {code} {args}"
+        collector = self._get_output_collector(spill_path)
         try:
-            # Define the exec function call within a lambda for the executor
-            def execute_command():
-                resp = stream(
-                    self.client.connect_get_namespaced_pod_exec,
-                    self.container_name,
-                    DEFAULT_NAMESPACE,
-                    command=full_command,
-                    stderr=True,
-                    stdin=False,
-                    stdout=True,
-                    tty=False,  # Match docker exec_run settings
-                    _preload_content=False,  # Important for streaming
-                )
-                # Read until the command exits, accumulating each channel
-                combined_chunks = []
-                stdout_chunks = []
-                stderr_chunks = []
-                while resp.is_open():
-                    resp.update(timeout=1)  # wait for data
-                    if resp.peek_stdout():
-                        chunk = resp.read_stdout()
-                        stdout_chunks.append(chunk)
-                        combined_chunks.append(chunk)
-                    if resp.peek_stderr():
-                        chunk = resp.read_stderr()
-                        stderr_chunks.append(chunk)
-                        combined_chunks.append(chunk)
-                resp.close()
-                exit_code = resp.returncode
-                combined_output = "".join(combined_chunks)
-                return combined_output, exit_code
-
-            # Execute with an overall timeout slightly larger than the command's timeout
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(execute_command)
-                # Use timeout+10 as a buffer for k8s comms
-                combined_output, exit_code = future.result(timeout=timeout + 5)
+            session_result = (
+                None if collector else self._run_exec_session(command, workdir or "/", timeout)
+            )
+            if session_result is not None:
+                output, exit_code = session_result
+                combined_output = output.decode("utf-8", errors="replace")
+            else:
+                if workdir:
+                    # Use '&&' so that failure to change directory aborts the command
+                    command = f"cd {workdir} && " + command
+                try:
+                    combined_output, exit_code = self._exec_kubernetes(
+                        ["/bin/sh", "-c", command], timeout=timeout + 5, collector=collector
+                    )
+                finally:
+                    if collector is not None:
+                        collector.close()
+                if collector is not None:
+                    combined_output = collector.getvalue()
 
             # Process results - combined_output already preserves inter-leaved stdout/stderr
             output = combined_output
@@ -686,6 +972,84 @@ class DockerRuntime(ExecutionEnvironment):
             self.logger.error(f"Unexpected error during Kubernetes exec: {repr(e)}")
             return f"Error: {repr(e)}", "-1"
 
+    def _get_output_collector(self, spill_path: str = None) -> StreamingOutput | None:
+        """Bounded output collector for streaming mode (None: buffer the whole output as usual)."""
+        if not self.max_output_len and not spill_path:
+            return None
+        max_output_len = self.max_output_len or sys.maxsize
+        return StreamingOutput(
+            head_size=max_output_len // 2,
+            tail_size=max_output_len - max_output_len // 2,
+            spill_path=spill_path,
+        )
+
+    def _exec_run_streaming(self, command: str, workdir: str, collector: StreamingOutput) -> int:
+        """exec the command, streaming its (combined) output into `collector`; returns the exit code."""
+        exec_id = self.client.api.exec_create(
+            self.container.id,
+            ["/bin/sh", "-c", command],
+            stdout=True,
+            stderr=True,
+            workdir=workdir,
+            environment={"PATH": DOCKER_PATH},
+        )["Id"]
+        try:
+            for chunk in self.client.api.exec_start(exec_id, stream=True):
+                collector.write(chunk)
+        finally:
+            collector.close()
+        return self.client.api.exec_inspect(exec_id)["ExitCode"]
+
+    def _run_full_output(self, code: str, timeout: int = CMD_TIMEOUT) -> tuple[str, str]:
+        """
+        `run` for commands whose output is parsed (test logs, patches, files), never truncated:
+        head / tail truncation is only for observations shown to the agent. In streaming mode
+        the output is spilled to a compressed file on the host and read back from there.
+        """
+        if not self.max_output_len:
+            return self.run(code, timeout=timeout)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            spill_path = os.path.join(tmp_dir, "output.log.gz")
+            output, error_code = self.run(code, timeout=timeout, spill_path=spill_path)
+            if error_code != "-1" and os.path.exists(spill_path):
+                output = read_spilled_output(spill_path)
+        return output, error_code
+
+    def _run_exec_session(
+        self, command: str, workdir: str, timeout: int
+    ) -> tuple[bytes, int] | None:
+        """
+        Run a command through the persistent shell session (if enabled).
+        Returns None when the caller should fall back to a single-shot exec, i.e. the
+        session is disabled, busy with a concurrent command, or could not be (re)opened.
+        """
+        if not self.use_exec_session or self.container is None:
+            return None
+        if self.exec_session is None:
+            if self.backend == "kubernetes":
+                self.exec_session = KubernetesExecSession(
+                    self.client, self.container_name, DEFAULT_NAMESPACE, logger=self.logger
+                )
+            else:
+                self.exec_session = DockerExecSession(
+                    self.client.api,
+                    self.container.id,
+                    environment={"PATH": DOCKER_PATH},
+                    logger=self.logger,
+                )
+        if not self.exec_session.lock.acquire(blocking=False):
+            return None
+        try:
+            return self.exec_session.run(command, workdir, timeout=timeout + 5)
+        except concurrent.futures.TimeoutError:
+            # the command may have had side effects, so do not re-run it
+            raise
+        except (ConnectionError, OSError, docker.errors.APIError, client.ApiException) as e:
+            self.logger.warning(f"Exec session failed, falling back to a single exec: {repr(e)}")
+            return None
+        finally:
+            self.exec_session.lock.release()
+
     def run(
         self,
         code: str,
@@ -693,6 +1057,7 @@ class DockerRuntime(ExecutionEnvironment):
         args: str = "",
         workdir=None,
         type: str = None,
+        spill_path: str = None,
     ) -> tuple[str, str]:
         """
         General method to execute code or commands in the container, with a timeout.
@@ -700,32 +1065,51 @@ class DockerRuntime(ExecutionEnvironment):
         :param code: The code or command to execute.
         :param args: Arguments to pass to the code/script.
         :param workdir: The working directory inside the container (optional).
+        :param spill_path: Also write the full (ANSI stripped) output to this gzip file on the host (streaming mode).
         :return: A tuple containing (output, error_message). If no error, error_message is the exit code (str).
         """
         exec_code = code
         exec_workdir = self.repo_path if workdir is None else workdir
+        self.pristine = False
 
         if self.backend == "kubernetes":
-            return self._run_kubernetes(exec_code, timeout, args, workdir=exec_workdir)
+            return self._run_kubernetes(
+                exec_code, timeout, args, workdir=exec_workdir, spill_path=spill_path
+            )
 
         command = f"timeout {timeout} {exec_code} {args}"
+        collector = self._get_output_collector(spill_path)
         try:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                # Notice we do NOT set tty=True here
-                future = executor.submit(
-                    self.container.exec_run,
-                    cmd=["/bin/sh", "-c", command],
-                    # cmd=command,
-                    workdir=exec_workdir,
-                    stdout=True,
-                    stderr=True,
-                    environment={"PATH": DOCKER_PATH},
-                )
-                exec_result = future.result(timeout=timeout + 5)
+            session_result = (
+                None if collector else self._run_exec_session(command, exec_workdir, timeout)
+            )
+            if collector is not None:
+                # stream the output, keeping only its head and tail in memory
+                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                    future = executor.submit(
+                        self._exec_run_streaming, command, exec_workdir, collector
+                    )
+                    error_code = future.result(timeout=timeout + 5)
+                output = collector.getvalue().encode()
+            elif session_result is not None:
+                output, error_code = session_result
+            else:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                    # Notice we do NOT set tty=True here
+                    future = executor.submit(
+                        self.container.exec_run,
+                        cmd=["/bin/sh", "-c", command],
+                        # cmd=command,
+                        workdir=exec_workdir,
+                        stdout=True,
+                        stderr=True,
+                        environment={"PATH": DOCKER_PATH},
+                    )
+                    exec_result = future.result(timeout=timeout + 5)
+                output, error_code = exec_result.output, exec_result.exit_code
 
             # Retrieve output and exit code
-            output = exec_result.output.decode("utf-8", errors="replace")
-            error_code = exec_result.exit_code
+            output = output.decode("utf-8", errors="replace")
 
             if error_code == 124:
                 self.logger.error(f"Internal Timeout: {timeout}s")
@@ -785,17 +1169,10 @@ class DockerRuntime(ExecutionEnvironment):
         except Exception as e:
             return f"Error: {repr(e)}", f"Error: {repr(e)}", "-1"
 
-    def _copy_to_container_kubernetes(self, src_path: str, dest_path: str):
+    def _put_archive_kubernetes(self, dest_dir: str, tar_data: bytes):
         """
-        Copy a file or directory from host into Kubernetes pod using tar over exec.
+        Extract an in-memory tarball into `dest_dir` of the Kubernetes pod using tar over exec.
         """
-        # Calculate destination directory and prepare in-memory tarball
-        dest_dir = os.path.dirname(dest_path)
-        tar_stream = io.BytesIO()
-        with tarfile.open(fileobj=tar_stream, mode="w") as tar:
-            tar.add(src_path, arcname=os.path.basename(dest_path))
-        tar_stream.seek(0)
-
         # Retry with exponential backoff
         max_retries = 5
         retry_delay = 5  # Initial delay in seconds
@@ -815,7 +1192,7 @@ class DockerRuntime(ExecutionEnvironment):
                     _preload_content=False,
                 )
                 # Stream the tar binary data into the pod
-                resp.write_stdin(tar_stream.read())
+                resp.write_stdin(tar_data)
                 resp.close()
                 break  # Success, exit the retry loop
             except Exception as e:
@@ -824,15 +1201,35 @@ class DockerRuntime(ExecutionEnvironment):
                     time.sleep(retry_delay)
                     retry_delay *= 2  # Exponential backoff
                     retry_delay = min(retry_delay, 60)
-                    tar_stream.seek(0)  # Reset the stream for the next attempt
                 else:
                     self.logger.error(f"Copy to container failed after {max_retries} attempts: {str(e)}")
                     raise
 
+    def _put_archive(self, dest_dir: str, tar_data: bytes):
+        """
+        Extract an in-memory tarball into `dest_dir` of the container (Docker or Kubernetes).
+        """
+        self.pristine = False
+        if self.backend == "docker":
+            self.container.put_archive(dest_dir, tar_data)
+        else:
+            self._put_archive_kubernetes(dest_dir, tar_data)
+
+    def _copy_to_container_kubernetes(self, src_path: str, dest_path: str):
+        """
+        Copy a file or directory from host into Kubernetes pod using tar over exec.
+        """
+        # Calculate destination directory and prepare in-memory tarball
+        tar_stream = io.BytesIO()
+        with tarfile.open(fileobj=tar_stream, mode="w") as tar:
+            tar.add(src_path, arcname=os.path.basename(dest_path))
+        self._put_archive_kubernetes(os.path.dirname(dest_path), tar_stream.getvalue())
+
     def copy_to_container(self, src_path: str, dest_path: str):
         """
         Copies a file or directory from the host into the container (Docker or Kubernetes).
         """
+        self.pristine = False
         if self.backend == "docker":
             tar_stream = io.BytesIO()
             with tarfile.open(fileobj=tar_stream, mode="w") as tar:
@@ -843,13 +1240,36 @@ class DockerRuntime(ExecutionEnvironment):
             # Kubernetes pod copy
             return self._copy_to_container_kubernetes(src_path, dest_path)
 
+    @traced("runtime.copy_files")
+    def copy_files_to_container(self, files: dict[str, bytes | str | tuple[bytes | str, int]]):
+        """
+        Copies multiple in-memory files into the container with a single upload
+        (one `put_archive` call for Docker, one tar stream for Kubernetes). No host temp files are used.
+
+        :param files: mapping of absolute container path -> content or (content, mode).
+                      Content may be bytes or str (utf-8 encoded); mode defaults to 0o644.
+        """
+        tar_stream = io.BytesIO()
+        mtime = time.time()
+        with tarfile.open(fileobj=tar_stream, mode="w") as tar:
+            for dest_path, value in files.items():
+                content, mode = value if isinstance(value, tuple) else (value, 0o644)
+                if isinstance(content, str):
+                    content = content.encode("utf-8")
+                info = tarfile.TarInfo(name=os.path.normpath(dest_path).lstrip("/"))
+                info.size = len(content)
+                info.mode = mode
+                info.mtime = mtime
+                tar.addfile(info, io.BytesIO(content))
+        self._put_archive("/", tar_stream.getvalue())
+
     @DeprecationWarning  # TODO: remove dependency on this method with new dockers
     def read_file(self, rel_file_path: str) -> str:
-        output, _ = self.run(f"cat /{self.alt_path}/{rel_file_path}")
+        output, _ = self._run_full_output(f"cat /{self.alt_path}/{rel_file_path}")
         return output
 
     def run_tests(self, timeout: int = 300) -> tuple[str, str]:
-        output, error_code = self.run(f"bash {self.alt_path}/run_tests.sh", timeout=timeout)
+        output, error_code = self._run_full_output(f"bash {self.alt_path}/run_tests.sh", timeout=timeout)
         # Remove ANSI escape codes and \r characters
         output = re.sub(r"\x1b\[[0-9;]*m|\r", "", output)
         return output, error_code
@@ -873,45 +1293,30 @@ class DockerRuntime(ExecutionEnvironment):
         """
         # git add -A && git diff --cached
         # self.run("git add -A")
-        output, _ = self.run("git add -A && git diff --cached")
+        output, _ = self._run_full_output("git add -A && git diff --cached")
         # output, _ = self.run("git diff")
         return output
 
     def create_file(self, file_path: str, content: str) -> tuple[str, str]:
-        # create a local file with the content
-        uuid_ = uuid.uuid4()
-        file_path_ = f"{file_path}_{uuid_}"
-        file_path__ = os.path.join("/tmp", file_path_)
-        with open(file_path__, "w") as f:
-            f.write(content)
-        # copy the file to the container
-        self.copy_to_container(file_path__, f"/testbed/{file_path_}")
-        self.run(f"mv /testbed/{file_path_} /{file_path}")
+        # upload the content directly to its destination (no host temp file)
+        self.copy_files_to_container({os.path.join("/", file_path): content})
+
+    def _upload_patch(self, patch: str) -> str:
+        # store the patch in the container in a file identifiable by docker container id and uuid
+        patch_path = f"/tmp/{self.container_name}_{uuid.uuid4()}.patch"
+        self.copy_files_to_container({patch_path: patch})
+        return patch_path
 
     def apply_patch(self, patch: str) -> tuple[str, str]:
-        # store the patch locally in a file identifiable by docker container id and timestamp
-        # must contain unique patch name with both timestamp and docker image name
-        uuid_ = uuid.uuid4()
-        patch_path = f"{self.container_name}_{uuid_}.patch"
-        patch_path = os.path.join("/tmp", patch_path)
-        with open(patch_path, "w") as f:
-            f.write(patch)
-        # copy the patch to / of the container
-        self.copy_to_container(patch_path, f"/{patch_path}")
+        patch_path = self._upload_patch(patch)
         # apply the patch
-        output, error_code = self.run(f"git apply --whitespace=fix /{patch_path}")
+        output, error_code = self.run(f"git apply --whitespace=fix {patch_path}")
         return output, error_code
 
     def reverse_patch(self, patch: str) -> tuple[str, str]:
-        # store the patch locally in a file identifiable by docker container id and timestamp
-        patch_path = f"{self.container_name}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.patch"
-        patch_path = os.path.join("/tmp", patch_path)
-        with open(patch_path, "w") as f:
-            f.write(patch)
-        # copy the patch to / of the container
-        self.copy_to_container(patch_path, f"/{patch_path}")
-        # apply the patch
-        output, error_code = self.run(f"git apply -R /{patch_path}")
+        patch_path = self._upload_patch(patch)
+        # reverse apply the patch
+        output, error_code = self.run(f"git apply -R {patch_path}")
         return output, error_code
 
     def get_logs_eval(
@@ -962,6 +1367,7 @@ class DockerRuntime(ExecutionEnvironment):
         self.logger.info(f"using swebench log_parser for repo: {repo}")
         return log_parser(content, test_spec), True
 
+    @traced("runtime.parse_logs")
     def parse_logs(self, log_output: str) -> dict:
         if self.swebench_verified:
             parsed_output, patch_apply_success = self.get_logs_eval(
@@ -973,7 +1379,7 @@ class DockerRuntime(ExecutionEnvironment):
     
     def _calculate_reward_swesmith(self, get_test_output=False, timeout: int = 300) -> float:
         self.reset_swesmith_tests()
-        output, error_msg = self.run("/run_tests.sh", timeout=timeout)
+        output, error_msg = self._run_full_output("/run_tests.sh", timeout=timeout)
         parse = self.parse_logs(output)
         
         fail2pass = [ ".".join(line.split("::")[1:]) for line in self.ds['FAIL_TO_PASS']]
@@ -1011,7 +1417,7 @@ class DockerRuntime(ExecutionEnvironment):
     def _calculate_reward_swebench(self, get_test_output=False, timeout: int = 300) -> float:
         # gt_test_patch = self.commit.get_patch(test_file=True,non_test_file=False)
         # self.apply_patch(gt_test_patch)
-        out, _ = self.run(
+        out, _ = self._run_full_output(
             "/run_tests.sh", timeout=timeout
         )  # run the tests after applying the patch
         eval_status_map, found = self.get_logs_eval(self.test_spec, out)
@@ -1065,7 +1471,49 @@ class DockerRuntime(ExecutionEnvironment):
             return reward, output
         return reward
 
+    def _format_reward(self, reward, output, get_test_output: bool):
+        # same return types as the uncached _calculate_reward_* methods
+        if self.swesmith:
+            return float(reward)
+        if self.swebench_verified:
+            return (bool(reward), output) if get_test_output else int(reward)
+        return (float(reward), output) if get_test_output else float(reward)
+
+    @traced("runtime.reward")
     def _calculate_reward(self, get_test_output=False, timeout: int = 300) -> float:
+        """
+        Compute the reward for the current repository state. With a reward cache configured,
+        the result for (image, normalized patch) is reused when it was already computed, by this
+        or any other process sharing the cache.
+        """
+        if self.reward_cache is None:
+            return self._calculate_reward_uncached(get_test_output=get_test_output, timeout=timeout)
+
+        # full binary diff: text diffs of different binary changes are all "Binary files differ"
+        patch, error_code = self._run_full_output("git add -A && git diff --cached --binary")
+        if error_code != "0":
+            self.logger.warning(f"Reward cache skipped, could not get the patch: {patch}")
+            return self._calculate_reward_uncached(get_test_output=get_test_output, timeout=timeout)
+        cached = self.reward_cache.get(self.docker_image, patch)
+        if cached is not None and (cached.output is not None or not get_test_output or self.swesmith):
+            self.logger.info(f"Reward cache hit for {self.docker_image}: {cached.reward}")
+            return self._format_reward(cached.reward, cached.output, get_test_output)
+
+        result = self._calculate_reward_uncached(get_test_output=True, timeout=timeout)
+        reward, output = result if isinstance(result, tuple) else (result, None)
+        # do not cache timeouts / exec errors
+        if output is None or not output.startswith(("The command took too long", "Error:")):
+            test_map = None
+            if output is not None:
+                try:
+                    test_map = self.parse_logs(output)
+                except Exception as e:
+                    self.logger.warning(f"Could not parse test output for the reward cache: {repr(e)}")
+            self.reward_cache.put(self.docker_image, patch, reward, output, test_map)
+        return self._format_reward(reward, output, get_test_output)
+
+    @traced("runtime.reward_tests")
+    def _calculate_reward_uncached(self, get_test_output=False, timeout: int = 300) -> float:
         if self.swebench_verified:
             return self._calculate_reward_swebench(get_test_output=get_test_output, timeout=timeout)
         elif self.swesmith:
@@ -1082,6 +1530,8 @@ class DockerRuntime(ExecutionEnvironment):
     def close(self):
         self.stop_container()
         if self.backend == "docker":
+            for image in self.fork_images:
+                self.remove_image(image)
             self.client.close()
 
     def run_swebv_regression(
@@ -1092,15 +1542,13 @@ class DockerRuntime(ExecutionEnvironment):
         if run_tests_regression is None:
             run_tests_regression = self.ds["run_tests_regression"]
 
-        with tempfile.NamedTemporaryFile("w") as f:
-            f.write(run_tests_regression)
-            f.flush()
-            self.copy_to_container(f.name, "/run_tests_regression.sh")
-        # make the script executable
-        self.run("chmod +x /run_tests_regression.sh")
+        # copy the script as executable
+        self.copy_files_to_container(
+            {"/run_tests_regression.sh": (run_tests_regression, 0o755)}
+        )
 
         # run the regression tests
-        output, error_code = self.run("/run_tests_regression.sh", timeout=timeout)
+        output, error_code = self._run_full_output("/run_tests_regression.sh", timeout=timeout)
         return output
         # return swebench_parse(self.ds, output)
 
@@ -1116,7 +1564,7 @@ class DockerRuntime(ExecutionEnvironment):
             "git config --global user.email 'you@example.com'"
         )
         output, error_code = self.run("git config --global user.name 'Your Name'")
-        output, error_code = self.run("git rev-parse HEAD")
+        output, error_code = self._run_full_output("git rev-parse HEAD")
         self.current_commit = output.strip()
         return output, error_code
 
@@ -1132,7 +1580,7 @@ class DockerRuntime(ExecutionEnvironment):
         return output, error_code
 
     def get_current_commit_hash(self) -> str:
-        output, _ = self.run("git rev-parse HEAD")
+        output, _ = self._run_full_output("git rev-parse HEAD")
         return output.strip()
 
     def soft_git_reset(self) -> tuple[str, str]:
@@ -0,0 +1,237 @@
+import time
+import uuid
+import base64
+import socket
+import struct
+import threading
+import concurrent.futures
+
+import websocket
+from kubernetes.stream import stream
+
+from r2egym.agenthub.utils.log import get_logger
+
+
+##############################################################################
+# persistent exec session (shared line protocol)
+##############################################################################
+class ExecSession:
+    """
+    Long-lived `/bin/sh` inside a container / pod, attached over a single exec stream.
+
+    Every command is sent to the same shell and its output is delimited by a per-session
+    sentinel line carrying the exit code, so running a command costs one round-trip on an
+    already open stream instead of setting up a new exec for every command.
+
+    Each command is run as `/bin/sh -c <command>` in a subshell (decoded from base64 so
+    quoting / multi-line commands behave exactly like a regular exec), with stdin from
+    /dev/null and stderr merged into stdout.
+
+    Subclasses implement the transport: `open`, `close`, `_send` and `_read_chunk`.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = get_logger(type(self).__name__) if logger is None else logger
+        self.marker = f"__R2E_EXIT_{uuid.uuid4().hex}__".encode()
+        self.lock = threading.Lock()
+        self._buffer = b""
+
+    @property
+    def is_open(self) -> bool:
+        raise NotImplementedError
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def _send(self, data: bytes):
+        raise NotImplementedError
+
+    def _read_chunk(self, deadline: float) -> bytes:
+        """Block until output is available (or `deadline` passes) and return it."""
+        raise NotImplementedError
+
+    def _has_result(self) -> bool:
+        idx = self._buffer.find(self.marker)
+        return idx != -1 and b"\n" in self._buffer[idx:]
+
+    def run(self, command: str, workdir: str, timeout: float) -> tuple[bytes, int]:
+        """
+        Execute `command` in `workdir` and return (raw output, exit code).
+
+        Raises concurrent.futures.TimeoutError if no result arrives within `timeout`
+        seconds; the session is closed in that case since its state is unknown.
+        """
+        if not self.is_open:
+            self.open()
+
+        encoded = base64.b64encode(command.encode()).decode()
+        line = (
+            f'(cd {workdir} && /bin/sh -c "$(echo {encoded} | base64 -d)") </dev/null 2>&1; '
+            f"printf '%s %d\\n' {self.marker.decode()} $?\n"
+        )
+        deadline = time.time() + timeout
+        try:
+            self._send(line.encode())
+            while not self._has_result():
+                self._buffer += self._read_chunk(deadline)
+        except Exception:
+            self.close()
+            raise
+
+        idx = self._buffer.index(self.marker)
+        output = self._buffer[:idx]
+        status, _, rest = self._buffer[idx + len(self.marker) :].partition(b"\n")
+        self._buffer = rest
+        return output, int(status.strip())
+
+
+##############################################################################
+# persistent docker exec session
+##############################################################################
+class DockerExecSession(ExecSession):
+    """ExecSession over a raw docker exec socket (multiplexed stdout/stderr frames)."""
+
+    def __init__(self, api_client, container_id: str, environment: dict = None, logger=None):
+        super().__init__(logger=logger)
+        self.api = api_client
+        self.container_id = container_id
+        self.environment = environment or {}
+        self._sock = None
+        self._socket_io = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._sock is not None
+
+    def open(self):
+        exec_id = self.api.exec_create(
+            self.container_id,
+            ["/bin/sh"],
+            stdin=True,
+            stdout=True,
+            stderr=True,
+            tty=False,
+            environment=self.environment,
+        )["Id"]
+        self._socket_io = self.api.exec_start(exec_id, socket=True)
+        # exec_start returns a SocketIO wrapper around the raw socket
+        self._sock = getattr(self._socket_io, "_sock", self._socket_io)
+        self._buffer = b""
+
+    def close(self):
+        if self._sock is None:
+            return
+        try:
+            self._sock.sendall(b"exit\n")
+        except Exception:
+            pass
+        try:
+            self._socket_io.close()
+            self._sock.close()
+        except Exception:
+            pass
+        self._sock = None
+        self._socket_io = None
+        self._buffer = b""
+
+    def _send(self, data: bytes):
+        self._sock.sendall(data)
+
+    def _recv_exactly(self, n: int, deadline: float) -> bytes:
+        data = b""
+        while len(data) < n:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise concurrent.futures.TimeoutError()
+            self._sock.settimeout(remaining)
+            try:
+                chunk = self._sock.recv(n - len(data))
+            except socket.timeout:
+                raise concurrent.futures.TimeoutError()
+            if not chunk:
+                raise ConnectionError("Docker exec session closed unexpectedly")
+            data += chunk
+        return data
+
+    def _read_chunk(self, deadline: float) -> bytes:
+        # multiplexed stream (tty=False): 8 byte header [stream, 0, 0, 0, size(4 bytes, big endian)]
+        header = self._recv_exactly(8, deadline)
+        _, size = struct.unpack(">BxxxL", header)
+        return self._recv_exactly(size, deadline)
+
+
+##############################################################################
+# persistent kubernetes exec session
+##############################################################################
+class KubernetesExecSession(ExecSession):
+    """
+    ExecSession over a single kubernetes exec websocket (`connect_get_namespaced_pod_exec`
+    with stdin attached), so a command does not pay for a new websocket handshake.
+    Reads block on the websocket until data arrives (no fixed polling interval).
+    """
+
+    def __init__(self, core_api, pod_name: str, namespace: str, logger=None):
+        super().__init__(logger=logger)
+        self.api = core_api
+        self.pod_name = pod_name
+        self.namespace = namespace
+        self._resp = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._resp is not None
+
+    def open(self):
+        self._resp = stream(
+            self.api.connect_get_namespaced_pod_exec,
+            self.pod_name,
+            self.namespace,
+            command=["/bin/sh"],
+            stderr=True,
+            stdin=True,
+            stdout=True,
+            tty=False,
+            _preload_content=False,
+        )
+        self._buffer = b""
+
+    def close(self):
+        if self._resp is None:
+            return
+        try:
+            self._resp.write_stdin("exit\n")
+        except Exception:
+            pass
+        try:
+            self._resp.close()
+        except Exception:
+            pass
+        self._resp = None
+        self._buffer = b""
+
+    def _send(self, data: bytes):
+        try:
+            self._resp.write_stdin(data.decode())
+        except websocket.WebSocketException as e:
+            # e.g. the websocket was closed by the other side
+            raise ConnectionError(f"Kubernetes exec session closed unexpectedly: {e!r}") from e
+
+    def _read_chunk(self, deadline: float) -> bytes:
+        while True:
+            if not self._resp.is_open():
+                raise ConnectionError("Kubernetes exec session closed unexpectedly")
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise concurrent.futures.TimeoutError()
+            # returns as soon as a frame arrives
+            self._resp.update(timeout=remaining)
+            chunk = ""
+            if self._resp.peek_stdout():
+                chunk += self._resp.read_stdout()
+            if self._resp.peek_stderr():
+                chunk += self._resp.read_stderr()
+            if chunk:
+                return chunk.encode("utf-8", errors="surrogateescape")
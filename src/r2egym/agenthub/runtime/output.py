@@ -0,0 +1,89 @@
+import re
+import gzip
+import codecs
+from collections import deque
+from typing import Optional
+
+ANSI_ESCAPE_RE = re.compile(r"\x1b\[[0-9;]*m|\r")
+# incomplete escape sequence at the end of a chunk (completed by the next chunk)
+PARTIAL_ANSI_RE = re.compile(r"\x1b(\[[0-9;]*)?$")
+
+
+class StreamingOutput:
+    """
+    Bounded collector for command output that arrives in chunks.
+
+    Each chunk is decoded incrementally (utf-8 sequences may be split across chunks) and
+    stripped of ANSI color codes / carriage returns, then only the first `head_size` and
+    the last `tail_size` characters are kept in memory. If `spill_path` is given, the full
+    (decoded, stripped) output is also written to a gzip file on the host, e.g. for parsing
+    test logs. Memory use is O(head_size + tail_size) regardless of the output size.
+    """
+
+    def __init__(self, head_size: int, tail_size: int, spill_path: Optional[str] = None):
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.spill_path = spill_path
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""  # partial escape sequence carried to the next chunk
+        self._head = []
+        self._head_len = 0
+        self._tail = deque()
+        self._tail_len = 0
+        self.total_len = 0
+        self._spill = gzip.open(spill_path, "wt", encoding="utf-8") if spill_path else None
+
+    def write(self, chunk: bytes | str):
+        text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        self._add(text)
+
+    def _add(self, text: str, final: bool = False):
+        text = self._pending + text
+        self._pending = ""
+        if not final:
+            partial = PARTIAL_ANSI_RE.search(text)
+            if partial:
+                self._pending = text[partial.start() :]
+                text = text[: partial.start()]
+        text = ANSI_ESCAPE_RE.sub("", text)
+        if not text:
+            return
+        self.total_len += len(text)
+        if self._spill is not None:
+            self._spill.write(text)
+
+        if self._head_len < self.head_size:
+            head_part = text[: self.head_size - self._head_len]
+            self._head.append(head_part)
+            self._head_len += len(head_part)
+            text = text[len(head_part) :]
+        if text:
+            self._tail.append(text)
+            self._tail_len += len(text)
+            # drop whole chunks from the left while the rest still covers the tail
+            while self._tail and self._tail_len - len(self._tail[0]) >= self.tail_size:
+                self._tail_len -= len(self._tail.popleft())
+
+    def close(self):
+        self._add(self._decoder.decode(b"", final=True), final=True)
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_len > self.head_size + self.tail_size
+
+    def getvalue(self) -> str:
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if not self.truncated:
+            return head + tail
+        tail = tail[len(tail) - self.tail_size :] if self.tail_size else ""
+        omitted = self.total_len - len(head) - len(tail)
+        return f"{head}\n<output truncated in middle: {omitted} characters omitted>\n{tail}"
+
+
+def read_spilled_output(spill_path: str) -> str:
+    with gzip.open(spill_path, "rt", encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,269 @@
+import os
+import time
+import hashlib
+import threading
+import multiprocessing.util
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import docker
+
+from r2egym.agenthub.utils.log import get_logger
+from r2egym.agenthub.runtime.docker import DockerRuntime
+
+CHECKPOINT_REPOSITORY = "r2egym-checkpoint"
+
+
+##############################################################################
+# pool stats
+##############################################################################
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    acquire_times: List[float] = field(default_factory=list)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        times = sorted(self.acquire_times)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+            "acquire_time_mean": sum(times) / len(times) if times else 0.0,
+            "acquire_time_p50": times[len(times) // 2] if times else 0.0,
+            "acquire_time_max": times[-1] if times else 0.0,
+        }
+
+
+##############################################################################
+# warm container pool
+##############################################################################
+class ContainerPool:
+    """
+    Keeps `pool_size` pre-started, already set-up containers per docker image and
+    hands them out as DockerRuntime objects.
+
+    The first acquire for an image does a cold start (container start + setup_env)
+    and commits the post-setup container as a checkpoint image. Every later runtime
+    for that image is started from the checkpoint, so it skips setup_env entirely.
+    Released runtimes are discarded (never reused) and the pool is refilled in the
+    background, so each acquire returns a container in its exact post-setup state.
+    Warm containers are only started for an image once it is acquired a second time (an env
+    reset, or another episode of the same task), so single-use images cost no extra containers.
+    Episodes of the same process share one pool through `get_process_pool` (a pool holds locks
+    and threads, so it cannot be passed to worker processes); checkpoint images are found by
+    every process.
+
+    Only the docker backend is supported (kubernetes has no `docker commit`).
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 2,
+        idle_timeout: float = 600,  # seconds before an idle warm container is evicted
+        max_workers: int = 4,  # background threads for refilling / releasing
+        remove_checkpoints: bool = False,  # remove checkpoint images on close
+        logger=None,
+    ):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.remove_checkpoints = remove_checkpoints
+        self.logger = get_logger("ContainerPool") if logger is None else logger
+
+        self.stats = PoolStats()
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[tuple[DockerRuntime, float]]] = {}
+        self._pending: Dict[str, int] = {}
+        self._checkpoints: Dict[str, str] = {}
+        self._runtime_kwargs: Dict[str, dict] = {}
+        self._num_acquired: Dict[str, int] = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._closed = False
+
+    @staticmethod
+    def _get_key(ds) -> str:
+        if "docker_image" in ds:
+            return ds["docker_image"]
+        elif "image_name" in ds:
+            return ds["image_name"]
+        raise ValueError(f"No docker image found in ds: {ds}")
+
+    @staticmethod
+    def _get_checkpoint_tag(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def _find_checkpoint(self, key: str) -> Optional[str]:
+        """Return the checkpoint image for `key` if it exists locally (possibly committed by another process)."""
+        if key in self._checkpoints:
+            return self._checkpoints[key]
+        checkpoint_image = f"{CHECKPOINT_REPOSITORY}:{self._get_checkpoint_tag(key)}"
+        client = docker.from_env(timeout=120)
+        try:
+            client.images.get(checkpoint_image)
+        except docker.errors.ImageNotFound:
+            return None
+        finally:
+            client.close()
+        self._checkpoints[key] = checkpoint_image
+        return checkpoint_image
+
+    def acquire(self, ds, logger=None, **runtime_kwargs) -> DockerRuntime:
+        """
+        Return a set-up DockerRuntime for the dataset entry `ds`.
+
+        :param ds: dataset entry (same as for DockerRuntime)
+        :param logger: logger to attach to the returned runtime
+        :param runtime_kwargs: additional DockerRuntime kwargs (e.g. command)
+        """
+        assert not self._closed, "ContainerPool is closed"
+        assert runtime_kwargs.get("backend", "docker") == "docker", "ContainerPool only supports docker backend"
+        start_time = time.time()
+        key = self._get_key(ds)
+        self.evict_idle()
+
+        runtime = None
+        with self._lock:
+            self._runtime_kwargs[key] = runtime_kwargs
+            self._num_acquired[key] = self._num_acquired.get(key, 0) + 1
+            idle = self._idle.get(key, [])
+            while idle and runtime is None:
+                candidate, _ = idle.pop()
+                if candidate.container is not None:
+                    runtime = candidate
+
+        if runtime is not None:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+            checkpoint_image = self._find_checkpoint(key)
+            runtime = DockerRuntime(
+                ds=ds, logger=logger, checkpoint_image=checkpoint_image, **runtime_kwargs
+            )
+            if checkpoint_image is None and runtime.container is not None:
+                self._checkpoints[key] = runtime.commit_checkpoint(
+                    CHECKPOINT_REPOSITORY, self._get_checkpoint_tag(key)
+                )
+
+        if logger is not None:
+            runtime.logger = logger
+        acquire_time = time.time() - start_time
+        self.stats.acquire_times.append(acquire_time)
+        self.logger.info(
+            f"Acquired runtime for {key} in {acquire_time:.2f}s (hit rate: {self.stats.hit_rate:.2f})"
+        )
+        self._refill(ds, key)
+        return runtime
+
+    def release(self, runtime: DockerRuntime):
+        """
+        Discard a runtime handed out by `acquire`. The container is stopped and removed
+        in the background; the pool for its image is refilled from the checkpoint.
+        """
+        self._executor.submit(runtime.close)
+
+    def _refill(self, ds, key: str):
+        if key not in self._checkpoints or self._closed:
+            return
+        with self._lock:
+            if self._num_acquired.get(key, 0) < 2:
+                return  # no reuse of this image seen yet
+            missing = (
+                self.pool_size - len(self._idle.get(key, [])) - self._pending.get(key, 0)
+            )
+            if missing <= 0:
+                return
+            self._pending[key] = self._pending.get(key, 0) + missing
+        for _ in range(missing):
+            self._executor.submit(self._start_warm, ds, key)
+
+    def _start_warm(self, ds, key: str):
+        try:
+            runtime = DockerRuntime(
+                ds=ds,
+                logger=self.logger,
+                checkpoint_image=self._checkpoints[key],
+                **self._runtime_kwargs.get(key, {}),
+            )
+        except Exception as e:
+            self.logger.error(f"Error starting warm container for {key}: {repr(e)}")
+            runtime = None
+        with self._lock:
+            self._pending[key] -= 1
+            if runtime is not None and runtime.container is not None and not self._closed:
+                self._idle.setdefault(key, []).append((runtime, time.time()))
+                return
+        if runtime is not None:
+            runtime.close()
+
+    def evict_idle(self):
+        """Close warm containers that have been idle for longer than `idle_timeout`."""
+        now = time.time()
+        evicted = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                keep = [(rt, ts) for rt, ts in idle if now - ts < self.idle_timeout]
+                evicted.extend(rt for rt, ts in idle if now - ts >= self.idle_timeout)
+                self._idle[key] = keep
+        for runtime in evicted:
+            self.stats.evictions += 1
+            self._executor.submit(runtime.close)
+        if evicted:
+            self.logger.info(f"Evicted {len(evicted)} idle containers")
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            idle = [rt for runtimes in self._idle.values() for rt, _ in runtimes]
+            self._idle = {}
+        for runtime in idle:
+            self._executor.submit(runtime.close)
+        self._executor.shutdown(wait=True)
+
+        if self.remove_checkpoints and self._checkpoints:
+            client = docker.from_env(timeout=120)
+            for checkpoint_image in self._checkpoints.values():
+                try:
+                    client.images.remove(checkpoint_image, force=True)
+                except Exception as e:
+                    self.logger.error(f"Error removing checkpoint {checkpoint_image}: {repr(e)}")
+            client.close()
+        self.logger.info(f"ContainerPool closed. stats: {self.stats.to_dict()}")
+
+
+##############################################################################
+# per-process pool
+##############################################################################
+_process_pool: Optional[ContainerPool] = None
+_process_pool_lock = threading.Lock()
+
+
+def _reset_process_pool():
+    # a forked child does not inherit the parent's pool threads
+    global _process_pool, _process_pool_lock
+    _process_pool = None
+    _process_pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_process_pool)
+
+
+def get_process_pool(pool_size: int) -> ContainerPool:
+    """
+    The ContainerPool shared by all episodes run in this process (e.g. an EpisodeScheduler
+    worker), created on first use and closed when the process exits.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ContainerPool(pool_size=pool_size)
+            # runs at the exit of multiprocessing workers too (unlike a plain atexit handler)
+            multiprocessing.util.Finalize(_process_pool, _process_pool.close, exitpriority=10)
+        return _process_pool
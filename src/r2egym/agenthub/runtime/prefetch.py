@@ -0,0 +1,246 @@
+import time
+import queue
+import random
+import threading
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import docker
+
+from r2egym.agenthub.utils.log import get_logger
+
+
+##############################################################################
+# prefetch stats
+##############################################################################
+@dataclass
+class PrefetchStats:
+    pulled: int = 0
+    cached: int = 0  # already present locally
+    failed: int = 0
+    evicted: int = 0
+    retries: int = 0
+    backoff_time: float = 0.0
+    bytes_pulled: int = 0
+    pull_times: List[float] = field(default_factory=list)
+    start_time: float = field(default_factory=time.time)
+
+    @property
+    def throughput(self) -> float:
+        """Pulled image bytes per second of wall-clock time."""
+        elapsed = time.time() - self.start_time
+        return self.bytes_pulled / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        times = sorted(self.pull_times)
+        return {
+            "pulled": self.pulled,
+            "cached": self.cached,
+            "failed": self.failed,
+            "evicted": self.evicted,
+            "retries": self.retries,
+            "backoff_time": self.backoff_time,
+            "bytes_pulled": self.bytes_pulled,
+            "throughput_mb_s": self.throughput / 1e6,
+            "pull_time_mean": sum(times) / len(times) if times else 0.0,
+            "pull_time_p50": times[len(times) // 2] if times else 0.0,
+            "pull_time_max": times[-1] if times else 0.0,
+        }
+
+
+##############################################################################
+# image prefetch service
+##############################################################################
+class ImagePrefetcher:
+    """
+    Single service for pulling task images ahead of the episodes that need them.
+
+    - Deduplication: every image is pulled at most once, however often it is requested.
+    - Layer-aware ordering: images of the same repository (which share their base layers)
+      are pulled back to back, keeping the order in which repositories were first requested,
+      so shared layers are downloaded once and are reused by the following pulls.
+    - Disk budget: when the total size of local images exceeds `disk_high_water_mark` bytes,
+      least-recently-used task images (pulled by this service and not in use) are removed
+      until usage drops below `disk_low_water_mark`.
+    - Ready stream: `iter_ready()` yields images as soon as each pull finishes, so episodes
+      can start before all pulls are done.
+    - Metrics: `stats` (pull throughput, pull times, retries and backoff time).
+
+    Usage:
+        prefetcher = ImagePrefetcher(max_workers=8)
+        prefetcher.prefetch(images)
+        for image, ok in prefetcher.iter_ready():
+            ...
+        prefetcher.close()
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        retries: int = 5,
+        disk_high_water_mark: Optional[int] = None,  # bytes of local images before evicting
+        disk_low_water_mark: Optional[int] = None,  # evict down to this (default: 90% of high)
+        logger=None,
+    ):
+        self.retries = retries
+        self.disk_high_water_mark = disk_high_water_mark
+        self.disk_low_water_mark = disk_low_water_mark or (
+            int(disk_high_water_mark * 0.9) if disk_high_water_mark else None
+        )
+        self.logger = get_logger("ImagePrefetcher") if logger is None else logger
+        self.client = docker.from_env(timeout=600)
+
+        self.stats = PrefetchStats()
+        self._lock = threading.Lock()
+        self._requested: Dict[str, concurrent.futures.Future] = {}
+        self._num_submitted = 0
+        self._last_used: Dict[str, float] = {}  # LRU bookkeeping of task images we pulled
+        self._in_use: Dict[str, int] = {}
+        self._ready = queue.Queue()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    @staticmethod
+    def _split_image(image: str) -> Tuple[str, str]:
+        repository, _, tag = image.rpartition(":")
+        if not repository or "/" in tag:
+            return image, "latest"
+        return repository, tag
+
+    @classmethod
+    def order_images(cls, images: List[str]) -> List[str]:
+        """Deduplicate and group images by repository, keeping first-requested order."""
+        groups: Dict[str, List[str]] = {}
+        for image in images:
+            group = groups.setdefault(cls._split_image(image)[0], [])
+            if image not in group:
+                group.append(image)
+        return [image for group in groups.values() for image in group]
+
+    def prefetch(self, images: List[str]) -> List[concurrent.futures.Future]:
+        """
+        Queue `images` for pulling (layer-aware order, deduplicated) and return one future per
+        image; a future resolves to True once the image is available locally, False on failure.
+        """
+        futures = []
+        with self._lock:
+            for image in self.order_images(images):
+                if image not in self._requested:
+                    self._requested[image] = self._executor.submit(self._pull, image)
+                    self._num_submitted += 1
+                futures.append(self._requested[image])
+        return futures
+
+    def wait(self, image: str, timeout: Optional[float] = None) -> bool:
+        """Block until `image` is pulled (prefetching it if needed)."""
+        return self.prefetch([image])[0].result(timeout=timeout)
+
+    def iter_ready(self) -> Iterator[Tuple[str, bool]]:
+        """Yield (image, success) for every prefetched image, in the order the pulls finish."""
+        num_yielded = 0
+        while num_yielded < self._num_submitted:
+            yield self._ready.get()
+            num_yielded += 1
+
+    def _image_size(self, image: str) -> int:
+        try:
+            return self.client.images.get(image).attrs.get("Size", 0)
+        except docker.errors.ImageNotFound:
+            return 0
+
+    def _pull(self, image: str) -> bool:
+        success = False
+        try:
+            if self._image_size(image):
+                # already present: not ours to evict
+                self.stats.cached += 1
+                success = True
+                return success
+            self.evict()
+            success = self._pull_with_retries(image)
+            if success:
+                with self._lock:
+                    self._last_used.setdefault(image, time.time())
+            return success
+        finally:
+            self._ready.put((image, success))
+
+    def _pull_with_retries(self, image: str) -> bool:
+        repository, tag = self._split_image(image)
+        start_time = time.time()
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.logger.info(f"Pulling Docker image: {image} (attempt {attempt})")
+                self.client.images.pull(repository=repository, tag=tag)
+                self.stats.pulled += 1
+                self.stats.pull_times.append(time.time() - start_time)
+                self.stats.bytes_pulled += self._image_size(image)
+                self.logger.info(f"Successfully pulled Docker image: {image}")
+                return True
+            except docker.errors.APIError as e:
+                if attempt == self.retries:
+                    break
+                # rate limited (or transient registry error): exponential backoff with jitter
+                if "toomanyrequests" in str(e):
+                    sleep_time = (3**attempt) + random.uniform(1, 5)
+                else:
+                    sleep_time = 2**attempt + random.uniform(0, 1)
+                self.stats.retries += 1
+                self.stats.backoff_time += sleep_time
+                self.logger.warning(f"Error pulling {image}: {e}. Retrying in {sleep_time:.1f}s")
+                time.sleep(sleep_time)
+            except Exception as e:
+                self.logger.error(f"Failed to pull Docker image {image}: {e}")
+                break
+        self.stats.failed += 1
+        self.logger.error(f"Failed to pull Docker image {image} after {attempt} attempts")
+        return False
+
+    def acquire(self, image: str):
+        """Mark `image` as in use (it is never evicted while in use) and refresh its LRU position."""
+        with self._lock:
+            self._in_use[image] = self._in_use.get(image, 0) + 1
+            self._last_used[image] = time.time()
+
+    def release(self, image: str):
+        with self._lock:
+            self._in_use[image] = max(self._in_use.get(image, 0) - 1, 0)
+            self._last_used[image] = time.time()
+
+    def disk_usage(self) -> int:
+        """Total size (bytes) of the local docker images (shared layers counted once)."""
+        return self.client.df().get("LayersSize", 0)
+
+    def evict(self):
+        """Remove least-recently-used idle task images while usage is above the high-water mark."""
+        if not self.disk_high_water_mark:
+            return
+        usage = self.disk_usage()
+        if usage <= self.disk_high_water_mark:
+            return
+        with self._lock:
+            candidates = sorted(
+                (ts, image)
+                for image, ts in self._last_used.items()
+                if not self._in_use.get(image)
+            )
+        for _, image in candidates:
+            if usage <= self.disk_low_water_mark:
+                break
+            try:
+                # no force: images with (stopped) containers are kept
+                self.client.images.remove(image)
+            except docker.errors.APIError as e:
+                self.logger.warning(f"Could not evict {image}: {e}")
+                continue
+            with self._lock:
+                self._last_used.pop(image, None)
+                self._requested.pop(image, None)
+            self.stats.evicted += 1
+            usage = self.disk_usage()
+            self.logger.info(f"Evicted {image} (image disk usage: {usage / 1e9:.1f}GB)")
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.client.close()
+        self.logger.info(f"ImagePrefetcher closed. stats: {self.stats.to_dict()}")
@@ -0,0 +1,251 @@
+import os
+import time
+import uuid
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from kubernetes import client, config, watch
+
+from r2egym.agenthub.utils.log import get_logger
+from r2egym.agenthub.runtime.docker import (
+    DockerRuntime,
+    DEFAULT_NAMESPACE,
+    POD_MANAGED_LABEL,
+    POD_HOST_LABEL,
+    POD_PID_LABEL,
+    get_pod_owner_host,
+)
+
+
+##############################################################################
+# provisioner stats
+##############################################################################
+@dataclass
+class ProvisionerStats:
+    created: int = 0
+    ready: int = 0
+    failed: int = 0
+    garbage_collected: int = 0
+    ready_times: List[float] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, float]:
+        times = sorted(self.ready_times)
+        return {
+            "created": self.created,
+            "ready": self.ready,
+            "failed": self.failed,
+            "garbage_collected": self.garbage_collected,
+            "ready_time_mean": sum(times) / len(times) if times else 0.0,
+            "ready_time_p50": times[len(times) // 2] if times else 0.0,
+            "ready_time_max": times[-1] if times else 0.0,
+        }
+
+
+##############################################################################
+# kubernetes pod pre-provisioner
+##############################################################################
+class PodProvisioner:
+    """
+    Creates kubernetes pods ahead of demand so that scheduling and image pulls overlap with
+    agent execution instead of sitting on the critical path of every episode.
+
+    `schedule(ds_entries)` assigns a pod name to every entry (in work-queue order); a
+    background thread keeps at most `depth` pods alive (created but not yet released),
+    i.e. one per running worker plus `lookahead` pods for the entries that come next.
+    Workers pass the assigned name to DockerRuntime(pod_name=...), which attaches to the
+    (already Running, or still starting) pod instead of creating one. If a pre-created pod
+    failed, it is deleted and the runtime falls back to creating its own pod.
+
+    Every pod carries owner labels (host + pid). Pods whose owning process on this host is
+    gone are garbage collected on start, and `release` / `close` delete the pods of episodes
+    whose worker died before cleaning up.
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        lookahead: int = 4,  # pods created beyond the ones in use by running workers
+        command: str = "/bin/bash",
+        environment: Optional[dict] = None,
+        logger=None,
+    ):
+        self.depth = num_workers + lookahead
+        self.command = command
+        self.environment = environment or {}
+        self.logger = get_logger("PodProvisioner") if logger is None else logger
+        try:
+            config.load_incluster_config()
+        except Exception:
+            config.load_kube_config()
+        self.client = client.CoreV1Api()
+
+        self.stats = ProvisionerStats()
+        self._cond = threading.Condition()
+        self._queue: List[tuple[str, str]] = []  # (pod_name, docker_image) not yet created
+        self._alive: Dict[str, float] = {}  # pod_name -> creation time (created, not released)
+        self._released = set()
+        self._closed = False
+        self._threads: List[threading.Thread] = []
+
+    @staticmethod
+    def _get_docker_image(ds) -> str:
+        # same image resolution as DockerRuntime
+        docker_image = ds["docker_image"] if "docker_image" in ds else ds["image_name"]
+        if "swesmith" in docker_image:
+            docker_image = f"jyangballin/{ds['image_name'].replace('__', '_1776_')}:latest"
+        return docker_image
+
+    def schedule(self, ds_entries: List[Dict]) -> List[str]:
+        """
+        Queue pods for `ds_entries` (in the order the workers will pick them up),
+        start the background threads and return the assigned pod names.
+        """
+        self.collect_garbage()
+        pod_names = []
+        with self._cond:
+            for ds in ds_entries:
+                pod_name = str(uuid.uuid4())
+                self._queue.append((pod_name, self._get_docker_image(ds)))
+                pod_names.append(pod_name)
+            self._cond.notify_all()
+        if not self._threads:
+            for target in (self._create_loop, self._watch_loop):
+                thread = threading.Thread(target=target, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return pod_names
+
+    def _create_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed and (
+                    not self._queue or len(self._alive) >= self.depth
+                ):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                pod_name, docker_image = self._queue.pop(0)
+                if pod_name in self._released:
+                    # episode already finished (e.g. worker failed before using it)
+                    continue
+                self._alive[pod_name] = time.time()
+            try:
+                self.client.create_namespaced_pod(
+                    namespace=DEFAULT_NAMESPACE,
+                    body=DockerRuntime.get_pod_body(
+                        docker_image, self.command, pod_name, self.environment
+                    ),
+                    _request_timeout=120,
+                )
+                self.stats.created += 1
+            except client.ApiException as e:
+                # the runtime will create the pod itself
+                self.logger.warning(f"Failed to pre-create pod {pod_name}: {e}")
+                with self._cond:
+                    self._alive.pop(pod_name, None)
+                    self._cond.notify_all()
+
+    def _watch_loop(self):
+        """Track readiness of our pods; delete pods that fail before they are used."""
+        label_selector = (
+            f"{POD_MANAGED_LABEL}=true,{POD_HOST_LABEL}={get_pod_owner_host()},"
+            f"{POD_PID_LABEL}={os.getpid()}"
+        )
+        ready = set()
+        while not self._closed:
+            w = watch.Watch()
+            try:
+                for event in w.stream(
+                    self.client.list_namespaced_pod,
+                    namespace=DEFAULT_NAMESPACE,
+                    label_selector=label_selector,
+                    timeout_seconds=60,
+                ):
+                    if self._closed:
+                        w.stop()
+                        break
+                    pod = event["object"]
+                    pod_name = pod.metadata.name
+                    phase = pod.status.phase if pod.status else None
+                    with self._cond:
+                        created_at = self._alive.get(pod_name)
+                    if created_at is None:
+                        continue
+                    if phase == "Running" and pod_name not in ready:
+                        ready.add(pod_name)
+                        self.stats.ready += 1
+                        self.stats.ready_times.append(time.time() - created_at)
+                    elif phase in ["Failed", "Unknown"] and pod_name not in ready:
+                        ready.add(pod_name)
+                        self.stats.failed += 1
+                        self.logger.warning(f"Pre-provisioned pod {pod_name} entered phase {phase}")
+                        self._delete_pod(pod_name)
+            except Exception as e:
+                self.logger.warning(f"Pod watch error (restarting): {repr(e)}")
+                time.sleep(1)
+
+    def _delete_pod(self, pod_name: str):
+        try:
+            self.client.delete_namespaced_pod(
+                name=pod_name,
+                namespace=DEFAULT_NAMESPACE,
+                body=client.V1DeleteOptions(grace_period_seconds=0),
+                _request_timeout=60,
+            )
+        except client.ApiException as e:
+            if e.status != 404:
+                self.logger.error(f"Error deleting pod {pod_name}: {e}")
+
+    def release(self, pod_name: str):
+        """
+        Mark the episode of `pod_name` as finished: the pod is deleted if the worker did not
+        (e.g. it crashed) and the next queued pod can be created.
+        """
+        with self._cond:
+            self._released.add(pod_name)
+            was_alive = self._alive.pop(pod_name, None) is not None
+            self._cond.notify_all()
+        if was_alive:
+            self._delete_pod(pod_name)
+
+    def collect_garbage(self):
+        """Delete pods created (on this host) by processes that no longer exist."""
+        host = get_pod_owner_host()
+        try:
+            pods = self.client.list_namespaced_pod(
+                namespace=DEFAULT_NAMESPACE,
+                label_selector=f"{POD_MANAGED_LABEL}=true,{POD_HOST_LABEL}={host}",
+                _request_timeout=60,
+            ).items
+        except client.ApiException as e:
+            self.logger.error(f"Error listing pods for garbage collection: {e}")
+            return
+        for pod in pods:
+            pid = int(pod.metadata.labels.get(POD_PID_LABEL, "0") or 0)
+            if pid and not self._pid_alive(pid):
+                self.logger.info(f"Garbage collecting leaked pod {pod.metadata.name} (pid {pid})")
+                self._delete_pod(pod.metadata.name)
+                self.stats.garbage_collected += 1
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def close(self):
+        """Stop provisioning and delete every pod that has not been released yet."""
+        with self._cond:
+            self._closed = True
+            leftover = list(self._alive)
+            self._alive = {}
+            self._queue = []
+            self._cond.notify_all()
+        for pod_name in leftover:
+            self._delete_pod(pod_name)
+        self.logger.info(f"PodProvisioner closed. stats: {self.stats.to_dict()}")
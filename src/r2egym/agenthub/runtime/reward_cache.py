@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import zlib
+import sqlite3
+import hashlib
+import threading
+import contextlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+from r2egym.agenthub.utils.log import get_logger
+
+DEFAULT_REWARD_CACHE_PATH = os.path.expanduser("~/.cache/r2egym/reward_cache.sqlite")
+
+
+@dataclass
+class RewardCacheEntry:
+    reward: float
+    output: Optional[str]  # raw test output (None if it was not requested when computed)
+    test_map: Optional[Dict[str, Any]]  # parsed test name -> status
+
+
+##############################################################################
+# reward cache
+##############################################################################
+class RewardCache:
+    """
+    On-disk cache of reward computations keyed on (docker image, normalized patch hash).
+
+    The repository state that the tests see is fully determined by the task image and the
+    patch on top of it, so a patch that was already tested (earlier in the episode, or by
+    another rollout of the same task) does not need another run of the test suite.
+
+    The store is a sqlite database, so it is safe to share between processes (and threads);
+    every operation opens its own short-lived connection.
+    """
+
+    def __init__(self, path: str = DEFAULT_REWARD_CACHE_PATH, logger=None):
+        self.path = path
+        self.logger = get_logger("RewardCache") if logger is None else logger
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rewards ("
+                "image TEXT NOT NULL, patch_hash TEXT NOT NULL, reward REAL NOT NULL, "
+                "output BLOB, test_map TEXT, PRIMARY KEY (image, patch_hash))"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Short-lived connection: commits (or rolls back) the transaction, then closes."""
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def normalize_patch(patch: str) -> str:
+        """
+        Drop the parts of a `git diff` that do not change the resulting tree
+        (`index <sha>..<sha>` lines and leading / trailing blank lines).
+        """
+        lines = [
+            line
+            for line in patch.split("\n")
+            if not re.match(r"^index [0-9a-f]+\.\.[0-9a-f]+", line)
+        ]
+        return "\n".join(lines).strip("\n")
+
+    @classmethod
+    def patch_hash(cls, patch: str) -> str:
+        return hashlib.sha256(cls.normalize_patch(patch).encode()).hexdigest()
+
+    def get(self, image: str, patch: str) -> Optional[RewardCacheEntry]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT reward, output, test_map FROM rewards WHERE image = ? AND patch_hash = ?",
+                (image, self.patch_hash(patch)),
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        reward, output, test_map = row
+        return RewardCacheEntry(
+            reward=reward,
+            output=zlib.decompress(output).decode() if output is not None else None,
+            test_map=json.loads(test_map) if test_map is not None else None,
+        )
+
+    def put(
+        self,
+        image: str,
+        patch: str,
+        reward: float,
+        output: Optional[str] = None,
+        test_map: Optional[Dict[str, Any]] = None,
+    ):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO rewards VALUES (?, ?, ?, ?, ?)",
+                (
+                    image,
+                    self.patch_hash(patch),
+                    float(reward),
+                    zlib.compress(output.encode()) if output is not None else None,
+                    json.dumps(test_map) if test_map is not None else None,
+                ),
+            )
+
+    def to_dict(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
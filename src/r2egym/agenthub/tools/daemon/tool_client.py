@@ -0,0 +1,69 @@
+#!/root/.venv/bin/python -S
+"""
+Description: Client shim installed under the CLI name of each Python tool (e.g. `file_editor`).
+
+Forwards the call (argv, cwd, environment and the stdin / stdout / stderr file descriptors)
+to the resident `tool_daemon` and exits with the tool's exit code. If the daemon is not
+running or does not serve the tool, the original tool script is run instead, so the CLI
+behaves the same either way. Runs with `-S` and only imports C modules (`_socket` instead
+of `socket`, `marshal` instead of `json`) to start fast.
+"""
+
+import _socket
+import array
+import marshal
+import os
+import sys
+
+SOCKET_PATH = "/var/tmp/r2egym_tools.sock"
+TOOLS_DIR = "/usr/local/lib/r2egym_tools"
+
+
+def run_script(tool):
+    path = os.path.join(TOOLS_DIR, tool)
+    os.execv(path, [path] + sys.argv[1:])
+
+
+def main():
+    tool = os.path.basename(sys.argv[0])
+    client = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        client.connect(SOCKET_PATH)
+    except OSError:
+        run_script(tool)
+
+    request = marshal.dumps(
+        {"tool": tool, "argv": sys.argv[1:], "cwd": os.getcwd(), "env": dict(os.environ)}
+    )
+    sys.stdout.flush()
+    sys.stderr.flush()
+    fds = array.array("i")
+    for fd in (0, 1, 2):
+        try:
+            os.fstat(fd)
+        except OSError:  # closed by the caller
+            fd = os.open(os.devnull, os.O_RDWR)
+        fds.append(fd)
+    client.sendmsg(
+        [len(request).to_bytes(4, "big") + request],
+        [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS, fds.tobytes())],
+    )
+
+    response = b""
+    while True:
+        chunk = client.recv(4096)
+        if not chunk:
+            break
+        response += chunk
+    client.close()
+    if not response:
+        sys.stderr.write("ERROR: tool daemon exited while running {}\n".format(tool))
+        sys.exit(1)
+    code = marshal.loads(response)["code"]
+    if code is None:
+        run_script(tool)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/root/.venv/bin/python
+"""
+Description: Resident tool server for the Python agent tools inside the container.
+
+The tools (file_editor, search, execute_bash, finish, ...) are imported once at startup.
+Each call from the `tool_client` shim (installed under the tool's CLI name) is served by a
+forked child of the daemon, which runs the tool's `main()` with the caller's argv, cwd and
+environment and with the caller's stdin / stdout / stderr (passed over the Unix socket), so a
+call behaves like running the tool script but without interpreter startup and imports.
+
+Usage:
+  tool_daemon start     # start in the background (no-op if already running)
+  tool_daemon restart   # restart in the background (reloads the tools)
+  tool_daemon serve     # serve in the foreground
+"""
+
+import array
+import importlib.machinery
+import importlib.util
+import marshal
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+
+SOCKET_PATH = "/var/tmp/r2egym_tools.sock"
+TOOLS_DIR = "/usr/local/lib/r2egym_tools"
+LOG_PATH = "/var/tmp/r2egym_tools.log"
+PID_PATH = "/var/tmp/r2egym_tools.pid"
+# request: 4-byte big-endian length + marshal-ed dict (the client avoids importing json)
+HEADER = struct.Struct("!I")
+
+
+def recv_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("client disconnected")
+        data += chunk
+    return data
+
+
+def load_tools():
+    """Import every tool script in TOOLS_DIR (name -> module with a main())."""
+    tools = {}
+    for name in sorted(os.listdir(TOOLS_DIR)):
+        path = os.path.join(TOOLS_DIR, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            loader = importlib.machinery.SourceFileLoader("r2egym_tool_" + name, path)
+            spec = importlib.util.spec_from_loader(loader.name, loader)
+            module = importlib.util.module_from_spec(spec)
+            loader.exec_module(module)
+        except BaseException:
+            sys.stderr.write("Could not load tool {}:\n{}".format(name, traceback.format_exc()))
+            continue
+        if callable(getattr(module, "main", None)):
+            tools[name] = module
+    return tools
+
+
+def run_tool(module, tool_path, request, fds):
+    """Run the tool's main() like `tool_path *argv` would (in the forked child)."""
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = os.fdopen(0, "r", closefd=False)
+    sys.stdout = os.fdopen(1, "w", encoding="utf-8", closefd=False)
+    sys.stderr = os.fdopen(2, "w", encoding="utf-8", errors="backslashreplace", closefd=False)
+    sys.argv = [tool_path] + request["argv"]
+    code = 0
+    try:
+        module.main()
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            sys.stderr.write(str(e.code) + "\n")
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    return code
+
+
+def handle(conn, tools):
+    """Serve one call (in the forked child, which exits afterwards)."""
+    msg, ancdata, _, _ = conn.recvmsg(HEADER.size, socket.CMSG_LEN(3 * array.array("i").itemsize))
+    fds = array.array("i")
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[: len(data) - (len(data) % fds.itemsize)])
+    if len(msg) < HEADER.size:
+        msg += recv_exact(conn, HEADER.size - len(msg))
+    request = marshal.loads(recv_exact(conn, HEADER.unpack(msg)[0]))
+    module = tools.get(request["tool"])
+    if module is None or len(fds) != 3:
+        # unknown tool: the client runs the script itself
+        conn.sendall(marshal.dumps({"code": None}))
+        return
+
+    # own process group, killed (with the tool's subprocesses) if the client goes away,
+    # e.g. when it is stopped by `timeout`
+    os.setpgid(0, 0)
+    done = threading.Event()
+
+    def watch_client():
+        try:
+            conn.recv(1)
+        except OSError:
+            pass
+        if not done.is_set():
+            os.killpg(0, signal.SIGKILL)
+
+    threading.Thread(target=watch_client, daemon=True).start()
+    code = run_tool(module, os.path.join(TOOLS_DIR, request["tool"]), request, list(fds))
+    done.set()
+    conn.sendall(marshal.dumps({"code": code}))
+
+
+def serve():
+    tools = load_tools()
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(SOCKET_PATH)
+    server.listen(64)
+    with open(PID_PATH, "w") as f:
+        f.write(str(os.getpid()))
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # children are reaped automatically
+    sys.stderr.write("Serving tools {} on {}\n".format(sorted(tools), SOCKET_PATH))
+    sys.stderr.flush()
+    while True:
+        try:
+            conn, _ = server.accept()
+        except InterruptedError:
+            continue
+        pid = os.fork()
+        if pid == 0:
+            server.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)  # tools wait for their subprocesses
+            try:
+                handle(conn, tools)
+            except ConnectionError:
+                pass  # e.g. the `is_running` probe
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(0)
+        conn.close()
+
+
+def is_running():
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(SOCKET_PATH)
+        return True
+    except OSError:
+        return False
+    finally:
+        client.close()
+
+
+def is_daemon_process(pid):
+    """
+    Whether `pid` is a tool daemon. The pid file survives in committed / snapshot images, where
+    a stale pid may belong to an unrelated process of the new container.
+    """
+    if pid == os.getpid():
+        return False
+    try:
+        with open("/proc/{}/cmdline".format(pid), "rb") as f:
+            argv = f.read().split(b"\0")
+    except OSError:
+        return False
+    return any(os.path.basename(arg) == b"tool_daemon" for arg in argv)
+
+
+def stop():
+    try:
+        with open(PID_PATH) as f:
+            pid = int(f.read().strip())
+        if is_daemon_process(pid):
+            os.kill(pid, signal.SIGTERM)
+    except (OSError, ValueError):
+        pass
+    for path in (SOCKET_PATH, PID_PATH):
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def start(wait=5.0):
+    """Start the daemon in the background (detached from the calling exec) if not running."""
+    if is_running():
+        return
+    if os.fork() == 0:
+        os.setsid()
+        if os.fork() == 0:
+            log_fd = os.open(LOG_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            null_fd = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(null_fd, 0)
+            os.dup2(log_fd, 1)
+            os.dup2(log_fd, 2)
+            os.chdir("/")
+            try:
+                serve()
+            finally:
+                os._exit(1)
+        os._exit(0)
+    os.wait()
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        if is_running():
+            return
+        time.sleep(0.02)
+    sys.stderr.write("Tool daemon did not start, see {}\n".format(LOG_PATH))
+    sys.exit(1)
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "start"
+    if command == "start":
+        start()
+    elif command == "restart":
+        stop()
+        start()
+    elif command == "serve":
+        serve()
+    else:
+        sys.stderr.write("Unknown command '{}'. Use `start`, `restart` or `serve`.\n".format(command))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,14 @@ Allowed values: [`view`, `create`, `str_replace`, `insert`, `undo_edit`]
 """
 
 import argparse
+import bisect
+import hashlib
+import io
 import json
+import marshal
+import mmap
+import os
+import re
 import subprocess
 from pathlib import Path
 from collections import defaultdict
@@ -40,6 +47,10 @@ import chardet
 # sys.stdout.reconfigure(encoding='utf-8')
 
 STATE_FILE = "/var/tmp/editor_state.json"
+# per-file cache (encoding, line index, concise-view structure) keyed by content hash
+CACHE_DIR = "/var/tmp/editor_cache"
+CACHE_VERSION = 3
+MAX_CACHE_ENTRIES = 256
 SNIPPET_LINES = 4
 
 # We ignore certain warnings from tree_sitter (optional).
@@ -119,14 +130,238 @@ def load_history() -> Dict[str, List[str]]:
 def save_history(history: Dict[str, List[str]]):
     """
     Save the file edit history to STATE_FILE as JSON.
+    The file is replaced atomically, so concurrent calls never read a partial state.
     """
     try:
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
+        tmp_path = "{}.{}.tmp".format(STATE_FILE, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(history, f)
+        os.replace(tmp_path, STATE_FILE)
     except Exception as e:
         safe_print(f"Warning: Could not write editor history to {STATE_FILE}: {e}")
 
 
+def load_cache_entry(key: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(CACHE_DIR, key), "rb") as f:
+            entry = marshal.load(f)
+    except Exception:
+        return None
+    if not isinstance(entry, dict) or entry.get("version") != CACHE_VERSION:
+        return None
+    return entry
+
+
+def save_cache_entry(key: str, entry: dict):
+    """
+    Atomically write a cache entry, evicting the oldest entries beyond MAX_CACHE_ENTRIES.
+    Failures are ignored: the cache is only an optimization.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = os.path.join(CACHE_DIR, ".{}.{}".format(key, os.getpid()))
+        with open(tmp_path, "wb") as f:
+            marshal.dump(entry, f)
+        os.replace(tmp_path, os.path.join(CACHE_DIR, key))
+
+        names = [name for name in os.listdir(CACHE_DIR) if not name.startswith(".")]
+        if len(names) > MAX_CACHE_ENTRIES:
+            paths = [os.path.join(CACHE_DIR, name) for name in names]
+            paths.sort(key=os.path.getmtime)
+            for old_path in paths[: len(paths) - MAX_CACHE_ENTRIES]:
+                os.unlink(old_path)
+    except Exception:
+        pass
+
+
+# `str.splitlines` line breaks other than "\n" (utf-8 encoded). Files without them are
+# indexed by the byte offsets of their b"\n"s.
+OTHER_LINE_BREAKS = re.compile(rb"[\r\x0b\x0c\x1c-\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+INDEXED_ENCODINGS = ("ascii", "utf-8")
+
+
+def find_newlines(data, offset: int = 0) -> List[int]:
+    """Offsets (plus `offset`) of every b"\\n" in `data`."""
+    newlines = []
+    pos = data.find(b"\n")
+    while pos != -1:
+        newlines.append(pos + offset)
+        pos = data.find(b"\n", pos + 1)
+    return newlines
+
+
+class CachedFile:
+    """
+    A file (mmap-ed) with the data the editor derives from it cached on disk under the
+    SHA-1 of its bytes: the detected encoding, a line index and the elided-line ranges of
+    the concise view. A repeated view of an unchanged file thus skips `chardet.detect` and
+    `ast.parse`.
+
+    For ascii / utf-8 files with "\\n" line breaks only, the line index is the byte offsets
+    of the newlines: ranged views and inserts then decode just the lines they need from the
+    buffer, and edits patch the index of the new file instead of rebuilding it. Other files
+    are indexed by the character offsets of their lines in the decoded text.
+    """
+
+    def __init__(self, path: Path):
+        with open(str(path), "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.buffer = b""  # empty files cannot be mmap-ed
+        self.key = hashlib.sha1(self.buffer).hexdigest()
+        entry = load_cache_entry(self.key)
+        self.dirty = entry is None
+        if entry is None:
+            encoding = chardet.detect(bytes(self.buffer))["encoding"]
+            entry = {"version": CACHE_VERSION, "encoding": encoding or "utf-8"}
+        self.entry = entry
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            # same decoding (incl. universal newlines) as `path.read_text(encoding)`
+            self._text = io.TextIOWrapper(
+                io.BytesIO(self.buffer), encoding=self.entry["encoding"]
+            ).read()
+        return self._text
+
+    @property
+    def newlines(self) -> Optional[List[int]]:
+        """Byte offsets of the newlines, or None if the file is indexed by line offsets."""
+        if "newlines" not in self.entry and "line_offsets" not in self.entry:
+            self.text  # raises for undecodable files, like `read_text`
+            if self.entry["encoding"].lower() in INDEXED_ENCODINGS and not OTHER_LINE_BREAKS.search(
+                self.buffer
+            ):
+                self.entry["newlines"] = find_newlines(self.buffer)
+            else:
+                # start offset of every line (as split by `str.splitlines`) plus the end offset
+                offsets = [0]
+                for line in self.text.splitlines(True):
+                    offsets.append(offsets[-1] + len(line))
+                self.entry["line_offsets"] = offsets
+            self.dirty = True
+        return self.entry.get("newlines")
+
+    @property
+    def num_lines(self) -> int:
+        """Number of lines, as split by `str.splitlines`."""
+        newlines = self.newlines
+        if newlines is None:
+            return len(self.entry["line_offsets"]) - 1
+        # text after the last newline is a line of its own
+        return len(newlines) + (len(self.buffer) > (newlines[-1] + 1 if newlines else 0))
+
+    @property
+    def num_split_lines(self) -> int:
+        """Number of lines, as split by `str.split("\\n")`."""
+        newlines = self.newlines
+        if newlines is None:
+            return self.text.count("\n") + 1
+        return len(newlines) + 1
+
+    def lines(self, start: int = 0, end: Optional[int] = None) -> List[str]:
+        """Lines [start, end) (0-based) of the text, like `text.splitlines()[start:end]`."""
+        end = self.num_lines if end is None else min(end, self.num_lines)
+        if start >= end:
+            return []
+        if self.newlines is not None:
+            return self.split_lines(start, end)
+        offsets = self.entry["line_offsets"]
+        return self.text[offsets[start] : offsets[end]].splitlines()
+
+    def split_lines(self, start: int, end: int) -> List[str]:
+        """Lines [start, end) (0-based) of the text, like `text.split("\\n")[start:end]`."""
+        newlines = self.newlines
+        if newlines is None:
+            return self.text.split("\n")[start:end]
+        end = min(end, len(newlines) + 1)
+        if start >= end:
+            return []
+        begin = newlines[start - 1] + 1 if start else 0
+        stop = newlines[end - 1] if end <= len(newlines) else len(self.buffer)
+        return self.buffer[begin:stop].decode(self.entry["encoding"]).split("\n")
+
+    def insert(self, line: int, new_str: str) -> Tuple[str, Optional[List[int]]]:
+        """
+        Text with `new_str` inserted after line `line` (as split by "\\n"), and the newline
+        index of that text written as utf-8 (None if the file is not indexed by newlines).
+        """
+        newlines = self.newlines
+        if newlines is None:
+            lines = self.text.split("\n")
+            return "\n".join(lines[:line] + [new_str] + lines[line:]), None
+
+        inserted = new_str.encode("utf-8")
+        if line <= len(newlines):
+            # before the (line + 1)-th line
+            pos = newlines[line - 1] + 1 if line else 0
+            char_pos = self._char_offset(pos)
+            text = self.text[:char_pos] + new_str + "\n" + self.text[char_pos:]
+            shift = len(inserted) + 1
+            updated_newlines = (
+                newlines[:line]
+                + find_newlines(inserted, pos)
+                + [pos + len(inserted)]
+                + [offset + shift for offset in newlines[line:]]
+            )
+        else:
+            # after the last line
+            pos = len(self.buffer)
+            text = self.text + "\n" + new_str
+            updated_newlines = newlines + [pos] + find_newlines(inserted, pos + 1)
+        if OTHER_LINE_BREAKS.search(inserted):
+            return text, None
+        return text, updated_newlines
+
+    def replace(self, old_str: str, new_str: str) -> Optional[List[int]]:
+        """
+        Newline index of the text with the (unique) `old_str` replaced by `new_str`, written
+        as utf-8 (None if the file is not indexed by newlines).
+        """
+        newlines = self.newlines
+        if newlines is None:
+            return None
+        old, new = old_str.encode("utf-8"), new_str.encode("utf-8")
+        pos = self.buffer.find(old)
+        if pos == -1 or OTHER_LINE_BREAKS.search(new):
+            return None
+        shift = len(new) - len(old)
+        return (
+            newlines[: bisect.bisect_left(newlines, pos)]
+            + find_newlines(new, pos)
+            + [offset + shift for offset in newlines[bisect.bisect_left(newlines, pos + len(old)) :]]
+        )
+
+    def _char_offset(self, pos: int) -> int:
+        """Offset in the text of byte offset `pos` (of an indexed file)."""
+        if len(self.text) == len(self.buffer):  # ascii
+            return pos
+        return len(self.buffer[:pos].decode(self.entry["encoding"]))
+
+    @staticmethod
+    def prime(data: bytes, newlines: Optional[List[int]] = None):
+        """Cache the encoding (and newline index, if known) of `data` just written as utf-8."""
+        key = hashlib.sha1(data).hexdigest()
+        if load_cache_entry(key) is None:
+            entry = {"version": CACHE_VERSION, "encoding": "utf-8"}
+            if newlines is not None:
+                entry["newlines"] = newlines
+            save_cache_entry(key, entry)
+
+    def save(self):
+        if self.dirty:
+            save_cache_entry(self.key, self.entry)
+            self.dirty = False
+
+    def close(self):
+        """Unmap the file (before it is rewritten; accessing a truncated mapping crashes)."""
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
 class StrReplaceEditor:
     """
     A file editor that supports the following commands:
@@ -197,10 +432,12 @@ class StrReplaceEditor:
 
     @staticmethod
     def read_path(path: Path) -> str:
-        encoding = chardet.detect(path.read_bytes())["encoding"]
-        if encoding is None:
-            encoding = "utf-8"
-        return path.read_text(encoding=encoding)
+        cached_file = CachedFile(path)
+        try:
+            return cached_file.text
+        finally:
+            cached_file.save()
+            cached_file.close()
 
     def view(
         self,
@@ -283,24 +520,26 @@ class StrReplaceEditor:
         # -----------------------------------------------
         # If no view_range is given, user did NOT explicitly request 'concise',
         # and we have a Python file with more than 50 lines => default to concise
+        cached_file = CachedFile(path)
         if path.suffix == ".py" and not view_range and not concise:
-            file_text_tmp = self.read_path(path)
-            if len(file_text_tmp.splitlines()) > 110:
+            if cached_file.num_lines > 110:
                 concise = True
 
         # For a file
         if path.suffix == ".py" and concise:
             # Use the tree_sitter approach
-            lines_with_original_numbers = self._get_elided_lines(path)
+            try:
+                lines_with_original_numbers = self._get_elided_lines(path, cached_file)
+            finally:
+                cached_file.save()
+            total_lines = len(lines_with_original_numbers)
         else:
-            # Normal reading
-            file_text = self.read_path(path)
-            lines_with_original_numbers = [
-                (i, line) for i, line in enumerate(file_text.splitlines())
-            ]
+            # Normal reading (lines are only split once the range is known)
+            lines_with_original_numbers = None
+            total_lines = cached_file.num_lines
+            cached_file.save()
 
         # Optionally slice by [start_line, end_line]
-        total_lines = len(lines_with_original_numbers)
         if view_range and len(view_range) == 2:
             start, end = view_range
             if not (1 <= start <= total_lines):
@@ -319,15 +558,25 @@ class StrReplaceEditor:
                     ),
                 )
 
-            # Filter lines by 1-based index
-            sliced_lines = []
-            for i, text in lines_with_original_numbers:
-                one_based = i + 1
-                if one_based < start:
-                    continue
-                if end != -1 and one_based > end:
-                    continue
-                sliced_lines.append((i, text))
+            if lines_with_original_numbers is None:
+                sliced_lines = list(
+                    enumerate(
+                        cached_file.lines(start - 1, None if end == -1 else end),
+                        start - 1,
+                    )
+                )
+            else:
+                # Filter lines by 1-based index
+                sliced_lines = []
+                for i, text in lines_with_original_numbers:
+                    one_based = i + 1
+                    if one_based < start:
+                        continue
+                    if end != -1 and one_based > end:
+                        continue
+                    sliced_lines.append((i, text))
+        elif lines_with_original_numbers is None:
+            sliced_lines = list(enumerate(cached_file.lines()))
         else:
             # No slicing
             sliced_lines = lines_with_original_numbers
@@ -349,20 +598,69 @@ class StrReplaceEditor:
         final_output = maybe_truncate(final_output)
         return EditorResult(output=final_output)
 
-    def _get_elided_lines(self, path: Path) -> List[Tuple[int, str]]:
+    def _get_elided_lines(
+        self, path: Path, cached_file: Optional[CachedFile] = None
+    ) -> List[Tuple[int, str]]:
         """
         Parse the Python file with the built-in 'ast' module to skip
         large function bodies (≥ 5 lines).
         Return a list of (zero_based_line_idx, text).
+        The elided ranges (or the syntax error) are kept in the file's cache entry.
+        """
+        if cached_file is None:
+            cached_file = CachedFile(path)
+        if "elide_line_ranges" not in cached_file.entry:
+            try:
+                elide_line_ranges = self._find_elided_ranges(
+                    cached_file.text, str(path)
+                )
+                cached_file.entry["elide_line_ranges"] = elide_line_ranges
+            except SyntaxError as e:
+                cached_file.entry["elide_line_ranges"] = None
+                # without the file name: the entry is shared by every file with these bytes
+                cached_file.entry["syntax_error"] = (e.msg, e.lineno)
+            cached_file.dirty = True
+
+        elide_line_ranges = cached_file.entry["elide_line_ranges"]
+        if elide_line_ranges is None:
+            # same message as str(SyntaxError) for this path
+            msg, lineno = cached_file.entry["syntax_error"]
+            location = f"{path.name}, line {lineno}" if lineno else path.name
+            # Raise EditorError to make sure we handle it gracefully upstream
+            raise EditorError(f"Syntax error for file {path}: {msg} ({location})")
+
+        # Build a set of lines to skip
+        elide_lines = {
+            line for (start, end) in elide_line_ranges for line in range(start, end + 1)
+        }
+
+        # Add an "elision notice" at the beginning of each range
+        elide_messages = [
+            (start, f"... eliding lines {start+1}-{end+1} ...")
+            for (start, end) in elide_line_ranges
+        ]
+
+        # Lines we do keep
+        all_lines = cached_file.lines()
+        keep_lines = [
+            (i, line) for i, line in enumerate(all_lines) if i not in elide_lines
+        ]
+
+        # Combine and sort by line index
+        combined = elide_messages + keep_lines
+        combined.sort(key=lambda x: x[0])
+
+        return combined
+
+    @staticmethod
+    def _find_elided_ranges(file_text: str, filename: str) -> List[Tuple[int, int]]:
+        """
+        0-based inclusive line ranges of large function bodies and class docstrings.
+        Raises SyntaxError if the file does not parse.
         """
         import ast
 
-        file_text = self.read_path(path)
-        try:
-            tree = ast.parse(file_text, filename=str(path))
-        except SyntaxError as e:
-            # Raise EditorError to make sure we handle it gracefully upstream
-            raise EditorError(f"Syntax error for file {path}: {e}")
+        tree = ast.parse(file_text, filename=filename)
 
         def max_lineno_in_subtree(n: ast.AST) -> int:
             m = getattr(n, "lineno", 0)
@@ -421,28 +719,7 @@ class StrReplaceEditor:
                             (docstring_start + 1, docstring_end - 1)
                         )
 
-        # Build a set of lines to skip
-        elide_lines = {
-            line for (start, end) in elide_line_ranges for line in range(start, end + 1)
-        }
-
-        # Add an "elision notice" at the beginning of each range
-        elide_messages = [
-            (start, f"... eliding lines {start+1}-{end+1} ...")
-            for (start, end) in elide_line_ranges
-        ]
-
-        # Lines we do keep
-        all_lines = file_text.splitlines()
-        keep_lines = [
-            (i, line) for i, line in enumerate(all_lines) if i not in elide_lines
-        ]
-
-        # Combine and sort by line index
-        combined = elide_messages + keep_lines
-        combined.sort(key=lambda x: x[0])
-
-        return combined
+        return elide_line_ranges
 
     def create(self, path: Path, file_text: str) -> EditorResult:
         if file_text is None:
@@ -469,7 +746,8 @@ class StrReplaceEditor:
         if old_str is None:
             raise EditorError("Missing required parameter 'old_str' for 'str_replace'.")
 
-        file_content = self.read_file(path).expandtabs()
+        cached_file = self.read_cached_file(path)
+        file_content = cached_file.text.expandtabs()
         old_str = old_str.expandtabs()
         new_str = new_str.expandtabs() if new_str else ""
         occurrences = file_content.count(old_str)
@@ -491,8 +769,12 @@ class StrReplaceEditor:
             if lint_error:
                 return EditorResult(output="", error=_LINT_ERROR_TEMPLATE + lint_error)
 
+        newlines = None
+        if file_content == cached_file.text:  # else the index is of the unexpanded tabs
+            newlines = cached_file.replace(old_str, new_str)
+        cached_file.close()
         self.file_history[str(path)].append(old_text)
-        self.write_file(path, updated_text)
+        self.write_file(path, updated_text, newlines)
 
         # Original snippet logic
         replacement_line = file_content.split(old_str)[0].count("\n")
@@ -512,39 +794,52 @@ class StrReplaceEditor:
         if new_str is None:
             raise EditorError("Missing required parameter 'new_str' for 'insert'.")
 
-        old_text = self.read_file(path).expandtabs()
+        cached_file = self.read_cached_file(path)
+        old_text = cached_file.text.expandtabs()
         new_str = new_str.expandtabs()
-        file_text_lines = old_text.split("\n")
-
-        if insert_line < 0 or insert_line > len(file_text_lines):
+        if old_text == cached_file.text:
+            num_lines = cached_file.num_split_lines
+            split_lines = cached_file.split_lines
+        else:
+            # expanding the tabs changed the text, so the line index does not apply
+            cached_file.close()
+            cached_file = None
+            file_text_lines = old_text.split("\n")
+            num_lines = len(file_text_lines)
+            split_lines = lambda start, end: file_text_lines[start:end]
+
+        if insert_line < 0 or insert_line > num_lines:
             raise EditorError(
-                f"Invalid insert_line {insert_line}. Must be in [0, {len(file_text_lines)}]."
+                f"Invalid insert_line {insert_line}. Must be in [0, {num_lines}]."
             )
 
         new_str_lines = new_str.split("\n")
-        new_file_text_lines = (
-            file_text_lines[:insert_line]
-            + new_str_lines
-            + file_text_lines[insert_line:]
-        )
-        updated_text = "\n".join(new_file_text_lines)
+        if cached_file is not None:
+            updated_text, newlines = cached_file.insert(insert_line, new_str)
+        else:
+            updated_text = "\n".join(
+                file_text_lines[:insert_line] + new_str_lines + file_text_lines[insert_line:]
+            )
+            newlines = None
 
         if self.enable_linting and path.suffix == ".py":
             lint_error = self._lint_check(updated_text, str(path))
             if lint_error:
                 return EditorResult(output="", error=_LINT_ERROR_TEMPLATE + lint_error)
 
-        self.file_history[str(path)].append(old_text)
-        self.write_file(path, updated_text)
-
         # Original snippet logic
         snippet_lines = (
-            file_text_lines[max(0, insert_line - SNIPPET_LINES) : insert_line]
+            split_lines(max(0, insert_line - SNIPPET_LINES), insert_line)
             + new_str_lines
-            + file_text_lines[insert_line : insert_line + SNIPPET_LINES]
+            + split_lines(insert_line, insert_line + SNIPPET_LINES)
         )
         snippet = "\n".join(snippet_lines)
 
+        if cached_file is not None:
+            cached_file.close()
+        self.file_history[str(path)].append(old_text)
+        self.write_file(path, updated_text, newlines)
+
         success_msg = f"The file {path} has been edited. "
         success_msg += self._make_output(
             snippet,
@@ -579,11 +874,27 @@ class StrReplaceEditor:
         except Exception as e:
             raise EditorError(f"Failed to read file {path}: {e}")
 
-    def write_file(self, path: Path, content: str):
+    def read_cached_file(self, path: Path) -> CachedFile:
+        """The file with its decoded text and line index (see `CachedFile`)."""
+        try:
+            cached_file = CachedFile(path)
+            cached_file.newlines  # decodes the text
+        except Exception as e:
+            raise EditorError(f"Failed to read file {path}: {e}")
+        cached_file.save()
+        return cached_file
+
+    def write_file(self, path: Path, content: str, newlines: Optional[List[int]] = None):
+        """
+        Write `content` as utf-8. `newlines` is its newline index if the caller patched it
+        from the previous version (cached for the next view of the file).
+        """
         try:
-            path.write_text(content, encoding="utf-8")
+            data = content.encode("utf-8")
+            path.write_bytes(data)
         except Exception as e:
             raise EditorError(f"Failed to write file {path}: {e}")
+        CachedFile.prime(data, newlines)
 
     def _make_output(
         self,
@@ -703,7 +1014,9 @@ def main():
 
     args = parser.parse_args()
 
-    file_history = load_history()
+    # `view` does not touch the edit history (and must not write it: views run concurrently)
+    read_only = args.command == "view"
+    file_history = {} if read_only else load_history()
     editor = StrReplaceEditor(file_history, enable_linting=args.enable_linting)
     if args.concise.lower() == "true":
         args.concise = True
@@ -733,7 +1046,8 @@ def main():
 
         traceback.print_exc()
 
-    save_history(dict(editor.file_history))
+    if not read_only:
+        save_history(dict(editor.file_history))
 
 
 if __name__ == "__main__":
@@ -14,9 +14,202 @@ Behavior:
 """
 
 import argparse
+import concurrent.futures
+import io
+import locale
+import marshal
+import mmap
 import os
+import re
 import sys
 import subprocess
+import time
+import zlib
+
+# trigram index of the repository files (see `build_index`): created at env setup, then
+# used and refreshed by directory searches. Without it, searches read every file.
+INDEX_PATH = "/root/.r2egym_search_index"
+INDEX_VERSION = 1
+# files modified this recently are not indexed: a later edit of the same size within the
+# file system's timestamp granularity would leave (mtime, size) unchanged
+RACY_MTIME_NS = 2 * 10**9
+
+MAX_FILES_MATCHED = 100  # more matching files: ask to narrow the search
+SEARCH_THREADS = 8
+# like git / grep: a NUL byte among the first bytes marks a binary file (never searched)
+BINARY_SNIFF_BYTES = 8000
+NON_ASCII_BYTE = re.compile(rb"[\x80-\xff]")
+
+
+def git_visible_files(directory: str):
+    """
+    Files under `directory` that git does not ignore (tracked, or untracked and not matched by
+    .gitignore / info/exclude), or None if `directory` is not in a git work tree or is ignored
+    as a whole (an explicit search there searches everything).
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", directory, "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError:  # git not installed
+        return None
+    if result.returncode != 0:
+        return None
+    paths = result.stdout.decode("utf-8", errors="surrogateescape").split("\0")
+    return {os.path.join(directory, path) for path in paths if path} or None
+
+
+def may_match(filepath: str, term_bytes) -> bool:
+    """
+    False if `filepath` is binary or cannot contain the search term, checked on an mmap of the
+    file without decoding it. The (encoded) term missing from the bytes only rules the file out
+    if they are all ASCII: decoding other bytes with errors="ignore" can drop some of them (a
+    term split by invalid bytes still matches). `term_bytes` None: no check of the term.
+    """
+    with open(filepath, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return False
+        except OSError:  # not mappable (e.g. special file): decide when reading it
+            return True
+        with mm:
+            if mm.find(b"\0", 0, BINARY_SNIFF_BYTES) != -1:
+                return False
+            if term_bytes is None or mm.find(term_bytes) != -1:
+                return True
+            return NON_ASCII_BYTE.search(mm) is not None
+
+
+def count_matching_lines(text: str, search_term: str) -> int:
+    # same line splitting as iterating over the file in text mode
+    return sum(1 for line in io.StringIO(text) if search_term in line)
+
+
+def trigram_hash(trigram: str) -> int:
+    return zlib.crc32(trigram.encode("utf-8", "surrogatepass"))
+
+
+def trigram_bits(text: str) -> bytes:
+    """Bit set (one hashed bit per distinct trigram, ~8 bits per trigram) of the trigrams of `text`."""
+    trigrams = {text[i : i + 3] for i in range(len(text) - 2)}
+    bits = bytearray(max(64, len(trigrams)))
+    num_bits = len(bits) * 8
+    for trigram in trigrams:
+        pos = trigram_hash(trigram) % num_bits
+        bits[pos >> 3] |= 1 << (pos & 7)
+    return bytes(bits)
+
+
+class SearchIndex:
+    """
+    Per-file trigram bit sets, keyed by absolute path and valid for the file's (mtime, size).
+    A file whose bit set lacks one of the search term's trigrams cannot contain the term and
+    is not read; every other file is read and counted exactly as without the index, so the
+    output is identical. Entries of new or modified files are refreshed when they are read.
+    """
+
+    def __init__(self, path: str = INDEX_PATH, files: dict = None):
+        self.path = path
+        self.files = files if files is not None else {}  # path -> (mtime_ns, size, bits)
+        self.changed = False
+
+    @classmethod
+    def load(cls, path: str = INDEX_PATH):
+        """The index at `path`, or None if there is none (or it is unreadable)."""
+        try:
+            with open(path, "rb") as f:
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return None
+        return cls(path, data["files"])
+
+    def save(self):
+        # atomic replace: concurrent searches / builds never see a partial index
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump({"version": INDEX_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    def update(self, filepath: str, stat: os.stat_result, text: str):
+        if int(time.time() * 1e9) - stat.st_mtime_ns < RACY_MTIME_NS:
+            if self.files.pop(filepath, None) is not None:
+                self.changed = True
+            return
+        self.files[filepath] = (stat.st_mtime_ns, stat.st_size, trigram_bits(text))
+        self.changed = True
+
+    def get_bits(self, filepath: str, stat: os.stat_result):
+        """Trigram bit set of `filepath` if it is indexed and unchanged, else None."""
+        entry = self.files.get(filepath)
+        if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+            return None
+        return entry[2]
+
+    @staticmethod
+    def may_contain(bits: bytes, term_hashes: list) -> bool:
+        num_bits = len(bits) * 8
+        for term_hash in term_hashes:
+            pos = term_hash % num_bits
+            if not bits[pos >> 3] >> (pos & 7) & 1:
+                return False
+        return True
+
+    def count_matches(self, filepath: str, search_term: str, term_hashes: list, term_bytes) -> int:
+        """Number of lines of `filepath` containing `search_term` (reading it only if needed)."""
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            stat = None  # let open() fail (or not) as it would without the index
+        bits = self.get_bits(filepath, stat) if stat is not None else None
+        if bits is not None and not self.may_contain(bits, term_hashes):
+            return 0
+        if not may_match(filepath, term_bytes):
+            return 0
+        with open(filepath, "r", errors="ignore") as f:
+            text = f.read()
+        if stat is not None and bits is None:
+            self.update(filepath, stat, text)
+        return count_matching_lines(text, search_term)
+
+
+def build_index(directory: str = ".", python_only: bool = True, index_path: str = INDEX_PATH):
+    """
+    (Re)build the search index for the non-hidden files under `directory` (only the .py files
+    with `python_only`, which directory searches default to; other files are simply read).
+    """
+    directory = os.path.realpath(directory)
+    index = SearchIndex.load(index_path) or SearchIndex(index_path)
+    old_files = index.files
+    # entries of other directories are kept, those of deleted files under `directory` dropped
+    index.files = {
+        path: entry for path, entry in old_files.items()
+        if not path.startswith(directory + os.sep)
+    }
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for file in files:
+            if file.startswith(".") or (python_only and not file.endswith(".py")):
+                continue
+            filepath = os.path.join(root, file)
+            try:
+                stat = os.stat(filepath)
+                entry = old_files.get(filepath)
+                if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                    index.files[filepath] = entry  # unchanged since the last build
+                    continue
+                with open(filepath, "r", errors="ignore") as f:
+                    index.update(filepath, stat, f.read())
+            except (OSError, UnicodeDecodeError):
+                continue
+    index.save()
+    print(f"Indexed {len(index.files)} files under {directory} in {index_path}")
+
 
 def search_in_directory(search_term: str, directory: str = ".", python_only: bool = False):
     """
@@ -30,9 +223,9 @@ def search_in_directory(search_term: str, directory: str = ".", python_only: boo
         print(f"Directory '{directory}' not found or not a directory.")
         sys.exit(1)
 
-    matches = {}
-    num_files_matched = 0
-
+    # candidate files in walk order: non-hidden, not ignored by git
+    visible_files = git_visible_files(directory)
+    filepaths = []
     for root, dirs, files in os.walk(directory):
         # Exclude hidden directories
         dirs[:] = [d for d in dirs if not d.startswith(".")]
@@ -46,18 +239,58 @@ def search_in_directory(search_term: str, directory: str = ".", python_only: boo
                 continue
 
             filepath = os.path.join(root, file)
-            try:
-                with open(filepath, "r", errors="ignore") as f:
-                    file_matches = 0
-                    for line_num, line in enumerate(f, 1):
-                        if search_term in line:
-                            file_matches += 1
-                    if file_matches > 0:
-                        matches[filepath] = file_matches
-                        num_files_matched += 1
-            except (UnicodeDecodeError, PermissionError):
-                # Skip files that can't be read
+            if visible_files is not None and filepath not in visible_files:
                 continue
+            filepaths.append(filepath)
+
+    # skip files that cannot contain the term (see SearchIndex)
+    index = SearchIndex.load(INDEX_PATH)
+    term_hashes = [
+        trigram_hash(search_term[i : i + 3]) for i in range(len(search_term) - 2)
+    ]
+    try:
+        # the bytes the term has in (ASCII) files decoded like open() does
+        term_bytes = search_term.encode(locale.getpreferredencoding(False))
+    except UnicodeEncodeError:
+        term_bytes = None
+    if "\r" in search_term or "\n" in search_term:
+        term_bytes = None  # text mode translates the file's line endings
+
+    def scan(filepath):
+        try:
+            if index is not None:
+                return index.count_matches(filepath, search_term, term_hashes, term_bytes)
+            if not may_match(filepath, term_bytes):
+                return 0
+            with open(filepath, "r", errors="ignore") as f:
+                return count_matching_lines(f.read(), search_term)
+        except (UnicodeDecodeError, PermissionError):
+            # Skip files that can't be read
+            return 0
+
+    # scan concurrently, stopping as soon as more than MAX_FILES_MATCHED files matched
+    file_matches = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_THREADS)
+    futures = {executor.submit(scan, filepath): filepath for filepath in filepaths}
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            count = future.result()
+            if count > 0:
+                file_matches[futures[future]] = count
+                if len(file_matches) > MAX_FILES_MATCHED:
+                    break
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+    matches = {filepath: file_matches[filepath] for filepath in filepaths if filepath in file_matches}
+    num_files_matched = len(matches)
+
+    if index is not None and index.changed:
+        try:
+            index.save()
+        except OSError:
+            pass
 
     if not matches:
         print(f'No matches found for "{search_term}" in {directory}')
@@ -65,7 +298,7 @@ def search_in_directory(search_term: str, directory: str = ".", python_only: boo
 
     # Summarize
     num_matches = sum(matches.values())
-    if num_files_matched > 100:
+    if num_files_matched > MAX_FILES_MATCHED:
         print(
             f'More than {num_files_matched} files matched for "{search_term}" in {directory}. '
             "Please narrow your search."
@@ -209,7 +442,9 @@ def main():
         description="search tool: run subcommands such as `search` for files or directories."
     )
     parser.add_argument(
-        "--search_term", help="Term to search for in files.", required=True
+        "--search_term",
+        help="Term to search for in files.",
+        required="--build_index" not in sys.argv[1:],
     )
     parser.add_argument(
         "--path",
@@ -223,7 +458,13 @@ def main():
         help="If set, only search for matches in .py files when searching a directory."
     )
 
+    # env setup only: (re)build the search index for --path
+    parser.add_argument("--build_index", action="store_true", help=argparse.SUPPRESS)
+
     args = parser.parse_args()
+    if args.build_index:
+        build_index(args.path)
+        return
     # Check if path is a file or a directory
     if os.path.isfile(args.path):
         search_in_file(args.search_term, args.path)
@@ -31,6 +31,7 @@ Allowed values: [`view`, `create`, `str_replace`, `insert`]
 
 import argparse
 import json
+import os
 import subprocess
 from pathlib import Path
 from collections import defaultdict
@@ -122,10 +123,13 @@ def load_history() -> Dict[str, List[str]]:
 def save_history(history: Dict[str, List[str]]):
     """
     Save the file edit history to STATE_FILE as JSON.
+    The file is replaced atomically, so concurrent calls never read a partial state.
     """
     try:
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
+        tmp_path = "{}.{}.tmp".format(STATE_FILE, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(history, f)
+        os.replace(tmp_path, STATE_FILE)
     except Exception as e:
         safe_print(f"Warning: Could not write editor history to {STATE_FILE}: {e}")
 
@@ -582,7 +586,9 @@ def main():
 
     args = parser.parse_args()
 
-    file_history = load_history()
+    # `view` does not touch the edit history (and must not write it: views run concurrently)
+    read_only = args.command == "view"
+    file_history = {} if read_only else load_history()
     editor = StrReplaceEditor(file_history, enable_linting=args.enable_linting)
 
     try:
@@ -608,7 +614,8 @@ def main():
 
         traceback.print_exc()
 
-    save_history(dict(editor.file_history))
+    if not read_only:
+        save_history(dict(editor.file_history))
 
 
 if __name__ == "__main__":
@@ -30,6 +30,7 @@ class TrajectoryStep(BaseModel):
     token_usage_prompt: int
     token_usage_completion: int
     token_usage_total: int
+    token_count_context: Optional[int] = None  # locally counted prompt tokens (cached per message)
 
     ## metadata (current step stats)
     llm_exec_time: float
@@ -87,6 +88,9 @@ class Trajectory(BaseModel):
     ##############################
     exit_reason: str  # reason for exit
     output_patch: str  # final output patch
+    message_token_counts: list[int] = []  # token count per message of the final history
+    speculation_stats: Optional[dict] = None  # speculative prefetch hits / misses (if enabled)
+    spans: list[dict] = []  # timed phases of the episode (see utils/tracing.py)
     # outputs after test execution [Optional]
     reward: Optional[float] = None  # success for editing agent
     reward_calc_time: Optional[float] = None  # time taken to calculate reward
@@ -0,0 +1,339 @@
+"""
+Shared LLM gateway: one local OpenAI-compatible endpoint that all episode processes talk to.
+
+    python -m r2egym.agenthub.utils.llm_gateway --port 8100 \
+        --requests_per_minute '{"*": 500}' --tokens_per_minute '{"*": 2000000}'
+    export LLM_GATEWAY_URL=http://localhost:8100/v1   # picked up by Agent
+
+The gateway forwards `/v1/chat/completions` requests to the real provider with litellm and
+coordinates all episodes in one place:
+- adaptive concurrency per model (AIMD: +1/limit per success, x`backoff` on a rate limit),
+- token buckets per model (requests / tokens per minute),
+- rate-limit retries with jittered exponential backoff (episodes do not stall in lockstep),
+- coalescing of identical in-flight deterministic (temperature 0) requests,
+- priority: requests of episodes close to their step limit are served first.
+
+`upstream_base_url` is used for locally hosted models (`openai/...`, `hosted_vllm/...`), e.g.
+a vllm server or a stub OpenAI-compatible server on localhost:8000.
+"""
+
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import hashlib
+import itertools
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional
+
+import litellm
+from aiohttp import web
+from fire import Fire
+
+from r2egym.agenthub.utils.log import get_logger
+
+PRIORITY_HEADER = "X-R2E-Priority"  # float, higher is served first
+TOKENS_HEADER = "X-R2E-Tokens"  # prompt tokens (counted by the client)
+DEFAULT_LIMIT_KEY = "*"  # per-model limit dicts: default for models not listed
+
+
+##############################################################################
+# rate limiting primitives
+##############################################################################
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to `capacity`; `acquire(n)` waits for n units."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()  # waiters are served in FIFO order
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float):
+        # a request larger than the bucket would never fit: let it through on a full bucket
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.level < amount:
+                await asyncio.sleep((amount - self.level) / self.rate)
+                self._refill()
+            self.level -= amount
+
+    def consume(self, amount: float):
+        """Charge units after the fact (e.g. completion tokens); the level may go negative."""
+        self._refill()
+        self.level -= amount
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: every successful request raises the limit by 1/limit (about +1 per
+    round of requests), a rate-limited request multiplies it by `backoff` (at most once per
+    `decrease_interval` seconds, so one burst of 429s counts once). Waiters are admitted by
+    priority (higher first), then FIFO.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 16,
+        min_limit: float = 1,
+        max_limit: float = 256,
+        backoff: float = 0.5,
+        decrease_interval: float = 5.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters = []  # heap of (-priority, seq, future)
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: float = 0.0):
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted just before the cancellation: hand it on
+                self.in_flight -= 1
+                self._wake()
+            raise
+
+    def release(self, outcome: str = "success"):
+        """`outcome`: "success", "rate_limited" or "error" (does not change the limit)."""
+        self.in_flight -= 1
+        if outcome == "success":
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif outcome == "rate_limited":
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_interval:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # cancelled waiter
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+
+##############################################################################
+# gateway
+##############################################################################
+@dataclass
+class GatewayStats:
+    requests: int = 0
+    coalesced: int = 0
+    upstream_calls: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+    queue_time: float = 0.0  # total seconds spent waiting for concurrency / rate limits
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class _ModelLimits:
+    def __init__(self, limiter, requests, tokens):
+        self.limiter = limiter
+        self.requests = requests
+        self.tokens = tokens
+
+
+class LLMGateway:
+    """Forwards chat completion requests to the provider under shared per-model limits (see module doc)."""
+
+    def __init__(
+        self,
+        upstream_base_url: Optional[str] = None,
+        initial_concurrency: int = 16,
+        max_concurrency: int = 256,
+        requests_per_minute: Optional[Dict[str, float]] = None,
+        tokens_per_minute: Optional[Dict[str, float]] = None,
+        max_retries: int = 8,
+        timeout: float = 3000,
+        logger=None,
+    ):
+        self.upstream_base_url = upstream_base_url or os.environ.get(
+            "LLM_BASE_URL", "http://localhost:8000/v1"
+        )
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute or {}
+        self.tokens_per_minute = tokens_per_minute or {}
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.logger = get_logger("LLMGateway") if logger is None else logger
+
+        self.stats = GatewayStats()
+        self._limits: Dict[str, _ModelLimits] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}  # coalescing key -> upstream call
+
+    def _limits_for(self, model: str) -> _ModelLimits:
+        if model not in self._limits:
+            rpm = self.requests_per_minute.get(model, self.requests_per_minute.get(DEFAULT_LIMIT_KEY))
+            tpm = self.tokens_per_minute.get(model, self.tokens_per_minute.get(DEFAULT_LIMIT_KEY))
+            self._limits[model] = _ModelLimits(
+                AdaptiveConcurrencyLimiter(self.initial_concurrency, max_limit=self.max_concurrency),
+                TokenBucket(rpm) if rpm else None,
+                TokenBucket(tpm) if tpm else None,
+            )
+        return self._limits[model]
+
+    def _api_base(self, model: str) -> Optional[str]:
+        # same routing as Agent: only locally hosted models use a custom base url
+        if "openai/" in model or "hosted_vllm" in model:
+            return self.upstream_base_url
+        return None
+
+    @staticmethod
+    def _coalesce_key(body: Dict[str, Any]) -> Optional[str]:
+        """Identical deterministic requests share one upstream call (None: do not coalesce)."""
+        if body.get("temperature") != 0 or body.get("n", 1) != 1:
+            return None
+        return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+    async def complete(
+        self, body: Dict[str, Any], priority: float = 0.0, tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        self.stats.requests += 1
+        key = self._coalesce_key(body)
+        if key is None:
+            return await self._complete(body, priority, tokens)
+        if key in self._in_flight:
+            self.stats.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._complete(body, priority, tokens))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shield: a disconnecting client must not cancel the call shared with the others
+        return await asyncio.shield(self._in_flight[key])
+
+    async def _complete(
+        self, body: Dict[str, Any], priority: float, tokens: Optional[int]
+    ) -> Dict[str, Any]:
+        model = body["model"]
+        limits = self._limits_for(model)
+        if tokens is None:
+            tokens = len(json.dumps(body.get("messages", []))) // 4
+        for attempt in range(1, self.max_retries + 1):
+            start_time = time.time()
+            await limits.limiter.acquire(priority)
+            outcome = "error"
+            try:
+                if limits.requests is not None:
+                    await limits.requests.acquire(1)
+                if limits.tokens is not None:
+                    await limits.tokens.acquire(tokens)
+                self.stats.queue_time += time.time() - start_time
+                self.stats.upstream_calls += 1
+                response = await litellm.acompletion(
+                    **body, api_base=self._api_base(model), timeout=self.timeout
+                )
+                outcome = "success"
+            except litellm.RateLimitError as e:
+                outcome = "rate_limited"
+                self.stats.rate_limited += 1
+                if attempt == self.max_retries:
+                    raise
+                self.logger.warning(f"Rate limited on {model} (attempt {attempt}): {e}")
+            except Exception:
+                self.stats.errors += 1
+                raise
+            finally:
+                limits.limiter.release(outcome)
+            if outcome == "success":
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    self.stats.prompt_tokens += usage.prompt_tokens or 0
+                    self.stats.completion_tokens += usage.completion_tokens or 0
+                    if limits.tokens is not None:
+                        limits.tokens.consume(usage.completion_tokens or 0)
+                return response.model_dump()
+            # jittered exponential backoff, so retries of concurrent requests spread out
+            await asyncio.sleep(min(60, 2**attempt) * random.uniform(0.5, 1.0))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **asdict(self.stats),
+            "concurrency": {
+                model: {"limit": limits.limiter.limit, "in_flight": limits.limiter.in_flight}
+                for model, limits in self._limits.items()
+            },
+        }
+
+    ##########################################################################
+    # http server
+    ##########################################################################
+    async def _handle_chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if body.get("stream"):
+            return self._error_response(400, "streaming is not supported by the gateway")
+        priority = float(request.headers.get(PRIORITY_HEADER, 0))
+        tokens = request.headers.get(TOKENS_HEADER)
+        try:
+            response = await self.complete(body, priority, int(tokens) if tokens else None)
+        except litellm.RateLimitError as e:
+            return self._error_response(429, str(e), "rate_limit_error")
+        except Exception as e:
+            return self._error_response(getattr(e, "status_code", 500), repr(e))
+        return web.json_response(response)
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.to_dict())
+
+    @staticmethod
+    def _error_response(status: int, message: str, error_type: str = "api_error") -> web.Response:
+        return web.json_response({"error": {"message": message, "type": error_type}}, status=status)
+
+    def make_app(self) -> web.Application:
+        # long agent histories do not fit in aiohttp's default 1MB request body
+        app = web.Application(client_max_size=256 * 1024**2)
+        app.router.add_post("/v1/chat/completions", self._handle_chat)
+        app.router.add_post("/chat/completions", self._handle_chat)
+        app.router.add_get("/stats", self._handle_stats)
+        return app
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8100,
+    upstream_base_url: Optional[str] = None,
+    initial_concurrency: int = 16,
+    max_concurrency: int = 256,
+    requests_per_minute: Optional[Dict[str, float]] = None,
+    tokens_per_minute: Optional[Dict[str, float]] = None,
+    max_retries: int = 8,
+):
+    """Run the gateway until interrupted (limit dicts map model name, or "*", to a per-minute rate)."""
+    gateway = LLMGateway(
+        upstream_base_url=upstream_base_url,
+        initial_concurrency=initial_concurrency,
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        max_retries=max_retries,
+    )
+    gateway.logger.info(f"LLM gateway on http://{host}:{port}/v1 (upstream: {gateway.upstream_base_url})")
+    web.run_app(gateway.make_app(), host=host, port=port)
+
+
+if __name__ == "__main__":
+    Fire(serve)
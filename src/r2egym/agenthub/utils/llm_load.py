@@ -0,0 +1,50 @@
+import time
+import multiprocessing
+from contextlib import contextmanager
+from typing import Optional
+
+
+class LLMLoad:
+    """
+    LLM requests / prompt tokens in flight and the time of the last rate limit, shared by
+    all episode processes (multiprocessing values). The episode scheduler reads them to
+    decide whether to admit more episodes; Agent.model_query updates them.
+    """
+
+    def __init__(self):
+        self.requests = multiprocessing.Value("i", 0)
+        self.tokens = multiprocessing.Value("q", 0)
+        self.last_rate_limit = multiprocessing.Value("d", 0.0)
+
+    @contextmanager
+    def request(self, tokens: int):
+        with self.requests.get_lock():
+            self.requests.value += 1
+        with self.tokens.get_lock():
+            self.tokens.value += tokens
+        try:
+            yield
+        finally:
+            with self.requests.get_lock():
+                self.requests.value -= 1
+            with self.tokens.get_lock():
+                self.tokens.value -= tokens
+
+    def rate_limited(self):
+        self.last_rate_limit.value = time.time()
+
+    def seconds_since_rate_limit(self) -> float:
+        return time.time() - self.last_rate_limit.value
+
+
+_llm_load: Optional[LLMLoad] = None
+
+
+def set_llm_load(llm_load: Optional[LLMLoad]):
+    """Install the shared LLMLoad in this process (used as ProcessPoolExecutor initializer)."""
+    global _llm_load
+    _llm_load = llm_load
+
+
+def get_llm_load() -> Optional[LLMLoad]:
+    return _llm_load
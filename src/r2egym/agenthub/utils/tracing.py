@@ -0,0 +1,265 @@
+import os
+import json
+import math
+import time
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from fire import Fire
+
+
+@dataclass
+class Span:
+    name: str  # phase, e.g. "runtime.setup_env" (component.phase)
+    start: float  # wall clock (epoch seconds)
+    duration: float  # seconds
+    thread: int = 0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None  # exception raised inside the span
+
+
+##############################################################################
+# per-episode tracer
+##############################################################################
+class Tracer:
+    """
+    Collects timed spans for the phases of one episode (container start, setup, tool install,
+    LLM queries, env steps, reward tests, ...). The tracer of the current episode is found
+    through a context variable (see `use_tracer` / `trace_span`), so runtime, env and agent code
+    record spans without passing it around; code running outside an episode records nothing.
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, duration: float, error: Optional[str] = None, **attrs):
+        span = Span(name, start, duration, threading.get_ident(), attrs, error)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Dict[str, Any]]:
+        """Time the block as span `name`; attributes can be added to the yielded dict."""
+        start, perf_start = time.time(), time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            self.record(name, start, time.perf_counter() - perf_start, error=error, **attrs)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [asdict(span) for span in self.spans]
+
+
+_current_tracer: contextvars.ContextVar[Optional[Tracer]] = contextvars.ContextVar(
+    "r2egym_tracer", default=None
+)
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _current_tracer.get()
+
+
+@contextmanager
+def use_tracer(tracer: Tracer) -> Iterator[Tracer]:
+    """Make `tracer` the current tracer in this context (and threads started with its context)."""
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+@contextmanager
+def trace_span(name: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """Time the block as span `name` on the current tracer (no-op without one)."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield attrs
+        return
+    with tracer.span(name, **attrs) as span_attrs:
+        yield span_attrs
+
+
+def traced(name: str):
+    """Decorator: record every call of the function as span `name`."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with trace_span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def episode_tracer(fn):
+    """Decorator: run every call of the function with a new Tracer as the current tracer."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with use_tracer(Tracer()):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+##############################################################################
+# export
+##############################################################################
+def to_chrome_trace(spans: Iterable[Dict[str, Any]], process_name: str = "episode") -> Dict[str, Any]:
+    """Chrome trace event format (chrome://tracing, Perfetto) of span dicts."""
+    events = [
+        {"name": "process_name", "ph": "M", "pid": 0, "tid": 0, "args": {"name": process_name}}
+    ]
+    for span in spans:
+        args = dict(span.get("attrs") or {})
+        if span.get("error"):
+            args["error"] = span["error"]
+        events.append(
+            {
+                "name": span["name"],
+                "cat": span["name"].split(".", 1)[0],
+                "ph": "X",
+                "ts": span["start"] * 1e6,
+                "dur": span["duration"] * 1e6,
+                "pid": 0,
+                "tid": span.get("thread", 0),
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: Iterable[Dict[str, Any]], service_name: str = "r2egym", trace_id: Optional[str] = None) -> Dict[str, Any]:
+    """OpenTelemetry (OTLP/JSON `ExportTraceServiceRequest`) of span dicts, as one trace."""
+    trace_id = trace_id or os.urandom(16).hex()
+    otlp_spans = []
+    for span in spans:
+        start_ns = int(span["start"] * 1e9)
+        attrs = dict(span.get("attrs") or {})
+        otlp_span = {
+            "traceId": trace_id,
+            "spanId": os.urandom(8).hex(),
+            "name": span["name"],
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(span["duration"] * 1e9)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items()],
+        }
+        if span.get("error"):
+            otlp_span["status"] = {"code": 2, "message": span["error"]}  # STATUS_CODE_ERROR
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]
+                },
+                "scopeSpans": [{"scope": {"name": "r2egym"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+def export_trace(spans: Sequence[Dict[str, Any]], path: str, format: str = "chrome", name: str = "episode"):
+    """Write span dicts to `path` as a Chrome trace ("chrome") or OTLP JSON ("otlp") file."""
+    if format == "chrome":
+        data = to_chrome_trace(spans, process_name=name)
+    elif format == "otlp":
+        data = to_otlp(spans, service_name=name)
+    else:
+        raise ValueError(f"Invalid trace format: {format}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+##############################################################################
+# experiment summary
+##############################################################################
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    # nearest-rank percentile
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+def summarize_spans(span_lists: Iterable[Sequence[Dict[str, Any]]]) -> Dict[str, Dict[str, float]]:
+    """Per-phase count, total, mean, p50, p99 and max duration (seconds) over many episodes."""
+    durations: Dict[str, List[float]] = {}
+    for spans in span_lists:
+        for span in spans:
+            durations.setdefault(span["name"], []).append(span["duration"])
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "total": sum(values),
+            "mean": sum(values) / len(values),
+            "p50": _percentile(values, 50),
+            "p99": _percentile(values, 99),
+            "max": values[-1],
+        }
+    return dict(sorted(summary.items(), key=lambda item: -item[1]["total"]))
+
+
+def _load_span_lists(jsonl_file: str) -> Iterator[List[Dict[str, Any]]]:
+    with open(jsonl_file) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line).get("spans") or []
+
+
+def summarize(jsonl_file: str, output_json: Optional[str] = None):
+    """
+    Print the per-phase latency summary (p50 / p99 ...) of the trajectories in an
+    experiment JSONL, e.g. `python -m r2egym.agenthub.utils.tracing summarize traj/exp.jsonl`.
+    """
+    summary = summarize_spans(_load_span_lists(jsonl_file))
+    if output_json is not None:
+        with open(output_json, "w") as f:
+            json.dump(summary, f, indent=2)
+    # spans nest (e.g. agent.llm_query inside agent.run), so totals do not add up
+    print(f"{'phase':<32}{'count':>8}{'total(s)':>12}{'mean(s)':>10}{'p50(s)':>10}{'p99(s)':>10}{'max(s)':>10}")
+    for name, stats in summary.items():
+        print(
+            f"{name:<32}{stats['count']:>8}{stats['total']:>12.1f}{stats['mean']:>10.3f}"
+            f"{stats['p50']:>10.3f}{stats['p99']:>10.3f}{stats['max']:>10.3f}"
+        )
+
+
+def export(jsonl_file: str, output_dir: str, format: str = "chrome"):
+    """Write one trace file per trajectory of an experiment JSONL into `output_dir`."""
+    with open(jsonl_file) as f:
+        for idx, line in enumerate(f):
+            if not line.strip():
+                continue
+            traj = json.loads(line)
+            name = ((traj.get("ds") or {}).get("docker_image") or traj.get("docker_image") or str(idx))
+            name = name.replace("/", "_").replace(":", "_")
+            export_trace(traj.get("spans") or [], os.path.join(output_dir, f"{name}.{format}.json"), format, name)
+
+
+if __name__ == "__main__":
+    Fire({"summarize": summarize, "export": export})
@@ -17,6 +17,7 @@ from r2e.paths import REPOS_DIR
 import r2egym.repo_analysis.issues as issues
 from r2egym.logging import setup_logging, Logger, INFO
 from r2egym.agenthub.runtime.docker import DockerRuntime
+from r2egym.agenthub.runtime.prefetch import ImagePrefetcher
 from r2egym.commit_models.diff_classes import ParsedCommit
 from r2egym.repo_analysis.build_syn_issue import get_prompt
 from docker_bash_utils.docker_list_tags import fetch_docker_tags
@@ -440,110 +441,51 @@ def validate_docker_and_get_row(arg):
             pass
 
 
-def pull_image_with_retries(
-    client: docker.DockerClient, image: str, retries: int = 3, delay: int = 5
-):
-    """
-    Attempt to pull a Docker image with retries.
-
-    Args:
-        client (docker.DockerClient): Docker client instance.
-        image (str): Docker image name with tag.
-        retries (int): Number of retry attempts.
-        delay (int): Delay between retries in seconds.
-
-    Returns:
-        tuple: (image, success_flag, error_message)
-    """
-    issue_logger = setup_logging(
-        name=image,
-        log_file=f"validate_logs/{image}.log",
-        console=False,
-        level=INFO,
-    )
-    issue_logger.info(f"Attempting to pull image: {image}")
-
-    for attempt in range(1, retries + 1):
-        try:
-            repo, tag = image.split(":") if ":" in image else (image, "latest")
-            issue_logger.info(f"Attempting to pull image: {image} (Attempt {attempt})")
-            client.images.pull(repository=repo, tag=tag)
-            issue_logger.info(f"Successfully pulled image: {image}")
-            return (image, True, None)
-        except docker.errors.APIError as e:
-            if "toomanyrequests" in str(e):
-                sleep_time = (3**attempt) + random.uniform(1, 5)
-                time.sleep(sleep_time)
-                issue_logger.info(
-                    f"Rate limited while pulling image {image}. Retrying in {sleep_time} seconds."
-                )
-                continue
-        except Exception as e:
-            issue_logger.error(f"Unexpected error for image {image}: {e}")
-            return (image, False, str(e))
-    issue_logger.error(f"Max retries exceeded for image {image}")
-    return (image, False, "Max retries exceeded")
-
-
 def pre_pull_docker_images(
     image_list, max_workers=40, retries=5, delay=5, pull_timeout=300
 ):
     """
-    Pre-pull Docker images using multithreading with retries and progress monitoring.
+    Pre-pull Docker images through the shared ImagePrefetcher (deduplicated, grouped by
+    repository, retries with backoff) with progress monitoring.
 
     Args:
         image_list (List[str]): List of Docker images to pull.
-        max_workers (int, optional): Maximum number of concurrent threads. Defaults to 10.
-        retries (int, optional): Number of retry attempts for each image. Defaults to 3.
-        delay (int, optional): Delay between retries in seconds. Defaults to 5.
+        max_workers (int, optional): Maximum number of concurrent threads. Defaults to 40.
+        retries (int, optional): Number of retry attempts for each image. Defaults to 5.
+        delay (int, optional): Unused, kept for compatibility (backoff is exponential).
+        pull_timeout (int, optional): Timeout in seconds for each image pull.
     """
-    client = docker.from_env()
-    results = []
+    prefetcher = ImagePrefetcher(max_workers=max_workers, retries=retries, logger=main_logger)
+    futures = prefetcher.prefetch(image_list)
+    images = ImagePrefetcher.order_images(image_list)
     failed_images = []
 
     main_logger.info(
-        f"[pre_pull_docker_images] Starting to pull {len(image_list)} Docker images "
+        f"[pre_pull_docker_images] Starting to pull {len(images)} Docker images "
         f"with up to {max_workers} concurrent threads."
     )
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_image = {
-            executor.submit(pull_image_with_retries, client, img, retries, delay): img
-            for img in image_list
-        }
-
-        with tqdm.tqdm(
-            total=len(future_to_image), desc="Pulling Docker Images"
-        ) as pbar:
-            for future in as_completed(future_to_image):
-                image = future_to_image[future]
-                try:
-                    # Wait for each future with a pull_timeout
-                    result = future.result(timeout=pull_timeout)
-                    results.append(result)
-                    if not result[1]:
-                        failed_images.append((result[0], result[2]))
-                except TimeoutError:
-                    main_logger.info(
-                        f"[pre_pull_docker_images] Timeout pulling {image}"
-                    )
-                    results.append((image, False, "Timeout"))
-                    failed_images.append((image, "Timeout"))
-                except Exception as exc:
-                    main_logger.info(
-                        f"[pre_pull_docker_images] Unhandled exception for {image}: {exc}"
-                    )
-                    results.append((image, False, str(exc)))
-                    failed_images.append((image, str(exc)))
-                finally:
-                    pbar.update(1)
+    with tqdm.tqdm(total=len(futures), desc="Pulling Docker Images") as pbar:
+        for image, future in zip(images, futures):
+            try:
+                if not future.result(timeout=pull_timeout):
+                    failed_images.append((image, "Pull failed"))
+            except TimeoutError:
+                main_logger.info(f"[pre_pull_docker_images] Timeout pulling {image}")
+                failed_images.append((image, "Timeout"))
+            except Exception as exc:
+                main_logger.info(
+                    f"[pre_pull_docker_images] Unhandled exception for {image}: {exc}"
+                )
+                failed_images.append((image, str(exc)))
+            finally:
+                pbar.update(1)
+    prefetcher.close()
 
     # Summary
-    success_count = sum(1 for r in results if r[1])
-    failure_count = len(results) - success_count
-
     main_logger.info(
-        f"[pre_pull_docker_images] Pre-pull completed: {success_count} succeeded, {failure_count} failed."
+        f"[pre_pull_docker_images] Pre-pull completed: {len(images) - len(failed_images)} succeeded, "
+        f"{len(failed_images)} failed. stats: {prefetcher.stats.to_dict()}"
     )
 
     if failed_images:
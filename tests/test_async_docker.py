@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+from r2egym.agenthub.runtime.async_docker import AsyncDockerRuntime
+from r2egym.agenthub.utils.tracing import Tracer, trace_span, use_tracer
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.calls = []
+
+    def run(self, code, timeout=None, args="", workdir=None, type=None, spill_path=None):
+        with trace_span("runtime.run"):
+            self.calls.append((code, spill_path, threading.get_ident()))
+        return "output", "0"
+
+
+def test_run_blocking_carries_the_tracer_into_the_worker_thread():
+    runtime = FakeRuntime()
+
+    async def episode():
+        with use_tracer(Tracer()) as tracer:
+            await AsyncDockerRuntime(runtime).run("ls")
+            return tracer
+
+    tracer = asyncio.run(episode())
+
+    assert [span.name for span in tracer.spans] == ["runtime.run"]
+    assert runtime.calls[0][2] != threading.get_ident()  # ran on the executor
+
+
+def test_async_run_forwards_spill_path():
+    runtime = FakeRuntime()
+    output = asyncio.run(AsyncDockerRuntime(runtime).run("pytest", spill_path="/tmp/out.log.gz"))
+
+    assert output == ("output", "0")
+    assert runtime.calls[0][:2] == ("pytest", "/tmp/out.log.gz")
@@ -0,0 +1,51 @@
+import hashlib
+import os
+
+import r2egym
+from r2egym.agenthub.environment import env as env_module
+from r2egym.agenthub.environment.env import EnvArgs, RepoEnv
+
+TOOLS_DIR = os.path.join(os.path.dirname(r2egym.__file__), "agenthub", "tools")
+COMMAND_FILES = [os.path.join(TOOLS_DIR, "search.py"), os.path.join(TOOLS_DIR, "finish.py")]
+
+
+class FakeRuntime:
+    """DockerRuntime with a cached tool image for every set of tool files (no docker needed)."""
+
+    def __init__(self, ds, logger=None, tool_files=None, **kwargs):
+        self.repo_name = "example"
+        self.docker_image = ds["docker_image"]
+        self.repo_path = "/testbed"
+        self.tool_image = self.get_tool_image_name(tool_files) if tool_files else None
+        self.tools_installed = tool_files is not None
+        self.copied = []
+        self.commands = []
+
+    @staticmethod
+    def get_tool_image_name(tool_files):
+        return hashlib.sha256(repr(sorted(tool_files.items())).encode()).hexdigest()
+
+    def copy_files_to_container(self, files):
+        self.copied.append(files)
+
+    def save_tool_image(self, tool_files):
+        pass
+
+    def run(self, code, timeout=None, **kwargs):
+        self.commands.append(code)
+        return "", "0"
+
+
+def test_cached_tool_image_is_reused_with_the_tool_daemon(monkeypatch):
+    monkeypatch.setattr(env_module, "DockerRuntime", FakeRuntime)
+    env = RepoEnv(
+        EnvArgs(ds={"docker_image": "example/task:latest"}),
+        backend="docker",
+        tool_files=COMMAND_FILES,
+        tool_daemon=True,
+    )
+
+    env.add_commands(COMMAND_FILES)
+
+    assert env.runtime.copied == []  # the tools are already in the image
+    assert env.runtime.commands == [f"{env_module.TOOL_DAEMON_PATH} start"]
@@ -0,0 +1,413 @@
+import concurrent.futures
+import logging
+import os
+import signal
+import socket
+import struct
+import subprocess
+import threading
+
+import pytest
+import websocket
+
+from r2egym.agenthub.runtime import docker as docker_module
+from r2egym.agenthub.runtime import exec_session
+from r2egym.agenthub.runtime.docker import DockerRuntime
+from r2egym.agenthub.runtime.exec_session import DockerExecSession, KubernetesExecSession
+
+LOGGER = logging.getLogger("test")
+
+
+##############################################################################
+# fake docker exec socket, backed by a local /bin/sh
+##############################################################################
+class FakeDockerAPI:
+    """
+    `exec_create` / `exec_start(socket=True)` of docker's APIClient: the socket is attached to
+    a local /bin/sh, whose output is sent as multiplexed frames in small fragments.
+    """
+
+    def __init__(self):
+        self.shells = []
+
+    def exec_create(self, container_id, cmd, **kwargs):
+        return {"Id": f"exec-{len(self.shells)}"}
+
+    def exec_start(self, exec_id, **kwargs):
+        ours, theirs = socket.socketpair()
+        shell = subprocess.Popen(["/bin/sh"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.shells.append(shell)
+        send_lock = threading.Lock()
+        open_streams = [2]
+
+        def pump_stdin():
+            try:
+                while True:
+                    data = theirs.recv(4096)
+                    if not data:
+                        break
+                    shell.stdin.write(data)
+                    shell.stdin.flush()
+                shell.stdin.close()
+            except OSError:  # the shell or the session went away
+                pass
+
+        def pump_output(pipe, stream_id):
+            while True:
+                data = os.read(pipe.fileno(), 4096)
+                if not data:
+                    break
+                frame = struct.pack(">BxxxL", stream_id, len(data)) + data
+                try:
+                    with send_lock:
+                        for i in range(0, len(frame), 5):  # frames split across reads
+                            theirs.sendall(frame[i : i + 5])
+                except OSError:  # the session was closed
+                    return
+            with send_lock:
+                open_streams[0] -= 1
+                if not open_streams[0]:
+                    theirs.close()  # the exec ended
+
+        for target, args in [(pump_stdin, ()), (pump_output, (shell.stdout, 1)), (pump_output, (shell.stderr, 2))]:
+            threading.Thread(target=target, args=args, daemon=True).start()
+        return ours
+
+    def kill_shells(self):
+        for shell in self.shells:
+            shell.kill()
+            shell.wait()
+
+
+@pytest.fixture
+def docker_api():
+    api = FakeDockerAPI()
+    yield api
+    api.kill_shells()
+
+
+@pytest.fixture
+def docker_session(docker_api):
+    session = DockerExecSession(docker_api, "container", logger=LOGGER)
+    yield session
+    session.close()
+
+
+def test_docker_session_output_and_exit_codes(docker_session, tmp_path):
+    assert docker_session.run("echo out; echo err >&2", str(tmp_path), timeout=10) == (b"out\nerr\n", 0)
+    assert docker_session.run("pwd", str(tmp_path), timeout=10) == (f"{tmp_path}\n".encode(), 0)
+    assert docker_session.run("printf 'no newline'; exit 3", "/", timeout=10) == (b"no newline", 3)
+    # quoting and multi-line commands behave like a regular exec
+    command = "x='a \"b\" $c'\nif true; then\n  echo \"$x\"\nfi"
+    assert docker_session.run(command, "/", timeout=10) == (b'a "b" $c\n', 0)
+
+
+def test_docker_session_keeps_one_shell(docker_session, docker_api):
+    for i in range(5):
+        assert docker_session.run(f"echo {i}", "/", timeout=10) == (f"{i}\n".encode(), 0)
+    assert len(docker_api.shells) == 1
+
+
+def test_docker_session_output_with_marker_like_text(docker_session):
+    # another session's marker (or a partial one) is plain output
+    other = "__R2E_EXIT_" + "0" * 32 + "__"
+    output, code = docker_session.run(f"echo '{other} 7'; echo __R2E_EXIT_; exit 2", "/", timeout=10)
+    assert (output, code) == (f"{other} 7\n__R2E_EXIT_\n".encode(), 2)
+    assert docker_session.run("echo next", "/", timeout=10) == (b"next\n", 0)
+
+
+def test_docker_session_timeout_closes_and_reopens(docker_session, docker_api):
+    with pytest.raises(concurrent.futures.TimeoutError):
+        docker_session.run("sleep 5", "/", timeout=0.3)
+    assert not docker_session.is_open
+
+    assert docker_session.run("echo again", "/", timeout=10) == (b"again\n", 0)
+    assert len(docker_api.shells) == 2
+
+
+def test_docker_session_broken_connection(docker_session, docker_api):
+    docker_session.run("true", "/", timeout=10)
+    docker_api.kill_shells()
+    with pytest.raises(ConnectionError):
+        docker_session.run("echo lost", "/", timeout=10)
+    assert not docker_session.is_open
+
+
+##############################################################################
+# DockerRuntime with an exec session
+##############################################################################
+class FakeExecResult:
+    def __init__(self, output, exit_code):
+        self.output = output
+        self.exit_code = exit_code
+
+
+class FakeContainer:
+    id = "container"
+
+    def __init__(self):
+        self.execs = []
+
+    def exec_run(self, cmd, workdir=None, **kwargs):
+        self.execs.append(cmd)
+        proc = subprocess.run(cmd, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return FakeExecResult(proc.stdout, proc.returncode)
+
+
+class FakeDockerClient:
+    def __init__(self, api):
+        self.api = api
+
+
+def docker_runtime(api, repo_path):
+    runtime = DockerRuntime.__new__(DockerRuntime)
+    runtime.backend = "docker"
+    runtime.client = FakeDockerClient(api)
+    runtime.container = FakeContainer()
+    runtime.use_exec_session = True
+    runtime.exec_session = None
+    runtime.max_output_len = None
+    runtime.repo_path = str(repo_path)
+    runtime.logger = LOGGER
+    return runtime
+
+
+def test_runtime_runs_commands_in_the_session(docker_api, tmp_path):
+    runtime = docker_runtime(docker_api, tmp_path)
+    try:
+        assert runtime.run("pwd") == (f"{tmp_path}\n", "0")
+        assert runtime.run("sh -c 'exit 4'")[1] == "Error: Exit code 4"
+        assert runtime.run("sleep 5", timeout=1) == ("The command took too long to execute (>1s)", "-1")
+        assert runtime.container.execs == []
+    finally:
+        runtime.exec_session.close()
+
+
+def test_runtime_falls_back_to_a_single_exec(docker_api, tmp_path):
+    runtime = docker_runtime(docker_api, tmp_path)
+    runtime.run("true")
+    docker_api.kill_shells()
+
+    assert runtime.run("echo fallback") == ("fallback\n", "0")
+    assert len(runtime.container.execs) == 1
+    # the next command opens a new session
+    assert runtime.run("echo session") == ("session\n", "0")
+    assert len(runtime.container.execs) == 1 and len(docker_api.shells) == 2
+    runtime.exec_session.close()
+
+
+def test_runtime_uses_a_single_exec_while_the_session_is_busy(docker_api, tmp_path):
+    runtime = docker_runtime(docker_api, tmp_path)
+    runtime.run("true")
+    with runtime.exec_session.lock:
+        assert runtime.run("echo concurrent") == ("concurrent\n", "0")
+    assert len(runtime.container.execs) == 1
+    runtime.exec_session.close()
+
+
+##############################################################################
+# fake kubernetes exec websocket, backed by a local /bin/sh
+##############################################################################
+class FakeWSClient:
+    """
+    The parts of kubernetes' WSClient used by the runtime: channel buffers filled by `update`,
+    `is_open` until the exec ends, `write_stdin` and `returncode`.
+    """
+
+    def __init__(self, command, stdin):
+        self.shell = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        self._connected = True
+        self._channels = {}
+        self._pending = []
+        self._open_streams = 2
+        self._cond = threading.Condition()
+        for pipe, channel in [(self.shell.stdout, 1), (self.shell.stderr, 2)]:
+            threading.Thread(target=self._pump, args=(pipe, channel), daemon=True).start()
+
+    def _pump(self, pipe, channel):
+        while True:
+            data = os.read(pipe.fileno(), 4096)
+            if not data:
+                break
+            with self._cond:
+                self._pending.append((channel, data))
+                self._cond.notify_all()
+        with self._cond:
+            self._open_streams -= 1
+            self._cond.notify_all()
+
+    def is_open(self):
+        return self._connected
+
+    def update(self, timeout=0):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or not self._open_streams, timeout)
+            for channel, data in self._pending:
+                self._channels[channel] = self._channels.get(channel, "") + data.decode("utf-8", "replace")
+            self._pending = []
+            if not self._open_streams:  # the exec ended
+                self.shell.wait()
+                self._connected = False
+
+    def peek_stdout(self):
+        return bool(self._channels.get(1))
+
+    def read_stdout(self):
+        return self._channels.pop(1, "")
+
+    def peek_stderr(self):
+        return bool(self._channels.get(2))
+
+    def read_stderr(self):
+        return self._channels.pop(2, "")
+
+    def write_stdin(self, data):
+        if not self._connected:
+            raise websocket.WebSocketConnectionClosedException("socket is already closed.")
+        try:
+            self.shell.stdin.write(data.encode())
+            self.shell.stdin.flush()
+        except OSError:  # the exec ended, the close frame is still on its way
+            pass
+
+    @property
+    def returncode(self):
+        return None if self._connected else self.shell.returncode
+
+    def kill(self):
+        try:
+            os.killpg(self.shell.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.shell.wait()
+
+    def close(self):
+        self.kill()
+        self._connected = False
+
+
+class FakeCoreV1Api:
+    def connect_get_namespaced_pod_exec(self, *args, **kwargs):
+        raise AssertionError("only called through `stream`")
+
+
+@pytest.fixture
+def k8s_streams(monkeypatch):
+    """Patch `kubernetes.stream.stream` in the runtime: every exec opens a FakeWSClient."""
+    streams = []
+
+    def fake_stream(api_method, pod_name, namespace, command, stdin=False, **kwargs):
+        assert kwargs["_preload_content"] is False and kwargs["tty"] is False
+        streams.append(FakeWSClient(command, stdin))
+        return streams[-1]
+
+    monkeypatch.setattr(exec_session, "stream", fake_stream)
+    monkeypatch.setattr(docker_module, "stream", fake_stream)
+    yield streams
+    for resp in streams:
+        resp.kill()
+
+
+@pytest.fixture
+def k8s_session(k8s_streams):
+    session = KubernetesExecSession(FakeCoreV1Api(), "pod", "default", logger=LOGGER)
+    yield session
+    session.close()
+
+
+def test_kubernetes_session_output_and_exit_codes(k8s_session, k8s_streams, tmp_path):
+    assert k8s_session.run("echo out; echo err >&2", str(tmp_path), timeout=10) == (b"out\nerr\n", 0)
+    assert k8s_session.run("pwd", str(tmp_path), timeout=10) == (f"{tmp_path}\n".encode(), 0)
+    assert k8s_session.run("printf 'no newline'; exit 3", "/", timeout=10) == (b"no newline", 3)
+    # output arriving over several updates
+    assert k8s_session.run("echo a; sleep 0.1; echo b", "/", timeout=10) == (b"a\nb\n", 0)
+    assert len(k8s_streams) == 1
+
+
+def test_kubernetes_session_output_with_marker_like_text(k8s_session):
+    other = "__R2E_EXIT_" + "0" * 32 + "__"
+    output, code = k8s_session.run(f"echo '{other} 7'; echo __R2E_EXIT_; exit 2", "/", timeout=10)
+    assert (output, code) == (f"{other} 7\n__R2E_EXIT_\n".encode(), 2)
+    assert k8s_session.run("echo next", "/", timeout=10) == (b"next\n", 0)
+
+
+def test_kubernetes_session_timeout_closes_and_reopens(k8s_session, k8s_streams):
+    with pytest.raises(concurrent.futures.TimeoutError):
+        k8s_session.run("sleep 5", "/", timeout=0.3)
+    assert not k8s_session.is_open
+
+    assert k8s_session.run("echo again", "/", timeout=10) == (b"again\n", 0)
+    assert len(k8s_streams) == 2
+
+
+def test_kubernetes_session_broken_connection(k8s_session, k8s_streams):
+    k8s_session.run("true", "/", timeout=10)
+    k8s_streams[0].kill()
+    with pytest.raises(ConnectionError):
+        k8s_session.run("echo lost", "/", timeout=10)
+    assert not k8s_session.is_open
+
+    # writing to an already closed websocket
+    k8s_session.run("true", "/", timeout=10)
+    k8s_streams[1].close()
+    with pytest.raises(ConnectionError):
+        k8s_session.run("echo lost", "/", timeout=10)
+    assert not k8s_session.is_open
+
+
+##############################################################################
+# DockerRuntime on kubernetes
+##############################################################################
+def kubernetes_runtime(repo_path):
+    runtime = DockerRuntime.__new__(DockerRuntime)
+    runtime.backend = "kubernetes"
+    runtime.client = FakeCoreV1Api()
+    runtime.container_name = "pod"
+    runtime.container = object()
+    runtime.use_exec_session = True
+    runtime.exec_session = None
+    runtime.max_output_len = None
+    runtime.repo_path = str(repo_path)
+    runtime.logger = LOGGER
+    return runtime
+
+
+def test_kubernetes_runtime_runs_commands_in_the_session(k8s_streams, tmp_path):
+    runtime = kubernetes_runtime(tmp_path)
+    try:
+        assert runtime.run("pwd") == (f"{tmp_path}\n", "0")
+        assert runtime.run("sh -c 'exit 4'")[1] == "Error: Exit code 4"
+        assert runtime.run("sleep 5", timeout=1) == ("The command took too long to execute (>1s)", "-1")
+        assert [resp.shell.args for resp in k8s_streams] == [["/bin/sh"]]
+    finally:
+        runtime.exec_session.close()
+
+
+def test_kubernetes_runtime_falls_back_to_a_single_exec(k8s_streams, tmp_path):
+    runtime = kubernetes_runtime(tmp_path)
+    runtime.run("true")
+    k8s_streams[0].kill()
+
+    assert runtime.run("echo fallback", timeout=30) == ("fallback\n", "0")
+    assert k8s_streams[1].shell.args == ["/bin/sh", "-c", f"cd {tmp_path} && timeout 30 echo fallback "]
+    # the next command opens a new session
+    assert runtime.run("echo session") == ("session\n", "0")
+    assert [resp.shell.args for resp in k8s_streams[2:]] == [["/bin/sh"]]
+    runtime.exec_session.close()
+
+
+def test_exec_kubernetes(k8s_streams, tmp_path):
+    runtime = kubernetes_runtime(tmp_path)
+    assert runtime._exec_kubernetes(["/bin/sh", "-c", "echo out; exit 5"], timeout=10) == ("out\n", 5)
+    with pytest.raises(concurrent.futures.TimeoutError):
+        runtime._exec_kubernetes(["/bin/sh", "-c", "sleep 5"], timeout=0.3)
+    assert not k8s_streams[-1].is_open()  # closed on timeout
+
+    runtime.use_exec_session = False
+    assert runtime.run("sleep 5", timeout=0) == ("The command took too long to execute (>0s)", "-1")
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+TOOLS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "r2egym", "agenthub", "tools"
+)
+
+
+def run_editor(tool_script, *args):
+    pytest.importorskip("chardet")
+    proc = subprocess.run(
+        [sys.executable, os.path.join(TOOLS_DIR, *tool_script), *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return proc.stdout
+
+
+@pytest.mark.parametrize("tool_script", [("file_editor.py",), ("r2egym", "file_editor.py")])
+def test_cached_syntax_error_names_the_viewed_file(tmp_path, tool_script):
+    # the view's cache entry is shared by files with the same bytes
+    source = f"# {tmp_path}\ndef broken(:\n    pass\n"
+    for name in ("a.py", "b.py"):
+        (tmp_path / name).write_text(source)
+
+    outputs = [
+        run_editor(tool_script, "view", "--path", str(tmp_path / name), "--concise", "True")
+        for name in ("a.py", "b.py")
+    ]
+
+    assert "(a.py, line 2)" in outputs[0]
+    assert "(b.py, line 2)" in outputs[1] and "a.py" not in outputs[1]
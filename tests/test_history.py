@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from r2egym.agenthub.action import Action
+from r2egym.agenthub.agent.history import (
+    FileViewSummaryCondenser,
+    MessageLog,
+    ObservationElisionCondenser,
+    build_condenser,
+)
+from r2egym.agenthub.observation import Observation
+
+TOOLS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "r2egym", "agenthub", "tools"
+)
+
+SOURCE = '''import os
+
+
+class Greeter:
+    def greet(self, name):
+        return f"hello {name}"
+
+
+async def main():
+    return Greeter().greet("world")
+'''
+
+
+def count_tokens(message):
+    return len(message["content"])
+
+
+def view_output(tool_script, path, *extra_args):
+    """Output of the in-container editor tool for `view` (as the agent sees it)."""
+    pytest.importorskip("chardet")
+    proc = subprocess.run(
+        [sys.executable, os.path.join(TOOLS_DIR, *tool_script), "view", "--path", str(path), *extra_args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return proc.stdout
+
+
+##############################################################################
+# message log
+##############################################################################
+def test_message_log_is_append_only():
+    message = {"role": "user", "content": "task"}
+    log = MessageLog([message])
+    message["content"] = "changed"
+    log.append({"role": "assistant", "content": "step"})
+    first = log[0]
+    log.amend_last(" more")
+
+    assert log[0] is first and first["content"] == "task"
+    assert [m["content"] for m in log] == ["task", "step more"]
+    snapshot = log.snapshot()
+    log.append({"role": "user", "content": "next"})
+    assert len(snapshot) == 2 and len(log) == 3
+
+
+def test_cache_control_view_only_copies_annotated_messages():
+    log = MessageLog(
+        [
+            {"role": "system", "content": "s"},
+            {"role": "user", "content": "u1"},
+            {"role": "assistant", "content": "a"},
+            {"role": "user", "content": "u2"},
+        ]
+    )
+    view = MessageLog.cache_control_view(log, num_breakpoints=1)
+    assert view[3]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in log[3]
+    assert all(view[idx] is log[idx] for idx in range(3))
+
+
+##############################################################################
+# condensers
+##############################################################################
+def history(observations):
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    for observation in observations:
+        messages.append({"role": "assistant", "content": "action"})
+        messages.append({"role": "user", "content": observation})
+    return messages
+
+
+def test_condenser_keeps_history_below_max_tokens():
+    messages = history(["x" * 1000 for _ in range(6)])
+    counts = [count_tokens(m) for m in messages]
+    condenser = ObservationElisionCondenser(max_tokens=4000, keep_last_steps=2)
+
+    view, total = condenser.condense(messages, counts, count_tokens)
+
+    assert total == sum(count_tokens(m) for m in view) <= 4000
+    assert view[:2] == messages[:2]
+    assert view[-4:] == messages[-4:]  # last steps are kept
+    assert view[3]["content"].startswith("<Observation elided")
+    assert messages[3]["content"] == "x" * 1000  # the history itself is unchanged
+
+
+def test_condenser_below_max_tokens_is_a_no_op():
+    messages = history(["x" * 1000])
+    counts = [count_tokens(m) for m in messages]
+    view, total = build_condenser({"type": "observations", "max_tokens": 10000}).condense(
+        messages, counts, count_tokens
+    )
+    assert view == messages and total == sum(counts)
+    assert build_condenser(None) is None
+
+
+@pytest.mark.parametrize(
+    "tool_script",
+    [("r2egym", "file_editor.py"), ("file_editor.py",), ("str_replace_editor.py",)],
+)
+def test_file_view_condenser_on_view_output(tmp_path, tool_script):
+    path = tmp_path / "greeter.py"
+    path.write_text(SOURCE)
+    output = view_output(tool_script, path)
+    observation = str(
+        Observation(output, 0, Action(function_name="file_editor", parameters={"command": "view"}))
+    )
+
+    condensed = FileViewSummaryCondenser(max_tokens=0).condense_message(
+        {"role": "user", "content": observation}
+    )
+
+    assert condensed is not None
+    content = condensed["content"]
+    assert f"{path}, lines 1-{len(SOURCE.splitlines())}." in content
+    outline = content.split("Outline:\n", 1)[1].splitlines()
+    assert [line.split("\t", 1)[1].strip() for line in outline] == [
+        "class Greeter:",
+        "def greet(self, name):",
+        "async def main():",
+    ]
+
+
+def test_file_view_condenser_on_ranged_view(tmp_path):
+    path = tmp_path / "greeter.py"
+    path.write_text(SOURCE)
+    output = view_output(("r2egym", "file_editor.py"), path, "--view_range", "[4, 6]")
+
+    condensed = FileViewSummaryCondenser(max_tokens=0).condense_message(
+        {"role": "tool", "content": output}
+    )
+
+    assert "lines 4-6." in condensed["content"]
+
+
+def test_file_view_condenser_keeps_other_observations():
+    condenser = FileViewSummaryCondenser(max_tokens=0)
+    assert condenser.condense_message({"role": "user", "content": "Exit code: 0\n  1 passed"}) is None
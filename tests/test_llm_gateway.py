@@ -0,0 +1,207 @@
+import asyncio
+import time
+
+import litellm
+import pytest
+
+from r2egym.agenthub.utils import llm_gateway
+from r2egym.agenthub.utils.llm_gateway import AdaptiveConcurrencyLimiter, LLMGateway, TokenBucket
+
+
+##############################################################################
+# TokenBucket
+##############################################################################
+def test_token_bucket_waits_for_refill():
+    async def main():
+        bucket = TokenBucket(rate_per_minute=6000, capacity=10)  # 100 units / second
+        start = time.monotonic()
+        await bucket.acquire(10)  # full bucket: immediate
+        immediate = time.monotonic() - start
+        await bucket.acquire(5)  # empty: ~50ms refill
+        return immediate, time.monotonic() - start
+
+    immediate, total = asyncio.run(main())
+    assert immediate < 0.02
+    assert 0.04 <= total < 0.5
+
+
+def test_token_bucket_oversized_request_passes_on_a_full_bucket():
+    async def main():
+        bucket = TokenBucket(rate_per_minute=60, capacity=10)
+        await asyncio.wait_for(bucket.acquire(1000), timeout=1)
+        return bucket
+
+    bucket = asyncio.run(main())
+    assert bucket.level <= 0.01
+
+
+def test_token_bucket_consume_can_go_negative():
+    bucket = TokenBucket(rate_per_minute=60)
+    bucket.consume(100)
+    assert bucket.level < 0
+
+
+##############################################################################
+# AdaptiveConcurrencyLimiter
+##############################################################################
+def additive_increase(limit, steps):
+    for _ in range(steps):
+        limit += 1 / limit
+    return limit
+
+
+def test_limiter_aimd():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, decrease_interval=0)
+    for _ in range(4):
+        limiter.in_flight += 1
+        limiter.release("success")
+    assert limiter.limit == pytest.approx(additive_increase(4, steps=4))
+
+    limit = limiter.limit
+    limiter.in_flight += 1
+    limiter.release("rate_limited")
+    assert limiter.limit == pytest.approx(limit * 0.5)
+
+    limiter.in_flight += 1
+    limiter.release("error")
+    assert limiter.limit == pytest.approx(limit * 0.5)
+
+
+def test_limiter_stays_within_bounds():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=1, max_limit=2.2, decrease_interval=0)
+    for _ in range(10):
+        limiter.in_flight += 1
+        limiter.release("success")
+    assert limiter.limit == 2.2
+    for _ in range(10):
+        limiter.in_flight += 1
+        limiter.release("rate_limited")
+    assert limiter.limit == 1
+
+
+def test_limiter_counts_a_burst_of_rate_limits_once():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=16, decrease_interval=60)
+    for _ in range(5):
+        limiter.in_flight += 1
+        limiter.release("rate_limited")
+    assert limiter.limit == 8
+
+
+def test_limiter_admits_waiters_by_priority_then_fifo():
+    async def main():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+        await limiter.acquire()
+        order = []
+
+        async def waiter(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+            await asyncio.sleep(0)
+            limiter.release()
+
+        tasks = [
+            asyncio.ensure_future(waiter(name, priority))
+            for name, priority in [("low", 0), ("high-1", 5), ("high-2", 5), ("mid", 1)]
+        ]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 1 and not order
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order, limiter
+
+    order, limiter = asyncio.run(main())
+    assert order == ["high-1", "high-2", "mid", "low"]
+    assert limiter.in_flight == 0
+
+
+def test_limiter_cancelled_waiter_does_not_leak_a_slot():
+    async def main():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+        await limiter.acquire()
+        cancelled = asyncio.ensure_future(limiter.acquire())
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        limiter.release()
+        await asyncio.wait_for(waiting, timeout=1)
+        return limiter
+
+    limiter = asyncio.run(main())
+    assert limiter.in_flight == 1
+
+
+##############################################################################
+# gateway
+##############################################################################
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.usage = type("Usage", (), {"prompt_tokens": 10, "completion_tokens": 5})()
+
+    def model_dump(self):
+        return {"choices": [{"message": {"content": self.content}}]}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+    failures = []
+
+    async def acompletion(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.01)
+        if failures:
+            raise failures.pop(0)
+        return FakeResponse(f"reply to {kwargs['messages'][-1]['content']}")
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    monkeypatch.setattr(llm_gateway.random, "uniform", lambda a, b: 0.0)  # no retry backoff
+    return calls, failures
+
+
+def request(temperature=0, content="hi"):
+    return {"model": "gpt-4o", "temperature": temperature, "messages": [{"role": "user", "content": content}]}
+
+
+def test_identical_deterministic_requests_are_coalesced(upstream):
+    calls, _ = upstream
+
+    async def main():
+        gateway = LLMGateway()
+        results = await asyncio.gather(
+            gateway.complete(request()), gateway.complete(request()), gateway.complete(request(content="other"))
+        )
+        return gateway, results
+
+    gateway, results = asyncio.run(main())
+    assert len(calls) == 2
+    assert results[0] == results[1] != results[2]
+    assert gateway.stats.coalesced == 1 and gateway.stats.requests == 3
+
+
+def test_sampled_requests_are_not_coalesced(upstream):
+    calls, _ = upstream
+
+    async def main():
+        gateway = LLMGateway()
+        await asyncio.gather(gateway.complete(request(temperature=1)), gateway.complete(request(temperature=1)))
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_rate_limited_requests_are_retried(upstream):
+    calls, failures = upstream
+    failures.append(litellm.RateLimitError("slow down", llm_provider="openai", model="gpt-4o"))
+
+    async def main():
+        gateway = LLMGateway()
+        response = await gateway.complete(request())
+        return gateway, response
+
+    gateway, response = asyncio.run(main())
+    assert len(calls) == 2
+    assert response == {"choices": [{"message": {"content": "reply to hi"}}]}
+    assert gateway.stats.rate_limited == 1
+    assert gateway.stats.prompt_tokens == 10 and gateway.stats.completion_tokens == 5
+    assert gateway._limits["gpt-4o"].limiter.in_flight == 0
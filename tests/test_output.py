@@ -0,0 +1,111 @@
+import logging
+import subprocess
+
+from r2egym.agenthub.runtime.docker import DockerRuntime
+from r2egym.agenthub.runtime.output import StreamingOutput, read_spilled_output
+
+
+def collect(chunks, head_size=10, tail_size=10, spill_path=None):
+    output = StreamingOutput(head_size=head_size, tail_size=tail_size, spill_path=spill_path)
+    for chunk in chunks:
+        output.write(chunk)
+    output.close()
+    return output
+
+
+##############################################################################
+# StreamingOutput
+##############################################################################
+def test_short_output_is_kept_whole():
+    output = collect([b"hello ", b"world"])
+    assert not output.truncated
+    assert output.getvalue() == "hello world"
+
+
+def test_long_output_keeps_head_and_tail():
+    text = "".join(str(i % 10) for i in range(1000))
+    output = collect([text[i : i + 7].encode() for i in range(0, len(text), 7)])
+
+    assert output.truncated and output.total_len == 1000
+    head, marker, tail = output.getvalue().split("\n")
+    assert head == text[:10]
+    assert tail == text[-10:]
+    assert marker == "<output truncated in middle: 980 characters omitted>"
+
+
+def test_utf8_sequences_split_across_chunks():
+    data = "héllo wörld ✓".encode()
+    output = collect([data[i : i + 1] for i in range(len(data))], head_size=100)
+    assert output.getvalue() == "héllo wörld ✓"
+
+
+def test_ansi_codes_split_across_chunks_are_stripped():
+    output = collect([b"\x1b[3", b"1mred\x1b", b"[0m plain\r\n"], head_size=100)
+    assert output.getvalue() == "red plain\n"
+
+
+def test_spill_file_has_the_full_output(tmp_path):
+    spill_path = str(tmp_path / "out.log.gz")
+    text = "line\n" * 1000
+    output = collect([text.encode(), b"\x1b[32mok\x1b[0m"], spill_path=spill_path)
+
+    assert output.truncated
+    assert read_spilled_output(spill_path) == text + "ok"
+
+
+##############################################################################
+# setup script status report with streaming output
+##############################################################################
+class LocalRuntime(DockerRuntime):
+    """DockerRuntime whose commands run in a local shell (no container)."""
+
+    def __init__(self, tmp_path, max_output_len):
+        self.repo_path = str(tmp_path)
+        self.max_output_len = max_output_len
+        self.logger = logging.getLogger("test")
+
+    def copy_files_to_container(self, files):
+        for path, (content, _) in files.items():
+            with open(path, "w") as f:
+                f.write(content)
+
+    def run(self, code, timeout=60, args="", workdir=None, type=None, spill_path=None):
+        proc = subprocess.run(
+            ["/bin/sh", "-c", f"{code} {args}"], cwd=self.repo_path, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+        collector = self._get_output_collector(spill_path)
+        if collector is None:
+            return proc.stdout.decode(), str(proc.returncode)
+        collector.write(proc.stdout)
+        collector.close()
+        return collector.getvalue(), str(proc.returncode)
+
+
+def test_setup_report_survives_output_truncation(tmp_path):
+    runtime = LocalRuntime(tmp_path, max_output_len=200)
+    steps = [
+        ("noisy", "seq 1 20000"),
+        ("fails", "sh -c 'echo broken >&2; exit 3'"),
+        ("quiet", "true"),
+    ]
+
+    report = runtime.run_setup_script(steps, script_path=str(tmp_path / "setup.sh"))
+
+    assert [step["exit_code"] for step in report] == [0, 3, 0]
+    assert report[0]["output"].splitlines()[-1] == "20000"
+    assert report[1]["output"] == "broken"
+    assert not (tmp_path / "setup.sh").exists()  # the script removes itself
+
+
+def test_patch_is_not_truncated(tmp_path):
+    runtime = LocalRuntime(tmp_path, max_output_len=200)
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    (tmp_path / "big.py").write_text("".join(f"x{i} = {i}\n" for i in range(2000)))
+
+    patch = runtime.get_patch()
+
+    assert "output truncated" not in patch
+    assert patch.startswith("diff --git a/big.py b/big.py")
+    assert patch.rstrip().endswith("+x1999 = 1999")
+    # observations shown to the agent are still truncated
+    assert "output truncated" in runtime.run("cat big.py")[0]
@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+
+import pytest
+
+from r2egym.agenthub.runtime import pool as pool_module
+from r2egym.agenthub.runtime.pool import ContainerPool
+
+# importing the editor tools (through the agent) rewraps sys.stdout: keep pytest's stream
+_stdout = sys.stdout
+from r2egym.agenthub.run import edit  # noqa: E402
+
+if sys.stdout is not _stdout:
+    sys.stdout.detach()
+    sys.stdout = _stdout
+
+DS = {"docker_image": "example/task:latest"}
+
+
+class FakeRuntime:
+    """Stands in for DockerRuntime (no docker daemon needed)."""
+
+    started = []
+
+    def __init__(self, ds, logger=None, checkpoint_image=None, **kwargs):
+        self.checkpoint_image = checkpoint_image
+        self.container = object()
+        self.logger = logger
+        self.closed = False
+        FakeRuntime.started.append(self)
+
+    def commit_checkpoint(self, repository, tag):
+        return f"{repository}:{tag}"
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakeRuntime.started = []
+    monkeypatch.setattr(pool_module, "DockerRuntime", FakeRuntime)
+    monkeypatch.setattr(ContainerPool, "_find_checkpoint", lambda self, key: self._checkpoints.get(key))
+    container_pool = ContainerPool(pool_size=2)
+    yield container_pool
+    container_pool.close()
+
+
+def drain(container_pool):
+    container_pool._executor.submit(lambda: None).result()
+    while any(container_pool._pending.values()):
+        container_pool._executor.submit(lambda: None).result()
+
+
+def test_single_acquire_starts_no_warm_containers(pool):
+    runtime = pool.acquire(DS)
+    drain(pool)
+
+    assert FakeRuntime.started == [runtime]
+    assert runtime.checkpoint_image is None  # cold start, then committed
+    assert pool._idle.get(DS["docker_image"], []) == []
+
+
+def test_reacquire_is_served_warm_from_the_checkpoint(pool):
+    first = pool.acquire(DS)
+    pool.release(first)
+    second = pool.acquire(DS)  # e.g. an env reset: refills the pool
+    drain(pool)
+    third = pool.acquire(DS)
+
+    assert second.checkpoint_image == third.checkpoint_image == first.commit_checkpoint(
+        pool_module.CHECKPOINT_REPOSITORY, ContainerPool._get_checkpoint_tag(DS["docker_image"])
+    )
+    assert pool.stats.misses == 2 and pool.stats.hits == 1
+    drain(pool)
+    assert len(pool._idle[DS["docker_image"]]) == 2
+
+
+def test_close_discards_warm_containers(pool):
+    pool.acquire(DS)
+    pool.acquire(DS)
+    drain(pool)
+    idle = [runtime for runtime, _ in pool._idle[DS["docker_image"]]]
+
+    pool.close()
+
+    assert idle and all(runtime.closed for runtime in idle)
+
+
+##############################################################################
+# runagent_multiple: one pool per worker process
+##############################################################################
+class FakeDataset(list):
+    def shuffle(self, seed):
+        return self
+
+
+class FakeEnv:
+    def __init__(self, env_args, pool=None, **kwargs):
+        self.pool = pool
+        self.runtime = pool.acquire(env_args.ds)
+
+    def close(self):
+        self.pool.release(self.runtime)
+
+
+class FakeTrajectory:
+    def __init__(self, env):
+        self.pool_id = id(env.pool)
+
+    def model_dump_json(self):
+        return json.dumps({"image": self.ds["docker_image"], "pid": os.getpid(), "pool": self.pool_id})
+
+
+def test_runagent_multiple_uses_a_pool_per_worker_process(tmp_path, monkeypatch):
+    FakeRuntime.started = []
+    monkeypatch.setattr(pool_module, "DockerRuntime", FakeRuntime)
+    monkeypatch.setattr(FakeRuntime, "_calculate_reward", lambda self, **kwargs: (1.0, "ok"), raising=False)
+    monkeypatch.setattr(ContainerPool, "_find_checkpoint", lambda self, key: self._checkpoints.get(key))
+    monkeypatch.setattr(edit, "load_dataset", lambda *args, **kwargs: FakeDataset(
+        {"docker_image": f"example/task-{i % 2}:latest"} for i in range(6)
+    ))
+    monkeypatch.setattr(edit, "RepoEnv", FakeEnv)
+    monkeypatch.setattr(edit, "Agent", lambda **kwargs: None)
+    monkeypatch.setattr(edit, "run_agent_with_restarts", lambda agent, env, **kwargs: FakeTrajectory(env))
+    # the agent config is read from ./src (relative to the repository root)
+    (tmp_path / "src").symlink_to(os.path.join(os.path.dirname(edit.__file__), "..", "..", ".."))
+    monkeypatch.chdir(tmp_path)
+
+    edit.runagent_multiple(
+        "dataset", "test", k=6, traj_dir=str(tmp_path / "traj"), exp_name="pool",
+        max_workers=2, backend="docker", pool_size=1,
+    )
+
+    results = [json.loads(line) for line in (tmp_path / "traj" / "pool.jsonl").read_text().splitlines()]
+    assert len(results) == 6  # no episode failed
+    assert all(result["pid"] != os.getpid() for result in results)
+    pools = {}
+    for result in results:
+        assert pools.setdefault(result["pid"], result["pool"]) == result["pool"]
@@ -0,0 +1,135 @@
+import concurrent.futures
+import logging
+import shutil
+import sqlite3
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from r2egym.agenthub.runtime.docker import DockerRuntime
+from r2egym.agenthub.runtime.reward_cache import RewardCache
+
+PATCH = """diff --git a/pkg/utils.py b/pkg/utils.py
+index 3b18e51..a1c2d3e 100644
+--- a/pkg/utils.py
++++ b/pkg/utils.py
+@@ -1,2 +1,2 @@
+ def save_model(model):
+-    pass
++    return model
+"""
+
+
+def test_normalize_patch_ignores_blob_ids_and_surrounding_blank_lines():
+    same_tree = "\n\n" + PATCH.replace("index 3b18e51..a1c2d3e", "index 0000000..ffffff0") + "\n\n"
+    assert RewardCache.normalize_patch(same_tree) == RewardCache.normalize_patch(PATCH)
+    assert "index " not in RewardCache.normalize_patch(PATCH)
+
+
+def test_normalize_patch_keeps_content_changes():
+    different = PATCH.replace("+    return model", "+    return None")
+    assert RewardCache.patch_hash(different) != RewardCache.patch_hash(PATCH)
+    # only the git header line is dropped, not patch content that looks like it
+    content = PATCH + "+index 1a..2b\n"
+    assert RewardCache.normalize_patch(content).endswith("+index 1a..2b")
+
+
+def test_get_and_put(tmp_path):
+    cache = RewardCache(str(tmp_path / "cache" / "rewards.sqlite"))
+    assert cache.get("example/task:latest", PATCH) is None
+
+    cache.put("example/task:latest", PATCH, 1, output="1 passed", test_map={"test_save": "PASSED"})
+    entry = cache.get("example/task:latest", PATCH.replace("3b18e51", "1234567") + "\n")
+    assert (entry.reward, entry.output, entry.test_map) == (1.0, "1 passed", {"test_save": "PASSED"})
+    assert cache.get("example/other:latest", PATCH) is None  # keyed on the image too
+
+    cache.put("example/task:latest", PATCH, 0)
+    entry = cache.get("example/task:latest", PATCH)
+    assert (entry.reward, entry.output, entry.test_map) == (0.0, None, None)
+    assert cache.to_dict() == {"hits": 2, "misses": 2, "hit_rate": 0.5}
+
+
+def test_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "rewards.sqlite")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda i: RewardCache(path).put(f"image-{i}", PATCH, i), range(8)))
+
+    cache = RewardCache(path)
+    assert [cache.get(f"image-{i}", PATCH).reward for i in range(8)] == list(map(float, range(8)))
+
+
+
+def test_connections_are_closed(tmp_path, monkeypatch):
+    connections = []
+
+    def connect(*args, **kwargs):
+        connections.append(sqlite3_connect(*args, **kwargs))
+        return connections[-1]
+
+    sqlite3_connect = sqlite3.connect
+    monkeypatch.setattr(sqlite3, "connect", connect)
+    cache = RewardCache(str(tmp_path / "rewards.sqlite"))
+    cache.put("example/task:latest", PATCH, 1)
+    cache.get("example/task:latest", PATCH)
+
+    assert len(connections) == 3
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):  # closed
+            conn.execute("SELECT 1")
+
+##############################################################################
+# DockerRuntime._calculate_reward
+##############################################################################
+class LocalRuntime(DockerRuntime):
+    """DockerRuntime whose commands run in a local git repository (no container)."""
+
+    def __init__(self, tmp_path, reward_cache):
+        self.repo_path = str(tmp_path / "repo")
+        self.docker_image = "example/task:latest"
+        self.reward_cache = reward_cache
+        self.max_output_len = None
+        self.swesmith = self.swebench_verified = False
+        self.logger = logging.getLogger("test")
+        self.test_runs = 0
+        subprocess.run(["git", "init", "-q", self.repo_path], check=True)
+
+    def run(self, code, timeout=60, args="", workdir=None, type=None, spill_path=None):
+        proc = subprocess.run(["/bin/sh", "-c", code], cwd=self.repo_path, stdout=subprocess.PIPE)
+        return proc.stdout.decode(errors="replace"), str(proc.returncode) if proc.returncode == 0 else "Error"
+
+    def _calculate_reward_uncached(self, get_test_output=False, timeout=300):
+        self.test_runs += 1
+        return 1.0, "1 passed"
+
+    def parse_logs(self, log_output):
+        return {}
+
+
+@pytest.fixture
+def runtime(tmp_path):
+    return LocalRuntime(tmp_path, RewardCache(str(tmp_path / "rewards.sqlite")))
+
+
+def test_reward_is_cached_per_patch(runtime):
+    (Path(runtime.repo_path) / "a.py").write_text("x = 1\n")
+    assert runtime._calculate_reward(get_test_output=True) == (1.0, "1 passed")
+    assert runtime._calculate_reward(get_test_output=True) == (1.0, "1 passed")
+    assert runtime.test_runs == 1
+
+
+def test_binary_changes_get_their_own_cache_entries(runtime):
+    data = Path(runtime.repo_path) / "data.bin"
+    data.write_bytes(b"\0\1\2" * 100)
+    runtime._calculate_reward()
+    data.write_bytes(b"\0\3\4" * 100)
+    runtime._calculate_reward()
+    assert runtime.test_runs == 2
+
+
+def test_cache_is_skipped_when_the_patch_is_unavailable(runtime):
+    shutil.rmtree(Path(runtime.repo_path) / ".git")  # git diff fails
+    runtime._calculate_reward()
+    runtime._calculate_reward()
+    assert runtime.test_runs == 2
+    assert runtime.reward_cache.to_dict()["misses"] == 0  # never looked up
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from r2egym.agenthub.run.scheduler import EpisodeScheduler, ResourceLimits
+
+
+def episode(x):
+    return x * x, os.getpid()
+
+
+def failing_episode():
+    raise ValueError("episode failed")
+
+
+@pytest.fixture
+def stopped_scheduler():
+    """A scheduler whose dispatcher has exited: episodes stay queued for `_next_episode`."""
+    scheduler = EpisodeScheduler(ResourceLimits(max_workers=1), backend="kubernetes")
+    scheduler.close()
+    return scheduler
+
+
+def drain(scheduler, count_running=False):
+    order = []
+    while True:
+        next_episode = scheduler._next_episode()
+        if next_episode is None:
+            return order
+        experiment, queued = next_episode
+        if count_running:  # admitted episodes keep running
+            scheduler._running[experiment] = scheduler._running.get(experiment, 0) + 1
+        order.append(queued.tag)
+
+
+def test_queue_order_is_priority_then_fifo(stopped_scheduler):
+    for tag, priority in [("a", 0), ("b", 2), ("c", 0), ("d", 2), ("e", 1)]:
+        stopped_scheduler.submit(episode, 1, tag=tag, priority=priority)
+
+    assert drain(stopped_scheduler) == ["b", "d", "e", "a", "c"]
+
+
+def test_experiments_get_their_weighted_share(stopped_scheduler):
+    for i in range(6):
+        stopped_scheduler.submit(episode, i, tag=f"big-{i}", experiment="big", weight=2.0)
+    for i in range(3):
+        stopped_scheduler.submit(episode, i, tag=f"small-{i}", experiment="small")
+
+    order = drain(stopped_scheduler, count_running=True)
+    # "big" has twice the weight: it gets two admissions for each one of "small"
+    assert order == ["big-0", "small-0", "big-1", "big-2", "small-1", "big-3", "big-4", "small-2", "big-5"]
+
+
+def test_episodes_run_in_worker_processes():
+    scheduler = EpisodeScheduler(ResourceLimits(max_workers=2), backend="kubernetes", poll_interval=0.1)
+    for i in range(5):
+        scheduler.submit(episode, i, tag=i)
+    scheduler.submit(failing_episode, tag="failing")
+    try:
+        results = dict(scheduler.as_completed())
+    finally:
+        scheduler.close()
+
+    assert sorted(results, key=str) == [0, 1, 2, 3, 4, "failing"]
+    assert all(results[i].result()[0] == i * i for i in range(5))
+    assert all(results[i].result()[1] != os.getpid() for i in range(5))
+    with pytest.raises(ValueError):
+        results["failing"].result()
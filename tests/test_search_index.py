@@ -0,0 +1,241 @@
+import importlib.util
+import os
+import random
+import subprocess
+import time
+
+import pytest
+
+import r2egym
+
+# the tool scripts run standalone in the container: load search.py on its own, without the
+# tools package (importing the editors rewraps sys.stdout)
+_SEARCH_PATH = os.path.join(os.path.dirname(r2egym.__file__), "agenthub", "tools", "search.py")
+_spec = importlib.util.spec_from_file_location("r2egym_search_tool", _SEARCH_PATH)
+search = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(search)
+SearchIndex, build_index = search.SearchIndex, search.build_index
+trigram_bits, trigram_hash = search.trigram_bits, search.trigram_hash
+
+
+def term_hashes(term):
+    return [trigram_hash(term[i : i + 3]) for i in range(len(term) - 2)]
+
+
+def write(path, text, age=60):
+    """Write `text` with an mtime `age` seconds ago (recent files are not indexed)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    write(repo / "pkg" / "models.py", "class Model:\n    def save(self):\n        return save_model(self)\n")
+    write(repo / "pkg" / "utils.py", "def save_model(model):\n    pass\n\n# save_model again\n")
+    write(repo / "pkg" / "notes.txt", "save_model in a text file\n")
+    write(repo / ".hidden" / "secret.py", "save_model\n")
+    write(repo / "tests" / "test_models.py", "from pkg.models import Model\n")
+    index_path = tmp_path / "index"
+    monkeypatch.setattr(search, "INDEX_PATH", str(index_path))
+    monkeypatch.chdir(repo)
+    return repo, index_path
+
+
+def run_search(capsys, term, directory, python_only=True):
+    try:
+        search.search_in_directory(term, str(directory), python_only=python_only)
+    except SystemExit:  # no matches
+        pass
+    return capsys.readouterr().out
+
+
+##############################################################################
+# trigram bit sets
+##############################################################################
+def test_trigram_bits_never_prune_a_contained_term():
+    rng = random.Random(0)
+    alphabet = "abcdefgh_(): \n"
+    for _ in range(50):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 2000)))
+        bits = trigram_bits(text)
+        for _ in range(20):
+            start = rng.randrange(len(text) - 2)
+            term = text[start : start + rng.randint(3, 20)]
+            assert SearchIndex.may_contain(bits, term_hashes(term))
+
+
+def test_trigram_bits_prune_absent_terms():
+    bits = trigram_bits("def save_model(model):\n    pass\n")
+    assert not SearchIndex.may_contain(bits, term_hashes("load_dataset"))
+    assert SearchIndex.may_contain(bits, term_hashes("ab"))  # too short to prune
+
+
+##############################################################################
+# index
+##############################################################################
+def test_build_index(repo):
+    repo, index_path = repo
+    build_index(str(repo), index_path=str(index_path))
+
+    index = SearchIndex.load(str(index_path))
+    assert sorted(os.path.relpath(path, repo) for path in index.files) == [
+        "pkg/models.py",
+        "pkg/utils.py",
+        "tests/test_models.py",
+    ]
+
+
+def test_build_index_is_incremental(repo, tmp_path):
+    repo, index_path = repo
+    other = tmp_path / "other"
+    write(other / "lib.py", "x = 1\n")
+    build_index(str(other), index_path=str(index_path))
+    build_index(str(repo), index_path=str(index_path))
+    before = SearchIndex.load(str(index_path)).files
+
+    write(repo / "pkg" / "utils.py", "def load_model(path):\n    pass\n")
+    os.remove(repo / "tests" / "test_models.py")
+    build_index(str(repo), index_path=str(index_path))
+    after = SearchIndex.load(str(index_path)).files
+
+    models, utils = str(repo / "pkg" / "models.py"), str(repo / "pkg" / "utils.py")
+    assert after[models] == before[models]
+    assert after[utils] != before[utils]
+    assert str(repo / "tests" / "test_models.py") not in after
+    assert str(other / "lib.py") in after  # other directories are kept
+
+
+def test_recently_modified_files_are_not_indexed(repo):
+    repo, index_path = repo
+    write(repo / "pkg" / "fresh.py", "save_model\n", age=0)
+    build_index(str(repo), index_path=str(index_path))
+
+    assert str(repo / "pkg" / "fresh.py") not in SearchIndex.load(str(index_path)).files
+
+
+def test_load_rejects_other_versions_and_garbage(tmp_path):
+    path = tmp_path / "index"
+    assert SearchIndex.load(str(path)) is None
+    path.write_bytes(b"not an index")
+    assert SearchIndex.load(str(path)) is None
+    SearchIndex(str(path), {"a.py": (1, 2, b"\0" * 64)}).save()
+    assert SearchIndex.load(str(path)).files == {"a.py": (1, 2, b"\0" * 64)}
+
+
+##############################################################################
+# search output
+##############################################################################
+@pytest.mark.parametrize("term", ["save_model", "Model", "pass", "nothing-matches-this"])
+@pytest.mark.parametrize("python_only", [True, False])
+def test_search_output_is_the_same_with_the_index(repo, capsys, term, python_only):
+    repo, index_path = repo
+    without_index = run_search(capsys, term, repo, python_only)
+    build_index(str(repo), index_path=str(index_path))
+    capsys.readouterr()
+    with_index = run_search(capsys, term, repo, python_only)
+
+    assert with_index == without_index
+    if term == "save_model":
+        assert "./pkg/utils.py (2 matches)" in with_index
+
+
+def test_search_sees_files_changed_after_indexing(repo, capsys):
+    repo, index_path = repo
+    build_index(str(repo), index_path=str(index_path))
+    capsys.readouterr()
+    utils = repo / "pkg" / "utils.py"
+    write(utils, "def load_dataset(path):\n    pass\n", age=30)
+
+    assert "./pkg/utils.py (1 matches)" in run_search(capsys, "load_dataset", repo)
+    # the search refreshed the stale entry
+    index = SearchIndex.load(str(index_path))
+    assert index.files[str(utils)][0] == os.stat(utils).st_mtime_ns
+
+
+##############################################################################
+# directory search
+##############################################################################
+def write_bytes(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    """An empty directory to search (without an index)."""
+    directory = tmp_path / "directory"
+    directory.mkdir()
+    monkeypatch.setattr(search, "INDEX_PATH", str(tmp_path / "index"))
+    monkeypatch.chdir(directory)
+    return directory
+
+
+@pytest.mark.parametrize(
+    "term",
+    ["save_model", "cafbar", "café", "x = 1\n"],
+)
+def test_search_matches_the_decoded_text(directory, capsys, term):
+    write_bytes(directory / "split.py", b"save\xff_model = 1\n")  # invalid UTF-8 inside the term
+    write_bytes(directory / "latin1.py", "cafébar = 'café'\n".encode("latin-1"))
+    write_bytes(directory / "utf8.py", "café = 1\n".encode())
+    write_bytes(directory / "crlf.py", b"x = 1\r\ny = 2\r\n")
+
+    # the same as decoding every file with errors="ignore" and searching its lines
+    try:
+        search.search_in_directory_old(term, str(directory))
+    except SystemExit:
+        pass
+    expected = capsys.readouterr().out
+    assert run_search(capsys, term, directory, python_only=False) == expected
+    if term == "save_model":
+        assert "./split.py (1 matches)" in expected
+
+
+def test_search_skips_gitignored_files(directory, capsys):
+    subprocess.run(["git", "init", "-q", str(directory)], check=True)
+    write_bytes(directory / ".gitignore", b"build/\n*.log.py\n")
+    for path in ["pkg/models.py", "build/lib/models.py", "pkg/debug.log.py", "untracked.py"]:
+        write_bytes(directory / path, b"save_model\n")
+    subprocess.run(["git", "-C", str(directory), "add", "pkg/models.py"], check=True)
+
+    output = run_search(capsys, "save_model", directory)
+    assert "./pkg/models.py (1 matches)" in output and "./untracked.py (1 matches)" in output
+    assert "build" not in output and "debug.log.py" not in output
+    # searching an ignored directory explicitly searches everything in it
+    assert "./build/lib/models.py (1 matches)" in run_search(capsys, "save_model", directory / "build")
+
+
+def test_search_skips_binary_files(directory, capsys):
+    write_bytes(directory / "text.py", b"save_model\n")
+    write_bytes(directory / "binary.py", b"\0\1\2 save_model\n")
+    write_bytes(directory / "late_nul.py", b"save_model\n" + b"x" * search.BINARY_SNIFF_BYTES + b"\0")
+
+    output = run_search(capsys, "save_model", directory)
+    assert "./text.py (1 matches)" in output and "./late_nul.py (1 matches)" in output
+    assert "binary.py" not in output
+
+
+def test_search_stops_after_too_many_matching_files(directory, capsys, monkeypatch):
+    num_files = 400
+    for i in range(num_files):
+        write_bytes(directory / f"module_{i:03d}.py", b"save_model\n")
+    counted = []
+
+    def count_matching_lines(text, search_term):
+        counted.append(text)
+        time.sleep(0.002)
+        return text.count(search_term)
+
+    monkeypatch.setattr(search, "count_matching_lines", count_matching_lines)
+    output = run_search(capsys, "save_model", directory)
+    assert output.startswith("More than ") and output.endswith("Please narrow your search.\n")
+    assert search.MAX_FILES_MATCHED < len(counted) < num_files
+
+    # at the limit, every file is listed
+    for i in range(search.MAX_FILES_MATCHED, num_files):
+        os.remove(directory / f"module_{i:03d}.py")
+    output = run_search(capsys, "save_model", directory)
+    assert output.count("(1 matches)") == search.MAX_FILES_MATCHED
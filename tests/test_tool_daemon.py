@@ -0,0 +1,59 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import r2egym
+
+# the daemon runs standalone in the container: load it on its own, without the tools package
+_DAEMON_PATH = os.path.join(os.path.dirname(r2egym.__file__), "agenthub", "tools", "daemon", "tool_daemon.py")
+_spec = importlib.util.spec_from_file_location("r2egym_tool_daemon", _DAEMON_PATH)
+tool_daemon = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(tool_daemon)
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(tool_daemon, "PID_PATH", str(tmp_path / "tools.pid"))
+    monkeypatch.setattr(tool_daemon, "SOCKET_PATH", str(tmp_path / "tools.sock"))
+    return tmp_path
+
+
+def sleeper(*argv):
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)", *argv])
+    deadline = time.time() + 5
+    while time.time() < deadline:  # until its command line is visible
+        with open(f"/proc/{process.pid}/cmdline", "rb") as f:
+            if f.read():
+                break
+        time.sleep(0.01)
+    return process
+
+
+@pytest.mark.parametrize("argv, killed", [((), False), (("/usr/local/bin/tool_daemon", "start"), True)])
+def test_stop_only_kills_the_daemon(paths, argv, killed):
+    process = sleeper(*argv)
+    (paths / "tools.pid").write_text(str(process.pid))
+    (paths / "tools.sock").write_text("")
+    try:
+        tool_daemon.stop()
+        try:
+            process.wait(timeout=5 if killed else 0.5)
+        except subprocess.TimeoutExpired:
+            pass
+        assert (process.poll() is not None) == killed
+    finally:
+        process.kill()
+        process.wait()
+    assert not (paths / "tools.pid").exists() and not (paths / "tools.sock").exists()
+
+
+def test_stop_ignores_its_own_and_missing_pids(paths):
+    (paths / "tools.pid").write_text(str(os.getpid()))
+    tool_daemon.stop()  # still alive
+    (paths / "tools.pid").write_text("999999999")
+    tool_daemon.stop()
+    assert not tool_daemon.is_daemon_process(999999999)
@@ -0,0 +1,117 @@
+import json
+import threading
+
+import pytest
+
+from r2egym.agenthub.utils.tracing import (
+    Tracer,
+    episode_tracer,
+    export_trace,
+    get_tracer,
+    summarize,
+    summarize_spans,
+    trace_span,
+    traced,
+    use_tracer,
+)
+
+
+def span(name, duration):
+    return {"name": name, "start": 0.0, "duration": duration, "thread": 0, "attrs": {}, "error": None}
+
+
+def test_spans_are_recorded_on_the_current_tracer_only():
+    @traced("work")
+    def work():
+        return 42
+
+    assert work() == 42  # no tracer: nothing recorded, no error
+    with use_tracer(Tracer()) as tracer:
+        work()
+        with trace_span("block", tool="search") as attrs:
+            attrs["hit"] = True
+        with pytest.raises(ValueError):
+            with trace_span("failing"):
+                raise ValueError("boom")
+    assert get_tracer() is None
+
+    spans = tracer.to_dicts()
+    assert [s["name"] for s in spans] == ["work", "block", "failing"]
+    assert spans[1]["attrs"] == {"tool": "search", "hit": True}
+    assert spans[2]["error"] == "ValueError('boom')"
+
+
+def test_episode_tracer_gives_every_call_its_own_tracer():
+    @episode_tracer
+    def episode(name):
+        with trace_span(name):
+            pass
+        return get_tracer()
+
+    results = {}
+    threads = [threading.Thread(target=lambda n=n: results.update({n: episode(n)})) for n in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results["a"] is not results["b"]
+    assert [s.name for s in results["a"].spans] == ["a"]
+    assert get_tracer() is None
+
+
+def test_summarize_spans_nearest_rank_percentiles():
+    durations = [float(i) for i in range(1, 101)]  # 1..100
+    summary = summarize_spans([[span("llm", d) for d in durations[:50]], [span("llm", d) for d in durations[50:]]])
+
+    stats = summary["llm"]
+    assert stats["count"] == 100
+    assert stats["total"] == sum(durations)
+    assert stats["mean"] == pytest.approx(50.5)
+    assert stats["p50"] == 50.0
+    assert stats["p99"] == 99.0
+    assert stats["max"] == 100.0
+
+
+def test_summarize_spans_small_samples_and_ordering():
+    summary = summarize_spans([[span("reset", 1.0), span("llm", 3.0), span("llm", 5.0)]])
+
+    assert list(summary) == ["llm", "reset"]  # by total time
+    assert summary["llm"]["p50"] == 3.0 and summary["llm"]["p99"] == 5.0
+    assert summary["reset"]["p50"] == summary["reset"]["p99"] == 1.0
+
+
+def test_summarize_experiment_jsonl(tmp_path, capsys):
+    jsonl = tmp_path / "exp.jsonl"
+    jsonl.write_text(
+        json.dumps({"spans": [span("env.action", 0.5)]}) + "\n\n" + json.dumps({"spans": []}) + "\n"
+    )
+    output_json = tmp_path / "summary.json"
+
+    summarize(str(jsonl), output_json=str(output_json))
+
+    assert json.loads(output_json.read_text())["env.action"]["count"] == 1
+    assert "env.action" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("format", ["chrome", "otlp"])
+def test_export_trace(tmp_path, format):
+    path = tmp_path / "trace" / f"episode.{format}.json"
+    spans = [dict(span("runtime.setup_env", 2.0), attrs={"cached": True}, error="Timeout()")]
+
+    export_trace(spans, str(path), format=format, name="image")
+
+    data = json.loads(path.read_text())
+    if format == "chrome":
+        event = data["traceEvents"][1]
+        assert (event["name"], event["ph"], event["dur"]) == ("runtime.setup_env", "X", 2e6)
+        assert event["args"] == {"cached": True, "error": "Timeout()"}
+    else:
+        otlp_span = data["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert int(otlp_span["endTimeUnixNano"]) - int(otlp_span["startTimeUnixNano"]) == 2 * 10**9
+        assert otlp_span["status"]["code"] == 2
+
+
+def test_export_trace_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_trace([], str(tmp_path / "trace.json"), format="xml")